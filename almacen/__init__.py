@@ -0,0 +1,34 @@
+import database
+from almacen.base import Almacen
+from almacen.sqlite import AlmacenSQLite
+from almacen.sqlserver import AlmacenSQLServer
+
+# Capa de almacenamiento: routers y servicios llaman a `almacen.<método>(cursor, ...)`
+# y el backend lo decide DB_BACKEND (o configure_pool(..., backend=...)).
+
+BACKENDS = {"sqlserver": AlmacenSQLServer, "sqlite": AlmacenSQLite}
+
+
+def crear(backend):
+    try:
+        return BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"DB_BACKEND desconocido: {backend!r} (opciones: {', '.join(BACKENDS)})") from None
+
+
+class AlmacenActual:
+    """El almacén del backend configurado; usar() lo cambia sin reimportar los routers."""
+
+    def __init__(self, backend):
+        self.usar(backend)
+
+    def usar(self, backend):
+        self._impl = crear(backend)
+
+    def __getattr__(self, nombre):
+        return getattr(self._impl, nombre)
+
+
+almacen = AlmacenActual(database.DB_BACKEND)
+
+__all__ = ["Almacen", "AlmacenSQLite", "AlmacenSQLServer", "BACKENDS", "almacen", "crear"]
@@ -0,0 +1,686 @@
+from services import paginacion
+
+# ---------------------------------------------------
+# CONTRATO DEL ALMACÉN
+# ---------------------------------------------------
+# Todo el SQL de la app vive aquí. Los routers y servicios llaman a estos
+# métodos con el cursor de su transacción (el commit / rollback sigue siendo
+# del llamador). Esta clase trae las consultas que ambos motores entienden
+# tal cual; lo propio de cada motor (OUTPUT / RETURNING, MERGE / ON CONFLICT,
+# TOP / LIMIT, tablas temporales, bloqueos) lo implementa cada subclase.
+# tests/test_almacen.py corre el mismo contrato contra las dos.
+
+
+class Almacen:
+    dialecto = None
+    AHORA = None        # fecha y hora local del servidor
+    AHORA_UTC = None
+
+    # ---------------------------------------------------
+    # PROPIO DE CADA MOTOR
+    # ---------------------------------------------------
+    def _fecha(self, valor):
+        """Valor para una columna DATE (SQL Server convierte por su cuenta)."""
+        return valor
+
+    def _hora(self, valor):
+        """Valor para una columna TIME."""
+        return valor
+
+    def _primeras(self, columnas, resto, n):
+        """SELECT de las primeras `n` filas: `resto` va desde FROM hasta ORDER BY."""
+        raise NotImplementedError
+
+    def _muchas(self, cursor, sql, filas):
+        cursor.executemany(sql, filas)
+
+    def es_duplicado(self, error):
+        """True si `error` es una violación de índice único."""
+        raise NotImplementedError
+
+    def nombres_dias(self, cursor):
+        """{isoweekday: nombre} tal como se guardan en DisponibilidadMedica.dia_semana."""
+        raise NotImplementedError
+
+    def reservar(self, cursor, id_usuario, id_medico, id_especialidad, fecha, hora, estado,
+                 validar_especialidad):
+        """Inserta la cita solo si el turno está libre; id_cita o None si no se insertó."""
+        raise NotImplementedError
+
+    def reservar_lote(self, cursor, filas, estado, estado_resumen):
+        """filas = [(idx, id_usuario, id_medico, id_especialidad, fecha, hora)] sin turnos repetidos.
+
+        Suma las insertadas al resumen diario como `estado_resumen` en una sola sentencia.
+        Devuelve ([(id_cita, id_medico, fecha, hora)] insertadas, {idx con otra especialidad}).
+        """
+        raise NotImplementedError
+
+    def borrar_cita(self, cursor, id_cita):
+        """(id_medico, fecha, hora, estado, id_usuario) de la cita borrada, o None."""
+        raise NotImplementedError
+
+    def cambiar_estado(self, cursor, id_cita, estado):
+        """[(fecha, id_medico, estado anterior, estado nuevo, id_usuario, hora)]."""
+        raise NotImplementedError
+
+    def agregar_nota(self, cursor, id_cita, nota):
+        """Marca la cita como atendida; [(fecha, id_medico, estado anterior, estado nuevo)]."""
+        raise NotImplementedError
+
+    def ajustar_resumen(self, cursor, fecha, id_medico, estado, delta):
+        raise NotImplementedError
+
+    def _contar_rol(self, cursor, rol, delta):
+        """Suma `delta` al contador de UsuariosPorRol de `rol`."""
+        raise NotImplementedError
+
+    def reclamar_eventos(self, cursor, limite, intentos, bloqueo):
+        """Bloquea `bloqueo` segundos hasta `limite` eventos pendientes; devuelve sus ids."""
+        raise NotImplementedError
+
+    # ---------------------------------------------------
+    # CATÁLOGO
+    # ---------------------------------------------------
+    def catalogo(self, cursor):
+        """(especialidades, médicos) como filas: (id, nombre) y (id, nombre, cedula, correo,
+        telefono, id_especialidad, especialidad)."""
+        cursor.execute("SELECT id_especialidad, nombre FROM Especialidades")
+        especialidades = cursor.fetchall()
+        cursor.execute("""
+            SELECT m.id_medico, m.nombre, m.cedula, m.correo, m.telefono,
+                   m.id_especialidad, e.nombre AS especialidad
+            FROM Medicos m
+            JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
+        """)
+        return especialidades, cursor.fetchall()
+
+    def crear_especialidad(self, cursor, nombre):
+        cursor.execute("INSERT INTO Especialidades (nombre) VALUES (?)", (nombre,))
+
+    # ---------------------------------------------------
+    # USUARIOS
+    # ---------------------------------------------------
+    # UsuariosPorRol se ajusta en la misma transacción que cada alta, baja o cambio
+    # de rol (alimenta /admin/estadisticas) y se reconstruye cada noche
+    def crear_usuario(self, cursor, nombre, cedula, correo, contrasena, genero, rol, contrasena2):
+        cursor.execute("""
+            INSERT INTO Usuarios (nombre, cedula, correo, contrasena, genero, rol, contrasena2)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (nombre, cedula, correo, contrasena, genero, rol, contrasena2))
+        if rol is not None:
+            self._contar_rol(cursor, rol, 1)
+
+    def perfil_usuario(self, cursor, id_usuario):
+        cursor.execute("""
+            SELECT nombre, cedula, correo, genero, rol, fecha_registro
+            FROM Usuarios
+            WHERE id_usuario = ?
+        """, (id_usuario,))
+        return cursor.fetchone()
+
+    def listar_pacientes(self, cursor, rol=None):
+        query = "SELECT id_usuario, nombre, cedula, correo, rol, fecha_registro FROM Usuarios WHERE rol = 'paciente'"
+        params = []
+        if rol:
+            query += " AND rol = ?"
+            params.append(rol)
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
+
+    def actualizar_usuario(self, cursor, id_usuario, cambios):
+        """`cambios` = {columna: valor} con columnas fijadas por el llamador; devuelve filas afectadas."""
+        anterior = self._rol(cursor, id_usuario) if "rol" in cambios else None
+        filas = self._actualizar(cursor, "Usuarios", "id_usuario", id_usuario, cambios)
+        if filas and "rol" in cambios and anterior != cambios["rol"]:
+            if anterior is not None:
+                self._contar_rol(cursor, anterior, -1)
+            if cambios["rol"] is not None:
+                self._contar_rol(cursor, cambios["rol"], 1)
+        return filas
+
+    def eliminar_usuario(self, cursor, id_usuario):
+        rol = self._rol(cursor, id_usuario)
+        cursor.execute("DELETE FROM Usuarios WHERE id_usuario = ?", (id_usuario,))
+        filas = cursor.rowcount
+        if filas and rol is not None:
+            self._contar_rol(cursor, rol, -1)
+        return filas
+
+    def _rol(self, cursor, id_usuario):
+        cursor.execute("SELECT rol FROM Usuarios WHERE id_usuario = ?", (id_usuario,))
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+    def credenciales(self, cursor, correo, rol=None):
+        """(id_usuario, nombre, correo, rol, hash de la contraseña) o None.
+
+        UX_Usuarios_correo garantiza una sola fila; si aun así hay dos (índice
+        sin crear), el login se rechaza en vez de elegir una cuenta al azar.
+        """
+        query = "SELECT id_usuario, nombre, correo, rol, contrasena FROM Usuarios WHERE correo = ?"
+        params = [correo]
+        if rol:
+            query += " AND rol = ?"
+            params.append(rol)
+        cursor.execute(query, tuple(params))
+        filas = cursor.fetchmany(2)
+        return filas[0] if len(filas) == 1 else None
+
+    def guardar_rehash(self, cursor, id_usuario, anterior, nuevo):
+        # solo si nadie cambió la contraseña mientras tanto
+        cursor.execute("""
+            UPDATE Usuarios SET contrasena = ?, contrasena2 = ?
+            WHERE id_usuario = ? AND contrasena = ?
+        """, (nuevo, nuevo, id_usuario, anterior))
+
+    def _actualizar(self, cursor, tabla, columna_id, valor_id, cambios):
+        asignaciones = ", ".join(f"{columna} = ?" for columna in cambios)
+        cursor.execute(
+            f"UPDATE {tabla} SET {asignaciones} WHERE {columna_id} = ?",
+            (*cambios.values(), valor_id),
+        )
+        return cursor.rowcount
+
+    # ---------------------------------------------------
+    # MÉDICOS
+    # ---------------------------------------------------
+    def crear_medico(self, cursor, nombre, cedula, correo, telefono, id_especialidad):
+        cursor.execute("""
+            INSERT INTO Medicos (nombre, cedula, correo, telefono, id_especialidad)
+            VALUES (?, ?, ?, ?, ?)
+        """, (nombre, cedula, correo, telefono, id_especialidad))
+
+    def correo_medico(self, cursor, id_medico):
+        cursor.execute("SELECT correo FROM Medicos WHERE id_medico = ?", (id_medico,))
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+    def usuario_de_medico(self, cursor, id_medico):
+        cursor.execute("""
+            SELECT u.id_usuario
+            FROM Usuarios u
+            JOIN Medicos m ON u.correo = m.correo
+            WHERE m.id_medico = ?
+        """, (id_medico,))
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+    def actualizar_medico(self, cursor, id_medico, cambios):
+        return self._actualizar(cursor, "Medicos", "id_medico", id_medico, cambios)
+
+    def eliminar_medico(self, cursor, id_medico):
+        cursor.execute("DELETE FROM Medicos WHERE id_medico = ?", (id_medico,))
+        return cursor.rowcount
+
+    def medico_en_especialidad(self, cursor, id_medico, id_especialidad):
+        cursor.execute(
+            "SELECT COUNT(*) FROM Medicos WHERE id_medico = ? AND id_especialidad = ?",
+            (id_medico, id_especialidad),
+        )
+        return cursor.fetchone()[0] > 0
+
+    # ---------------------------------------------------
+    # DISPONIBILIDAD
+    # ---------------------------------------------------
+    def agregar_franja(self, cursor, id_medico, dia_semana, hora_inicio, hora_fin):
+        cursor.execute("""
+            INSERT INTO DisponibilidadMedica (id_medico, dia_semana, hora_inicio, hora_fin)
+            VALUES (?, ?, ?, ?)
+        """, (id_medico, dia_semana, self._hora(hora_inicio), self._hora(hora_fin)))
+
+    def franjas_medico(self, cursor, id_medico):
+        """[(dia_semana, hora_inicio, hora_fin)] de un médico."""
+        cursor.execute("""
+            SELECT dia_semana, hora_inicio, hora_fin
+            FROM DisponibilidadMedica
+            WHERE id_medico = ?
+        """, (id_medico,))
+        return cursor.fetchall()
+
+    def franjas_semanales(self, cursor, id_medico=None):
+        """[(id_medico, dia_semana, hora_inicio, hora_fin)] de uno o de todos los médicos."""
+        query = "SELECT id_medico, dia_semana, hora_inicio, hora_fin FROM DisponibilidadMedica"
+        params = []
+        if id_medico:
+            query += " WHERE id_medico = ?"
+            params.append(id_medico)
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
+
+    def franjas_especialidad(self, cursor, id_especialidad):
+        """[(id_medico, nombre, dia_semana, hora_inicio, hora_fin)] de los médicos de la especialidad."""
+        cursor.execute("""
+            SELECT m.id_medico, m.nombre, d.dia_semana, d.hora_inicio, d.hora_fin
+            FROM Medicos m
+            JOIN DisponibilidadMedica d ON m.id_medico = d.id_medico
+            WHERE m.id_especialidad = ?
+        """, (id_especialidad,))
+        return cursor.fetchall()
+
+    def ocupacion_especialidad(self, cursor, id_especialidad, fecha):
+        """Citas (0, id_medico, hora, NULL) y excepciones (1, id_medico, inicio, fin) del día."""
+        fecha = self._fecha(fecha)
+        cursor.execute("""
+            SELECT 0, c.id_medico, c.hora, NULL
+            FROM Citas c
+            JOIN Medicos m ON c.id_medico = m.id_medico
+            WHERE m.id_especialidad = ? AND c.fecha = ?
+            UNION ALL
+            SELECT 1, x.id_medico, x.hora_inicio, x.hora_fin
+            FROM DisponibilidadExcepciones x
+            JOIN Medicos m ON x.id_medico = m.id_medico
+            WHERE m.id_especialidad = ? AND x.fecha = ?
+        """, (id_especialidad, fecha, id_especialidad, fecha))
+        return cursor.fetchall()
+
+    def horas_ocupadas(self, cursor, id_medico, fecha):
+        cursor.execute(
+            "SELECT hora FROM Citas WHERE id_medico = ? AND fecha = ?",
+            (id_medico, self._fecha(fecha)),
+        )
+        return [r[0] for r in cursor.fetchall()]
+
+    def cambiar_franjas(self, cursor, id_medico, borrar, insertar):
+        """borrar / insertar = [(dia_semana, hora_inicio, hora_fin)]."""
+        if borrar:
+            self._muchas(cursor, """
+                DELETE FROM DisponibilidadMedica
+                WHERE id_medico = ? AND dia_semana = ? AND hora_inicio = ? AND hora_fin = ?
+            """, [(id_medico, d, self._hora(i), self._hora(f)) for d, i, f in borrar])
+        if insertar:
+            self._muchas(cursor, """
+                INSERT INTO DisponibilidadMedica (id_medico, dia_semana, hora_inicio, hora_fin)
+                VALUES (?, ?, ?, ?)
+            """, [(id_medico, d, self._hora(i), self._hora(f)) for d, i, f in insertar])
+
+    def excepciones(self, cursor, id_medico, desde):
+        """[(id_excepcion, fecha, hora_inicio, hora_fin, motivo)] desde `desde`, en orden."""
+        cursor.execute("""
+            SELECT id_excepcion, fecha, hora_inicio, hora_fin, motivo
+            FROM DisponibilidadExcepciones
+            WHERE id_medico = ? AND fecha >= ?
+            ORDER BY fecha, hora_inicio
+        """, (id_medico, self._fecha(desde)))
+        return cursor.fetchall()
+
+    def cambiar_excepciones(self, cursor, id_medico, ids_borrar, insertar):
+        """insertar = [(fecha, hora_inicio | None, hora_fin | None, motivo)]."""
+        if ids_borrar:
+            cursor.execute(
+                f"DELETE FROM DisponibilidadExcepciones WHERE id_excepcion IN ({','.join('?' * len(ids_borrar))})",
+                tuple(ids_borrar),
+            )
+        if insertar:
+            self._muchas(cursor, """
+                INSERT INTO DisponibilidadExcepciones (id_medico, fecha, hora_inicio, hora_fin, motivo)
+                VALUES (?, ?, ?, ?, ?)
+            """, [
+                (id_medico, self._fecha(f), self._hora(i), self._hora(fin), m)
+                for f, i, fin, m in insertar
+            ])
+
+    def calendario(self, cursor, ids, id_especialidad, desde, hasta):
+        """(franjas, filas) para services.calendario.armar."""
+        filtros, params = [], []
+        if ids:
+            filtros.append(f"m.id_medico IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        if id_especialidad is not None:
+            filtros.append("m.id_especialidad = ?")
+            params.append(id_especialidad)
+        donde = " AND ".join(filtros)
+        rango = [self._fecha(desde), self._fecha(hasta)]
+
+        # 1. médicos y sus franjas semanales
+        cursor.execute(f"""
+            SELECT m.id_medico, m.nombre, d.dia_semana, d.hora_inicio, d.hora_fin
+            FROM Medicos m
+            LEFT JOIN DisponibilidadMedica d ON m.id_medico = d.id_medico
+            WHERE {donde}
+            ORDER BY m.id_medico
+        """, tuple(params))
+        franjas = cursor.fetchall()
+
+        # 2. citas y excepciones del rango
+        cursor.execute(f"""
+            SELECT 0, c.id_medico, c.fecha, c.hora, NULL, c.id_cita, c.estado
+            FROM Citas c
+            JOIN Medicos m ON c.id_medico = m.id_medico
+            WHERE {donde} AND c.fecha BETWEEN ? AND ?
+            UNION ALL
+            SELECT 1, x.id_medico, x.fecha, x.hora_inicio, x.hora_fin, NULL, NULL
+            FROM DisponibilidadExcepciones x
+            JOIN Medicos m ON x.id_medico = m.id_medico
+            WHERE {donde} AND x.fecha BETWEEN ? AND ?
+            ORDER BY 3, 2, 4
+        """, tuple(params + rango + params + rango))
+        return franjas, cursor.fetchall()
+
+    # ---------------------------------------------------
+    # CITAS
+    # ---------------------------------------------------
+    def cita(self, cursor, id_cita):
+        """(id_medico, id_especialidad, fecha, hora, estado, id_usuario) o None."""
+        cursor.execute("""
+            SELECT id_medico, id_especialidad, fecha, hora, estado, id_usuario
+            FROM Citas WHERE id_cita = ?
+        """, (id_cita,))
+        return cursor.fetchone()
+
+    def mover_cita(self, cursor, id_cita, id_medico, fecha, hora):
+        """Cambia el turno; el índice único rechaza un turno ya tomado (ver es_duplicado)."""
+        cursor.execute("""
+            UPDATE Citas
+            SET id_medico = ?, fecha = ?, hora = ?
+            WHERE id_cita = ?
+        """, (id_medico, self._fecha(fecha), self._hora(hora), id_cita))
+
+    def pagina_citas(self, cursor, n, token, id_medico, id_usuario, id_especialidad, desde, hasta):
+        """GET /citas: hasta `n` citas con paciente, médico y especialidad, de la más reciente."""
+        filtros, params = [], []
+        if id_medico:
+            filtros.append("c.id_medico = ?")
+            params.append(id_medico)
+        if id_usuario:
+            filtros.append("c.id_usuario = ?")
+            params.append(id_usuario)
+        if id_especialidad:
+            filtros.append("c.id_especialidad = ?")
+            params.append(id_especialidad)
+        self._rango(filtros, params, None, desde, hasta)
+        self._despues_de(filtros, params, token, descendente=True)
+
+        cursor.execute(self._primeras(
+            """c.id_cita, c.id_usuario, u.nombre AS nombre_usuario, u.correo, c.id_medico,
+               m.nombre AS medico, c.id_especialidad, e.nombre AS especialidad, c.fecha, c.hora""",
+            f"""FROM Citas c
+            LEFT JOIN Usuarios u ON c.id_usuario = u.id_usuario
+            LEFT JOIN Medicos m ON c.id_medico = m.id_medico
+            LEFT JOIN Especialidades e ON c.id_especialidad = e.id_especialidad
+            {self._donde(filtros)}
+            ORDER BY c.fecha DESC, c.hora DESC, c.id_cita DESC""",
+            n,
+        ), tuple(params))
+        return cursor.fetchall()
+
+    def pagina_citas_admin(self, cursor, n, token, estado, fecha, id_medico, id_usuario,
+                           id_especialidad, desde, hasta):
+        """GET /admin/citas: (id_cita, paciente, medico, especialidad, fecha, hora, estado)."""
+        filtros, params = self._filtros_admin(estado, fecha, id_medico, id_usuario, id_especialidad, desde, hasta)
+        self._despues_de(filtros, params, token, descendente=True)
+
+        cursor.execute(self._primeras(
+            """c.id_cita, u.nombre AS paciente, m.nombre AS medico,
+               e.nombre AS especialidad, c.fecha, c.hora, c.estado""",
+            f"""FROM Citas c
+            JOIN Usuarios u ON c.id_usuario = u.id_usuario
+            JOIN Medicos m ON c.id_medico = m.id_medico
+            JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
+            {self._donde(filtros)}
+            ORDER BY c.fecha DESC, c.hora DESC, c.id_cita DESC""",
+            n,
+        ), tuple(params))
+        return cursor.fetchall()
+
+    def consulta_exportar(self, estado, fecha, id_medico, id_usuario, id_especialidad, desde, hasta):
+        """(sql, params) de la exportación completa, para database.stream_db."""
+        filtros, params = self._filtros_admin(estado, fecha, id_medico, id_usuario, id_especialidad, desde, hasta)
+        sql = f"""
+            SELECT c.id_cita, c.fecha, c.hora, c.estado,
+                   c.id_usuario, u.nombre, u.correo,
+                   c.id_medico, m.nombre, m.id_especialidad, e.nombre
+            FROM Citas c
+            LEFT JOIN Usuarios u ON c.id_usuario = u.id_usuario
+            LEFT JOIN Medicos m ON c.id_medico = m.id_medico
+            LEFT JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
+            {self._donde(filtros)}
+            ORDER BY c.fecha, c.hora, c.id_cita
+        """
+        return sql, tuple(params)
+
+    def pagina_citas_medico(self, cursor, n, token, id_medico, desde, hasta, estado):
+        """GET /medicos/{id}/citas: (id_cita, paciente, fecha, hora, estado), de la más antigua.
+
+        id_medico + rango de fecha + keyset (fecha, hora, id_cita): búsqueda sobre el
+        índice (id_medico, fecha, hora), sin importar cuánto historial tenga.
+        """
+        filtros, params = ["c.id_medico = ?"], [id_medico]
+        self._rango(filtros, params, None, desde, hasta)
+        if estado:
+            filtros.append("c.estado = ?")
+            params.append(estado)
+        self._despues_de(filtros, params, token, descendente=False)
+
+        cursor.execute(self._primeras(
+            "c.id_cita, u.nombre AS paciente, c.fecha, c.hora, c.estado",
+            f"""FROM Citas c
+            JOIN Usuarios u ON c.id_usuario = u.id_usuario
+            {self._donde(filtros)}
+            ORDER BY c.fecha, c.hora, c.id_cita""",
+            n,
+        ), tuple(params))
+        return cursor.fetchall()
+
+    def _filtros_admin(self, estado, fecha, id_medico, id_usuario, id_especialidad, desde, hasta):
+        filtros, params = [], []
+        if estado:
+            filtros.append("c.estado = ?")
+            params.append(estado)
+        if id_medico:
+            filtros.append("c.id_medico = ?")
+            params.append(id_medico)
+        if id_usuario:
+            filtros.append("c.id_usuario = ?")
+            params.append(id_usuario)
+        if id_especialidad:
+            filtros.append("m.id_especialidad = ?")
+            params.append(id_especialidad)
+        self._rango(filtros, params, fecha, desde, hasta)
+        return filtros, params
+
+    def _rango(self, filtros, params, fecha, desde, hasta):
+        if fecha:
+            filtros.append("c.fecha = ?")
+            params.append(self._fecha(fecha))
+        if desde:
+            filtros.append("c.fecha >= ?")
+            params.append(self._fecha(desde))
+        if hasta:
+            filtros.append("c.fecha <= ?")
+            params.append(self._fecha(hasta))
+
+    def _despues_de(self, filtros, params, token, descendente):
+        # seguir después de la última cita de la página anterior; el cursor trae
+        # fecha y hora como el motor las devolvió, así que se comparan tal cual
+        condicion, valores = paginacion.keyset(["c.fecha", "c.hora", "c.id_cita"], token, descendente)
+        if condicion:
+            filtros.append(condicion)
+            params.extend(valores)
+
+    def _donde(self, filtros):
+        return "WHERE " + " AND ".join(filtros) if filtros else ""
+
+    # ---------------------------------------------------
+    # RESUMEN DIARIO Y ESTADÍSTICAS
+    # ---------------------------------------------------
+    def reconstruir_resumen(self, cursor, estado_inicial):
+        """Recalcula CitasResumenDiario y UsuariosPorRol desde Citas y Usuarios."""
+        cursor.execute("DELETE FROM CitasResumenDiario")
+        cursor.execute("""
+            INSERT INTO CitasResumenDiario (fecha, id_medico, estado, total)
+            SELECT fecha, id_medico, COALESCE(estado, ?), COUNT(*)
+            FROM Citas
+            GROUP BY fecha, id_medico, COALESCE(estado, ?)
+        """, (estado_inicial, estado_inicial))
+        cursor.execute("DELETE FROM UsuariosPorRol")
+        cursor.execute("""
+            INSERT INTO UsuariosPorRol (rol, total)
+            SELECT rol, COUNT(*) FROM Usuarios WHERE rol IS NOT NULL GROUP BY rol
+        """)
+
+    def resumen(self, cursor, desde, hasta, id_medico=None):
+        """[(fecha, id_medico, estado, total)] del resumen diario en el rango."""
+        query = "SELECT fecha, id_medico, estado, total FROM CitasResumenDiario WHERE fecha BETWEEN ? AND ?"
+        params = [self._fecha(desde), self._fecha(hasta)]
+        if id_medico:
+            query += " AND id_medico = ?"
+            params.append(id_medico)
+        cursor.execute(query, tuple(params))
+        return cursor.fetchall()
+
+    # Las estadísticas salen de CitasResumenDiario (una fila por fecha, médico y
+    # estado) y de UsuariosPorRol, nunca de Citas / Usuarios: el costo no crece
+    # con el número de citas ni de usuarios.
+    def totales(self, cursor):
+        """(pacientes, médicos, citas, atendidas, canceladas)."""
+        cursor.execute("""
+            SELECT u.pacientes, u.medicos, c.totales, c.atendidas, c.canceladas
+            FROM (
+                SELECT COALESCE(SUM(CASE WHEN rol = 'paciente' THEN total END), 0) AS pacientes,
+                       COALESCE(SUM(CASE WHEN rol = 'medico' THEN total END), 0) AS medicos
+                FROM UsuariosPorRol
+            ) u
+            CROSS JOIN (
+                SELECT COALESCE(SUM(total), 0) AS totales,
+                       COALESCE(SUM(CASE WHEN estado = 'Atendida' THEN total END), 0) AS atendidas,
+                       COALESCE(SUM(CASE WHEN estado = 'Cancelada' THEN total END), 0) AS canceladas
+                FROM CitasResumenDiario
+            ) c
+        """)
+        return cursor.fetchone()
+
+    def citas_por_especialidad(self, cursor):
+        """[(id_especialidad, nombre, estado, total)] según la especialidad actual de cada médico."""
+        cursor.execute("""
+            SELECT e.id_especialidad, e.nombre, r.estado, SUM(r.total)
+            FROM (
+                SELECT id_medico, estado, SUM(total) AS total
+                FROM CitasResumenDiario
+                GROUP BY id_medico, estado
+            ) r
+            JOIN Medicos m ON r.id_medico = m.id_medico
+            JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
+            GROUP BY e.id_especialidad, e.nombre, r.estado
+            HAVING SUM(r.total) <> 0
+        """)
+        return cursor.fetchall()
+
+    def citas_por_medico(self, cursor):
+        cursor.execute("""
+            SELECT m.id_medico, m.nombre, r.estado, r.total
+            FROM (
+                SELECT id_medico, estado, SUM(total) AS total
+                FROM CitasResumenDiario
+                GROUP BY id_medico, estado
+                HAVING SUM(total) <> 0
+            ) r
+            JOIN Medicos m ON r.id_medico = m.id_medico
+        """)
+        return cursor.fetchall()
+
+    def citas_por_dia(self, cursor, desde):
+        cursor.execute("""
+            SELECT fecha, estado, SUM(total)
+            FROM CitasResumenDiario
+            WHERE fecha >= ?
+            GROUP BY fecha, estado
+            HAVING SUM(total) <> 0
+        """, (self._fecha(desde),))
+        return cursor.fetchall()
+
+    # ---------------------------------------------------
+    # OUTBOX DE NOTIFICACIONES
+    # ---------------------------------------------------
+    def registrar_eventos(self, cursor, filas):
+        """filas = [(tipo, id_cita, id_usuario, id_medico, fecha, hora)]."""
+        cursor.executemany("""
+            INSERT INTO NotificacionesOutbox (tipo, id_cita, id_usuario, id_medico, fecha, hora)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(t, c, u, m, self._fecha(f), self._hora(h)) for t, c, u, m, f, h in filas])
+
+    def eventos(self, cursor, ids_evento):
+        """(id_evento, tipo, correo, nombre_usuario, medico, fecha, hora) de los eventos con destinatario."""
+        marcas = ",".join("?" * len(ids_evento))
+        cursor.execute(f"""
+            SELECT o.id_evento, o.tipo, u.correo, u.nombre, m.nombre, o.fecha, o.hora
+            FROM NotificacionesOutbox o
+            JOIN Usuarios u ON o.id_usuario = u.id_usuario
+            JOIN Medicos m ON o.id_medico = m.id_medico
+            WHERE o.id_evento IN ({marcas})
+            ORDER BY o.id_evento
+        """, tuple(ids_evento))
+        return cursor.fetchall()
+
+    def confirmar_eventos(self, cursor, ids_evento):
+        marcas = ",".join("?" * len(ids_evento))
+        cursor.execute(
+            f"UPDATE NotificacionesOutbox SET enviado = {self.AHORA_UTC} WHERE id_evento IN ({marcas})",
+            tuple(ids_evento),
+        )
+
+    # ---------------------------------------------------
+    # CORREOS FALLIDOS
+    # ---------------------------------------------------
+    def guardar_correos_fallidos(self, cursor, filas):
+        """filas = [(destinatario, asunto, mensaje, intentos, error, encolado)]."""
+        # pocas filas y columnas NVARCHAR(MAX): executemany simple, sin fast_executemany
+        cursor.executemany("""
+            INSERT INTO CorreosFallidos (destinatario, asunto, mensaje, intentos, error, encolado)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, filas)
+
+    def correos_fallidos(self, cursor, limite):
+        """(id_fallido, destinatario, asunto, intentos, error, encolado, descartado), los más recientes primero."""
+        cursor.execute(self._primeras(
+            "id_fallido, destinatario, asunto, intentos, error, encolado, descartado",
+            "FROM CorreosFallidos ORDER BY id_fallido DESC", limite,
+        ))
+        return cursor.fetchall()
+
+    # ---------------------------------------------------
+    # RECORDATORIOS
+    # ---------------------------------------------------
+    def recordatorios_pendientes(self, cursor, fecha):
+        """(id_cita, correo, nombre_usuario, medico, fecha, hora) de las citas sin recordatorio."""
+        cursor.execute("""
+            SELECT c.id_cita, u.correo, u.nombre, m.nombre, c.fecha, c.hora
+            FROM Citas c
+            JOIN Usuarios u ON c.id_usuario = u.id_usuario
+            JOIN Medicos m ON c.id_medico = m.id_medico
+            LEFT JOIN RecordatoriosEnviados r ON r.id_cita = c.id_cita AND r.fecha = c.fecha
+            WHERE c.fecha = ?
+              AND r.id_cita IS NULL
+              AND COALESCE(c.estado, '') <> 'Cancelada'
+              AND u.correo IS NOT NULL
+            ORDER BY c.hora, c.id_cita
+        """, (self._fecha(fecha),))
+        return cursor.fetchall()
+
+    def registrar_recordatorios(self, cursor, fecha, ids_cita):
+        fecha = self._fecha(fecha)
+        cursor.executemany("""
+            INSERT INTO RecordatoriosEnviados (id_cita, fecha)
+            SELECT ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM RecordatoriosEnviados WHERE id_cita = ? AND fecha = ?)
+        """, [(id_cita, fecha, id_cita, fecha) for id_cita in ids_cita])
+
+    # ---------------------------------------------------
+    # DUDAS Y QUEJAS
+    # ---------------------------------------------------
+    def crear_duda(self, cursor, correo, nombre, observaciones):
+        cursor.execute("""
+            INSERT INTO DudasYQuejas (correo, nombre, observaciones)
+            VALUES (?, ?, ?)
+        """, (correo, nombre, observaciones))
+
+    def listar_dudas(self, cursor):
+        cursor.execute("""
+            SELECT id_observacion, correo, nombre, observaciones
+            FROM DudasYQuejas
+            ORDER BY id_observacion DESC
+        """)
+        return cursor.fetchall()
+
+    def eliminar_duda(self, cursor, id_observacion):
+        cursor.execute("DELETE FROM DudasYQuejas WHERE id_observacion = ?", (id_observacion,))
+        return cursor.rowcount
@@ -0,0 +1,294 @@
+import re
+import sqlite3
+from datetime import date, datetime, time
+
+from almacen.base import Almacen
+
+# ---------------------------------------------------
+# SQLITE (PRUEBAS, BENCHMARKS Y DESPLIEGUES DE UNA SOLA MÁQUINA)
+# ---------------------------------------------------
+# Se activa con DB_BACKEND=sqlite (ver database.py). Fechas y horas se guardan
+# como texto ISO ('YYYY-MM-DD', 'HH:MM:SS'): _fecha / _hora normalizan lo que
+# llega de los routers para que el índice único del turno y las comparaciones
+# se comporten como las columnas DATE / TIME de SQL Server. SQLite tiene un
+# solo escritor a la vez, así que las reservas no necesitan sugerencias de
+# bloqueo; el índice único sigue siendo el respaldo final.
+
+# DATENAME(WEEKDAY, ...) de SQL Server con us_english, que es lo que guarda dia_semana
+DIAS = {1: "Monday", 2: "Tuesday", 3: "Wednesday", 4: "Thursday", 5: "Friday", 6: "Saturday", 7: "Sunday"}
+
+_HORA = re.compile(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?(?:\.\d+)?$")
+
+
+class AlmacenSQLite(Almacen):
+    dialecto = "sqlite"
+    AHORA = "datetime('now', 'localtime')"
+    AHORA_UTC = "datetime('now')"
+
+    def _fecha(self, valor):
+        if valor is None:
+            return None
+        if isinstance(valor, datetime):
+            valor = valor.date()
+        if isinstance(valor, date):
+            return valor.isoformat()
+        return date.fromisoformat(str(valor)[:10]).isoformat()
+
+    def _hora(self, valor):
+        if valor is None:
+            return None
+        if isinstance(valor, time):
+            return valor.strftime("%H:%M:%S")
+        m = _HORA.match(str(valor).strip())
+        if not m:
+            raise ValueError(f"Hora inválida: {valor!r}")
+        return f"{int(m.group(1)):02d}:{m.group(2)}:{m.group(3) or '00'}"
+
+    def _primeras(self, columnas, resto, n):
+        return f"SELECT {columnas} {resto} LIMIT {int(n)}"
+
+    def _escribir(self, cursor):
+        # leer y luego escribir dentro de una transacción que ya tiene el bloqueo de
+        # escritura: nadie cambia la fila entre el SELECT y el UPDATE
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+
+    def es_duplicado(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and "UNIQUE" in str(error)
+
+    def nombres_dias(self, cursor):
+        return dict(DIAS)
+
+    # ---------------------------------------------------
+    # CITAS
+    # ---------------------------------------------------
+    def reservar(self, cursor, id_usuario, id_medico, id_especialidad, fecha, hora, estado,
+                 validar_especialidad):
+        fecha, hora = self._fecha(fecha), self._hora(hora)
+        condicion_especialidad = ""
+        params = [id_usuario, id_medico, id_especialidad, fecha, hora, estado,
+                  id_medico, fecha, hora]
+        if validar_especialidad:
+            condicion_especialidad = """
+              AND EXISTS (SELECT 1 FROM Medicos WHERE id_medico = ? AND id_especialidad = ?)"""
+            params += [id_medico, id_especialidad]
+
+        cursor.execute(f"""
+            INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado, nota_medica)
+            SELECT ?, ?, ?, ?, ?, ?, NULL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Citas
+                WHERE id_medico = ? AND fecha = ? AND hora = ?
+            ){condicion_especialidad}
+            RETURNING id_cita
+        """, tuple(params))
+        filas = cursor.fetchall()
+        return filas[0][0] if filas else None
+
+    def reservar_lote(self, cursor, filas, estado, estado_resumen):
+        cursor.execute("DROP TABLE IF EXISTS temp.lote")
+        cursor.execute("""
+            CREATE TEMP TABLE lote (
+                idx INTEGER PRIMARY KEY,
+                id_usuario INTEGER,
+                id_medico INTEGER NOT NULL,
+                id_especialidad INTEGER NOT NULL,
+                fecha TEXT NOT NULL,
+                hora TEXT NOT NULL,
+                nueva INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.executemany(
+            "INSERT INTO lote (idx, id_usuario, id_medico, id_especialidad, fecha, hora) VALUES (?, ?, ?, ?, ?, ?)",
+            [(i, u, m, e, self._fecha(f), self._hora(h)) for i, u, m, e, f, h in filas],
+        )
+
+        # con el bloqueo de escritura tomado, marcar las que entran, insertarlas y
+        # contarlas en el resumen ven el mismo estado de Citas
+        self._escribir(cursor)
+        cursor.execute("""
+            UPDATE lote SET nueva = 1
+            WHERE EXISTS (
+                SELECT 1 FROM Medicos m
+                WHERE m.id_medico = lote.id_medico AND m.id_especialidad = lote.id_especialidad
+            )
+              AND NOT EXISTS (
+                SELECT 1 FROM Citas c
+                WHERE c.id_medico = lote.id_medico AND c.fecha = lote.fecha AND c.hora = lote.hora
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado, nota_medica)
+            SELECT id_usuario, id_medico, id_especialidad, fecha, hora, ?, NULL
+            FROM lote WHERE nueva = 1
+            RETURNING id_cita, id_medico, fecha, hora
+        """, (estado,))
+        insertadas = cursor.fetchall()
+
+        # resumen diario: un solo INSERT agrupado por (fecha, médico) para todo el lote
+        cursor.execute("""
+            INSERT INTO CitasResumenDiario (fecha, id_medico, estado, total)
+            SELECT fecha, id_medico, ?, COUNT(*) FROM lote WHERE nueva = 1 GROUP BY fecha, id_medico
+            ON CONFLICT (fecha, id_medico, estado) DO UPDATE SET total = total + excluded.total
+        """, (estado_resumen,))
+
+        cursor.execute("""
+            SELECT l.idx FROM lote l
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Medicos m
+                WHERE m.id_medico = l.id_medico AND m.id_especialidad = l.id_especialidad
+            )
+        """)
+        otra_especialidad = {r[0] for r in cursor.fetchall()}
+        cursor.execute("DROP TABLE temp.lote")
+        return insertadas, otra_especialidad
+
+    def borrar_cita(self, cursor, id_cita):
+        cursor.execute("""
+            DELETE FROM Citas
+            WHERE id_cita = ?
+            RETURNING id_medico, fecha, hora, estado, id_usuario
+        """, (id_cita,))
+        filas = cursor.fetchall()
+        return filas[0] if filas else None
+
+    def cambiar_estado(self, cursor, id_cita, estado):
+        self._escribir(cursor)
+        cursor.execute("SELECT fecha, id_medico, estado, id_usuario, hora FROM Citas WHERE id_cita = ?", (id_cita,))
+        anterior = cursor.fetchone()
+        if anterior is None:
+            return []
+        cursor.execute(
+            f"UPDATE Citas SET estado = ?, fecha_actualizacion = {self.AHORA} WHERE id_cita = ?",
+            (estado, id_cita),
+        )
+        fecha, id_medico, antes, id_usuario, hora = anterior
+        return [(fecha, id_medico, antes, estado, id_usuario, hora)]
+
+    def agregar_nota(self, cursor, id_cita, nota):
+        self._escribir(cursor)
+        cursor.execute("SELECT fecha, id_medico, estado FROM Citas WHERE id_cita = ?", (id_cita,))
+        anterior = cursor.fetchone()
+        if anterior is None:
+            return []
+        cursor.execute(f"""
+            UPDATE Citas
+            SET nota_medica = ?, estado = 'Atendida', fecha_actualizacion = {self.AHORA}
+            WHERE id_cita = ?
+        """, (nota, id_cita))
+        fecha, id_medico, antes = anterior
+        return [(fecha, id_medico, antes, "Atendida")]
+
+    # ---------------------------------------------------
+    # RESUMEN DIARIO
+    # ---------------------------------------------------
+    def ajustar_resumen(self, cursor, fecha, id_medico, estado, delta):
+        cursor.execute("""
+            INSERT INTO CitasResumenDiario (fecha, id_medico, estado, total)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (fecha, id_medico, estado) DO UPDATE SET total = total + excluded.total
+        """, (self._fecha(fecha), id_medico, estado, delta))
+
+    def _contar_rol(self, cursor, rol, delta):
+        cursor.execute("""
+            INSERT INTO UsuariosPorRol (rol, total) VALUES (?, ?)
+            ON CONFLICT (rol) DO UPDATE SET total = total + excluded.total
+        """, (rol, delta))
+
+    # ---------------------------------------------------
+    # OUTBOX
+    # ---------------------------------------------------
+    def reclamar_eventos(self, cursor, limite, intentos, bloqueo):
+        # una sola sentencia de escritura: dos relays no pueden reclamar el mismo evento
+        cursor.execute("""
+            UPDATE NotificacionesOutbox
+            SET bloqueado_hasta = datetime('now', ?), intentos = intentos + 1
+            WHERE id_evento IN (
+                SELECT id_evento FROM NotificacionesOutbox
+                WHERE enviado IS NULL
+                  AND intentos < ?
+                  AND (bloqueado_hasta IS NULL OR bloqueado_hasta < datetime('now'))
+                ORDER BY id_evento
+                LIMIT ?
+            )
+            RETURNING id_evento
+        """, (f"{int(bloqueo):+d} seconds", intentos, limite))
+        return sorted(r[0] for r in cursor.fetchall())
+
+
+# ---------------------------------------------------
+# CONEXIÓN
+# ---------------------------------------------------
+class ConexionSQLite(sqlite3.Connection):
+    """sqlite3 con la marca de dialecto que consulta schema.asegurar_esquema."""
+    dialecto = "sqlite"
+
+
+def conectar(ruta):
+    """Una conexión por cada una del pool; WAL deja leer mientras otro escribe."""
+    conn = sqlite3.connect(ruta, timeout=30, check_same_thread=False, factory=ConexionSQLite)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ---------------------------------------------------
+# ESQUEMA
+# ---------------------------------------------------
+# Tablas originales (que en SQL Server ya existen) más las de schema.DDL,
+# con los mismos índices.
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Especialidades (
+    id_especialidad INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Usuarios (
+    id_usuario INTEGER PRIMARY KEY,
+    nombre TEXT, cedula TEXT, correo TEXT, contrasena TEXT, genero TEXT, rol TEXT,
+    contrasena2 TEXT, fecha_registro TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS Medicos (
+    id_medico INTEGER PRIMARY KEY,
+    nombre TEXT, cedula TEXT, correo TEXT, telefono TEXT, id_especialidad INTEGER
+);
+CREATE TABLE IF NOT EXISTS DisponibilidadMedica (
+    id_disponibilidad INTEGER PRIMARY KEY,
+    id_medico INTEGER, dia_semana TEXT, hora_inicio TEXT, hora_fin TEXT
+);
+CREATE TABLE IF NOT EXISTS Citas (
+    id_cita INTEGER PRIMARY KEY,
+    id_usuario INTEGER, id_medico INTEGER, id_especialidad INTEGER,
+    fecha TEXT, hora TEXT, estado TEXT, nota_medica TEXT, fecha_actualizacion TEXT
+);
+CREATE TABLE IF NOT EXISTS DudasYQuejas (
+    id_observacion INTEGER PRIMARY KEY,
+    correo TEXT, nombre TEXT, observaciones TEXT,
+    fecha TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE TABLE IF NOT EXISTS CitasResumenDiario (
+    fecha TEXT NOT NULL, id_medico INTEGER NOT NULL, estado TEXT NOT NULL, total INTEGER NOT NULL,
+    PRIMARY KEY (fecha, id_medico, estado)
+);
+CREATE TABLE IF NOT EXISTS RecordatoriosEnviados (
+    id_cita INTEGER NOT NULL, fecha TEXT NOT NULL, enviado TEXT NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (id_cita, fecha)
+);
+CREATE TABLE IF NOT EXISTS NotificacionesOutbox (
+    id_evento INTEGER PRIMARY KEY,
+    tipo TEXT NOT NULL, id_cita INTEGER NOT NULL, id_usuario INTEGER NOT NULL, id_medico INTEGER NOT NULL,
+    fecha TEXT NOT NULL, hora TEXT NOT NULL, creado TEXT NOT NULL DEFAULT (datetime('now')),
+    intentos INTEGER NOT NULL DEFAULT 0, bloqueado_hasta TEXT, enviado TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_NotificacionesOutbox_pendientes
+    ON NotificacionesOutbox (id_evento) WHERE enviado IS NULL;
+CREATE TABLE IF NOT EXISTS DisponibilidadExcepciones (
+    id_excepcion INTEGER PRIMARY KEY,
+    id_medico INTEGER NOT NULL, fecha TEXT NOT NULL, hora_inicio TEXT, hora_fin TEXT, motivo TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_DisponibilidadExcepciones_medico_fecha
+    ON DisponibilidadExcepciones (id_medico, fecha);
+"""
+# aparte para las cargas masivas: construir el índice al final es mucho más rápido
+INDICES_CITAS = """
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Citas_medico_fecha_hora ON Citas (id_medico, fecha, hora);
+"""
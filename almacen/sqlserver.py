@@ -0,0 +1,189 @@
+from datetime import date
+
+from almacen.base import Almacen
+
+# ---------------------------------------------------
+# SQL SERVER (PYODBC, PRODUCCIÓN)
+# ---------------------------------------------------
+# Las reservas usan UPDLOCK + HOLDLOCK para serializar las del mismo turno;
+# el índice único UX_Citas_medico_fecha_hora (schema.py) es el respaldo final.
+
+
+class AlmacenSQLServer(Almacen):
+    dialecto = "sqlserver"
+    AHORA = "GETDATE()"
+    AHORA_UTC = "SYSUTCDATETIME()"
+
+    def _primeras(self, columnas, resto, n):
+        return f"SELECT TOP {int(n)} {columnas} {resto}"
+
+    def _muchas(self, cursor, sql, filas):
+        # una sola llamada con todos los parámetros en lugar de un round trip por fila
+        cursor.fast_executemany = True
+        cursor.executemany(sql, filas)
+
+    def es_duplicado(self, error):
+        # 2627 / 2601: violación de clave o índice único
+        texto = str(error)
+        return "2627" in texto or "2601" in texto
+
+    def nombres_dias(self, cursor):
+        # los nombres de dia_semana siguen DATENAME del servidor (idioma de la sesión):
+        # 01-07 de enero de 2024 = lunes a domingo
+        cursor.execute("""
+            SELECT v.d, DATENAME(WEEKDAY, v.d)
+            FROM (VALUES ('2024-01-01'), ('2024-01-02'), ('2024-01-03'), ('2024-01-04'),
+                         ('2024-01-05'), ('2024-01-06'), ('2024-01-07')) AS v(d)
+        """)
+        return {date.fromisoformat(str(d)[:10]).isoweekday(): nombre for d, nombre in cursor.fetchall()}
+
+    # ---------------------------------------------------
+    # CITAS
+    # ---------------------------------------------------
+    def reservar(self, cursor, id_usuario, id_medico, id_especialidad, fecha, hora, estado,
+                 validar_especialidad):
+        condicion_especialidad = ""
+        params = [id_usuario, id_medico, id_especialidad, fecha, hora, estado,
+                  id_medico, fecha, hora]
+        if validar_especialidad:
+            condicion_especialidad = """
+              AND EXISTS (SELECT 1 FROM Medicos WHERE id_medico = ? AND id_especialidad = ?)"""
+            params += [id_medico, id_especialidad]
+
+        cursor.execute(f"""
+            INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado, nota_medica)
+            OUTPUT INSERTED.id_cita
+            SELECT ?, ?, ?, ?, ?, ?, NULL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Citas WITH (UPDLOCK, HOLDLOCK)
+                WHERE id_medico = ? AND fecha = ? AND hora = ?
+            ){condicion_especialidad}
+        """, tuple(params))
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+    def reservar_lote(self, cursor, filas, estado, estado_resumen):
+        cursor.execute("""
+            IF OBJECT_ID('tempdb..#lote') IS NOT NULL DROP TABLE #lote;
+            IF OBJECT_ID('tempdb..#nuevas') IS NOT NULL DROP TABLE #nuevas;
+            CREATE TABLE #lote (
+                idx INT NOT NULL PRIMARY KEY,
+                id_usuario INT NULL,
+                id_medico INT NOT NULL,
+                id_especialidad INT NOT NULL,
+                fecha DATE NOT NULL,
+                hora TIME NOT NULL
+            );
+            CREATE TABLE #nuevas (id_medico INT NOT NULL, fecha DATE NOT NULL);
+        """)
+        self._muchas(
+            cursor,
+            "INSERT INTO #lote (idx, id_usuario, id_medico, id_especialidad, fecha, hora) VALUES (?, ?, ?, ?, ?, ?)",
+            filas,
+        )
+
+        # validación de especialidad, choque con Citas e inserción en una sola sentencia
+        cursor.execute("""
+            INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado, nota_medica)
+            OUTPUT INSERTED.id_medico, INSERTED.fecha INTO #nuevas (id_medico, fecha)
+            OUTPUT INSERTED.id_cita, INSERTED.id_medico, INSERTED.fecha, INSERTED.hora
+            SELECT l.id_usuario, l.id_medico, l.id_especialidad, l.fecha, l.hora, ?, NULL
+            FROM #lote l
+            JOIN Medicos m ON m.id_medico = l.id_medico AND m.id_especialidad = l.id_especialidad
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Citas c WITH (UPDLOCK, HOLDLOCK)
+                WHERE c.id_medico = l.id_medico AND c.fecha = l.fecha AND c.hora = l.hora
+            )
+        """, (estado,))
+        insertadas = cursor.fetchall()
+
+        # resumen diario: un solo MERGE agrupado por (fecha, médico) para todo el lote
+        cursor.execute("""
+            MERGE CitasResumenDiario WITH (HOLDLOCK) AS r
+            USING (
+                SELECT fecha, id_medico, COUNT(*) AS total FROM #nuevas GROUP BY fecha, id_medico
+            ) AS s
+            ON r.fecha = s.fecha AND r.id_medico = s.id_medico AND r.estado = ?
+            WHEN MATCHED THEN UPDATE SET total = r.total + s.total
+            WHEN NOT MATCHED THEN INSERT (fecha, id_medico, estado, total)
+                VALUES (s.fecha, s.id_medico, ?, s.total);
+        """, (estado_resumen, estado_resumen))
+
+        # solo para las que no entraron: ¿fue la especialidad o el turno?
+        cursor.execute("""
+            SELECT l.idx FROM #lote l
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Medicos m
+                WHERE m.id_medico = l.id_medico AND m.id_especialidad = l.id_especialidad
+            );
+            DROP TABLE #lote;
+            DROP TABLE #nuevas;
+        """)
+        return insertadas, {r[0] for r in cursor.fetchall()}
+
+    def borrar_cita(self, cursor, id_cita):
+        cursor.execute("""
+            DELETE FROM Citas
+            OUTPUT DELETED.id_medico, DELETED.fecha, DELETED.hora, DELETED.estado, DELETED.id_usuario
+            WHERE id_cita = ?
+        """, (id_cita,))
+        return cursor.fetchone()
+
+    def cambiar_estado(self, cursor, id_cita, estado):
+        cursor.execute("""
+            UPDATE Citas SET estado = ?, fecha_actualizacion = GETDATE()
+            OUTPUT INSERTED.fecha, INSERTED.id_medico, DELETED.estado, INSERTED.estado,
+                   INSERTED.id_usuario, INSERTED.hora
+            WHERE id_cita = ?
+        """, (estado, id_cita))
+        return cursor.fetchall()
+
+    def agregar_nota(self, cursor, id_cita, nota):
+        cursor.execute("""
+            UPDATE Citas
+            SET nota_medica = ?, estado = 'Atendida', fecha_actualizacion = GETDATE()
+            OUTPUT INSERTED.fecha, INSERTED.id_medico, DELETED.estado, INSERTED.estado
+            WHERE id_cita = ?
+        """, (nota, id_cita))
+        return cursor.fetchall()
+
+    # ---------------------------------------------------
+    # RESUMEN DIARIO
+    # ---------------------------------------------------
+    def ajustar_resumen(self, cursor, fecha, id_medico, estado, delta):
+        cursor.execute("""
+            MERGE CitasResumenDiario WITH (HOLDLOCK) AS r
+            USING (SELECT CAST(? AS DATE) AS fecha, ? AS id_medico, ? AS estado) AS s
+            ON r.fecha = s.fecha AND r.id_medico = s.id_medico AND r.estado = s.estado
+            WHEN MATCHED THEN UPDATE SET total = r.total + ?
+            WHEN NOT MATCHED THEN INSERT (fecha, id_medico, estado, total)
+                VALUES (s.fecha, s.id_medico, s.estado, ?);
+        """, (fecha, id_medico, estado, delta, delta))
+
+    def _contar_rol(self, cursor, rol, delta):
+        cursor.execute("""
+            MERGE UsuariosPorRol WITH (HOLDLOCK) AS r
+            USING (SELECT ? AS rol) AS s
+            ON r.rol = s.rol
+            WHEN MATCHED THEN UPDATE SET total = r.total + ?
+            WHEN NOT MATCHED THEN INSERT (rol, total) VALUES (s.rol, ?);
+        """, (rol, delta, delta))
+
+    # ---------------------------------------------------
+    # OUTBOX
+    # ---------------------------------------------------
+    def reclamar_eventos(self, cursor, limite, intentos, bloqueo):
+        # READPAST: varias instancias del relay se reparten los eventos sin esperarse
+        cursor.execute("""
+            WITH lote AS (
+                SELECT TOP (?) * FROM NotificacionesOutbox WITH (ROWLOCK, UPDLOCK, READPAST)
+                WHERE enviado IS NULL
+                  AND intentos < ?
+                  AND (bloqueado_hasta IS NULL OR bloqueado_hasta < SYSUTCDATETIME())
+                ORDER BY id_evento
+            )
+            UPDATE lote
+            SET bloqueado_hasta = DATEADD(SECOND, ?, SYSUTCDATETIME()), intentos = intentos + 1
+            OUTPUT INSERTED.id_evento
+        """, (limite, intentos, bloqueo))
+        return [r[0] for r in cursor.fetchall()]
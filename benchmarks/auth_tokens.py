@@ -0,0 +1,34 @@
+"""Costo por request de services.auth: verificación de JWT con caché fría y caliente.
+
+Uso: python benchmarks/auth_tokens.py [requests]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.auth import TokenCache, crear_token  # noqa: E402
+
+
+def medir(nombre, cache, tokens):
+    inicio = time.perf_counter()
+    for token in tokens:
+        cache.verificar(token)
+    total = time.perf_counter() - inicio
+    print(f"{nombre:<10} {total / len(tokens) * 1e6:8.2f} µs/request  {len(tokens) / total:>12,.0f} req/s")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    usuarios = [crear_token(i, f"Usuario {i}", f"u{i}@medicicol.site", "paciente") for i in range(1000)]
+    tokens = [usuarios[i % len(usuarios)] for i in range(n)]
+
+    # fría: sin caché, cada request decodifica y valida la firma
+    medir("fría", TokenCache(max_entradas=0), tokens)
+
+    # caliente: los tokens ya se vieron una vez
+    caliente = TokenCache()
+    for token in usuarios:
+        caliente.verificar(token)
+    medir("caliente", caliente, tokens)
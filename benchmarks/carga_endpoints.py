@@ -0,0 +1,202 @@
+"""Prueba de carga de los endpoints calientes contra la base local de reemplazo.
+
+Siembra (o reutiliza) la base SQLite de benchmarks/standin.py, trabaja sobre
+una copia para que cada corrida parta del mismo estado y maneja la app de
+FastAPI en proceso (httpx + ASGI, sin red) con clientes concurrentes. Cada
+endpoint corre su propia fase de `segundos`; el resultado es un JSON con
+p50/p95/p99 y peticiones/s por endpoint, pensado para guardarlo como línea
+base y compararlo entre commits con --comparar.
+
+Uso: python benchmarks/carga_endpoints.py [--escala 100000,500,5000000] [--clientes 32]
+         [--segundos 10] [--semilla 42] [--salida base.json] [--comparar base.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+import standin  # noqa: E402
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return None
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def escenarios(pacientes, medicos, semilla, hoy):
+    """{endpoint: fábrica(rng, n) -> (método, url, cuerpo)}; cada cliente tiene su propio rng."""
+    especialidades = min(20, medicos)
+    contador = iter(range(10**9))
+
+    def login(rng, _):
+        # un grupo acotado de usuarios: mezcla logins repetidos (caché de hash) y nuevos
+        i = rng.randint(1, min(pacientes, 500))
+        return "POST", "/usuarios/login", {"correo": f"paciente{i}@bench.test", "contrasena": standin.CONTRASENA}
+
+    def disponibles(rng, _):
+        fecha = hoy + timedelta(days=rng.randint(0, 60))
+        return "GET", f"/citas/disponibles/{rng.randint(1, especialidades)}?fecha={fecha}", None
+
+    def crear_cita(rng, _):
+        # turnos nuevos, posteriores a la siembra: cada petición reserva uno distinto
+        n = next(contador)
+        m = n % medicos + 1
+        dia = hoy + timedelta(days=400 + n // (medicos * 96))
+        minutos = (n // medicos) % 96 * 5
+        return "POST", "/citas/citas", {
+            "id_usuario": rng.randint(1, pacientes), "id_medico": m,
+            "id_especialidad": (m - 1) % especialidades + 1,
+            "fecha": dia.isoformat(), "hora": f"{8 + minutos // 60:02d}:{minutos % 60:02d}",
+        }
+
+    def admin_citas(rng, _):
+        variante = rng.randint(0, 2)
+        if variante == 0:
+            return "GET", "/admin/citas?limit=50", None
+        if variante == 1:
+            return "GET", f"/admin/citas?id_medico={rng.randint(1, medicos)}&limit=50", None
+        desde = hoy - timedelta(days=rng.randint(0, 300))
+        return "GET", f"/admin/citas?estado=Cancelada&desde={desde}&hasta={desde + timedelta(days=7)}", None
+
+    def estadisticas(rng, _):
+        return "GET", "/admin/estadisticas" + ("?detalle=true" if rng.random() < 0.5 else ""), None
+
+    return {
+        "POST /usuarios/login": login,
+        "GET /citas/disponibles/{id}": disponibles,
+        "POST /citas/citas": crear_cita,
+        "GET /admin/citas": admin_citas,
+        "GET /admin/estadisticas": estadisticas,
+    }
+
+
+async def fase(cliente, fabrica, clientes, segundos, semilla):
+    latencias = []
+    errores = {}
+    fin = time.perf_counter() + segundos
+
+    async def trabajador(k):
+        rng = random.Random(semilla * 1000 + k)
+        n = 0
+        while time.perf_counter() < fin:
+            metodo, url, cuerpo = fabrica(rng, n)
+            n += 1
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo, url, json=cuerpo)
+            latencias.append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 400:
+                errores[respuesta.status_code] = errores.get(respuesta.status_code, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador(k) for k in range(clientes)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "peticiones": len(latencias),
+        "errores": errores,
+        "rps": round(len(latencias) / duracion, 1),
+        "p50_ms": round(_percentil(latencias, 50) * 1000, 2) if latencias else None,
+        "p95_ms": round(_percentil(latencias, 95) * 1000, 2) if latencias else None,
+        "p99_ms": round(_percentil(latencias, 99) * 1000, 2) if latencias else None,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def comparar(actual, base):
+    print(f"\n{'endpoint':<30}{'rps':>10}{'Δ':>9}{'p95 ms':>10}{'Δ':>9}", file=sys.stderr)
+    for nombre, r in actual["resultados"].items():
+        b = base["resultados"].get(nombre)
+        if not b or not r["p95_ms"] or not b["p95_ms"]:
+            continue
+        d_rps = (r["rps"] / b["rps"] - 1) * 100 if b["rps"] else 0
+        d_p95 = (r["p95_ms"] / b["p95_ms"] - 1) * 100
+        print(f"{nombre:<30}{r['rps']:>10}{d_rps:>+8.0f}%{r['p95_ms']:>10}{d_p95:>+8.0f}%", file=sys.stderr)
+
+
+async def main(args):
+    pacientes, medicos, citas = (int(x) for x in args.escala.split(","))
+    semilla_base = standin.asegurar(pacientes, medicos, citas, args.semilla)
+
+    directorio = tempfile.mkdtemp(prefix="medicicol-bench-")
+    ruta = os.path.join(directorio, "bench.db")
+    shutil.copyfile(semilla_base, ruta)
+
+    import database
+    database.configure_pool(lambda: standin.conectar(ruta), backend="sqlite")
+    from main import app
+    from services.auth import crear_token
+
+    hoy = date(2026, 1, 1)   # mismo "hoy" que la siembra
+    resultado = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "escala": {"pacientes": pacientes, "medicos": medicos, "citas": citas, "semilla": args.semilla},
+        "clientes": args.clientes,
+        "segundos_por_endpoint": args.segundos,
+        "resultados": {},
+    }
+    transporte = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as cliente:
+            for nombre, fabrica in escenarios(pacientes, medicos, args.semilla, hoy).items():
+                if args.solo and args.solo not in nombre:
+                    continue
+                print(f"{nombre} ...", file=sys.stderr)
+                # las rutas /admin piden sesión de admin; la fase de login deja la de un paciente
+                cliente.cookies.clear()
+                cliente.cookies.set("access_token", crear_token(0, "Admin", "admin@bench.test", "admin"))
+                resultado["resultados"][nombre] = await fase(
+                    cliente, fabrica, args.clientes, args.segundos, args.semilla
+                )
+    finally:
+        database.executor.shutdown()
+        database.pool.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    print(texto)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultado, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--escala", default="100000,500,5000000", help="pacientes,medicos,citas")
+    parser.add_argument("--clientes", type=int, default=32)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--solo", help="correr solo los endpoints que contengan este texto")
+    parser.add_argument("--salida", help="guardar el JSON en este archivo")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para mostrar diferencias")
+    asyncio.run(main(parser.parse_args()))
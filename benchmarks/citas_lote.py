@@ -0,0 +1,145 @@
+"""POST /citas/lote frente a POST /citas/citas cita por cita.
+
+Crea N citas para el primer médico de la base local de reemplazo
+(benchmarks/standin.py) en una fecha lejana, primero una por una (lo que
+hacía el frontend en una campaña) y luego en un solo lote, y muestra tiempo,
+citas/s y round trips. Cada modo corre sobre su propia copia de la base
+sembrada, que se borra al terminar: nunca toca la base del .env.
+
+Uso: python benchmarks/citas_lote.py [citas] [fecha] [--escala 5000,100,200000] [--semilla 42]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import standin  # noqa: E402
+
+import database  # noqa: E402
+from routers import citas as rutas  # noqa: E402
+
+
+class Contador:
+    """Envuelve la conexión prestada y cuenta execute / executemany."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.round_trips = 0
+
+    def cursor(self):
+        contador = self
+        cursor = self._conn.cursor()
+
+        class Cursor:
+            def execute(self, *args):
+                contador.round_trips += 1
+                return cursor.execute(*args)
+
+            def executemany(self, *args):
+                contador.round_trips += 1
+                return cursor.executemany(*args)
+
+            def __getattr__(self, nombre):
+                return getattr(cursor, nombre)
+
+            def __setattr__(self, nombre, valor):
+                setattr(cursor, nombre, valor)
+
+        return Cursor()
+
+    def commit(self):
+        self.round_trips += 1
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+
+def _contando(fn):
+    def envuelta(conn, *args):
+        contado = Contador(conn)
+        resultado = fn(contado, *args)
+        return resultado, contado.round_trips
+    return envuelta
+
+
+def turnos(id_medico, id_especialidad, n, fecha):
+    # turnos de 5 minutos repartidos en días consecutivos desde `fecha`
+    por_dia = 24 * 12
+    dia0 = date.fromisoformat(fecha)
+    return [
+        (None, id_medico, id_especialidad,
+         (dia0 + timedelta(days=i // por_dia)).isoformat(),
+         f"{(i % por_dia) * 5 // 60:02d}:{(i % por_dia) * 5 % 60:02d}")
+        for i in range(n)
+    ]
+
+
+async def una_por_una(citas):
+    # como POST /citas/citas
+    round_trips = 0
+    for id_usuario, m, e, f, h in citas:
+        data = rutas.CitaCreate(id_usuario=id_usuario, id_medico=m, id_especialidad=e, fecha=f, hora=h)
+        _, rt = await database.run_db(_contando(rutas._crear_cita), data)
+        round_trips += rt
+    return len(citas), round_trips
+
+
+async def lote(citas):
+    # como POST /citas/lote
+    resultados, round_trips = await database.run_db(_contando(rutas._crear_citas_lote), citas, False)
+    return sum(1 for r in resultados if isinstance(r, int)), round_trips
+
+
+def medir(nombre, modo, citas, semilla_base, directorio):
+    # copia nueva por modo: los dos parten de la misma base y no hay nada que limpiar
+    ruta = os.path.join(directorio, f"{modo.__name__}.db")
+    shutil.copyfile(semilla_base, ruta)
+    database.configure_pool(lambda: standin.conectar(ruta), backend="sqlite")
+    try:
+        inicio = time.perf_counter()
+        creadas, round_trips = asyncio.run(modo(citas))
+        segundos = time.perf_counter() - inicio
+    finally:
+        database.pool.dispose()
+    n = len(citas)
+    print(f"{nombre:<14}{segundos:>8.2f} s{n / segundos:>10,.0f} citas/s{round_trips:>8} round trips"
+          f"  (creadas={creadas})")
+
+
+def main(args):
+    pacientes, medicos, total = (int(x) for x in args.escala.split(","))
+    semilla_base = standin.asegurar(pacientes, medicos, total, args.semilla)
+    conn = sqlite3.connect(semilla_base)
+    id_medico, id_especialidad = conn.execute(
+        "SELECT id_medico, id_especialidad FROM Medicos ORDER BY id_medico LIMIT 1"
+    ).fetchone()
+    conn.close()
+
+    citas = turnos(id_medico, id_especialidad, args.citas, args.fecha)
+    print(f"médico={id_medico} citas={args.citas} días={len({c[3] for c in citas})}")
+
+    directorio = tempfile.mkdtemp(prefix="medicicol-lote-")
+    try:
+        medir("una por una", una_por_una, citas, semilla_base, directorio)
+        medir("lote", lote, citas, semilla_base, directorio)
+    finally:
+        database.executor.shutdown()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("citas", type=int, nargs="?", default=2000)
+    parser.add_argument("fecha", nargs="?", default="2099-02-01")
+    parser.add_argument("--escala", default="5000,100,200000", help="pacientes,medicos,citas")
+    parser.add_argument("--semilla", type=int, default=42)
+    main(parser.parse_args())
@@ -0,0 +1,99 @@
+"""Correos por segundo de services.correo contra un SMTP local (aiosmtpd).
+
+Compara una sesión SMTP nueva por correo (lo que hacía cada endpoint con
+FastMail) con el despachador de sesiones persistentes, y simula un servidor
+que rechaza los primeros intentos para ejercitar reintentos y `fallidos`.
+
+Requiere aiosmtpd (pip install aiosmtpd), solo para esta prueba.
+Uso: python benchmarks/correo_smtp.py [correos] [trabajadores]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosmtplib  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+
+from services import correo  # noqa: E402
+
+PUERTO = 8025
+
+
+class Buzon:
+    """Handler de aiosmtpd que guarda los mensajes y puede fallar a propósito."""
+
+    def __init__(self, rechazar=0):
+        self.recibidos = 0
+        self.rechazar = rechazar
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.rechazar > 0:
+            self.rechazar -= 1
+            return "451 Intenta más tarde"
+        self.recibidos += 1
+        return "250 OK"
+
+
+def mensajes(n):
+    return [correo.crear_mensaje(f"Prueba {i}", [f"paciente{i}@example.com"], "Hola") for i in range(n)]
+
+
+async def sin_sesion(n):
+    inicio = time.perf_counter()
+    for mensaje in mensajes(n):
+        await aiosmtplib.send(mensaje, hostname="127.0.0.1", port=PUERTO)
+    return n / (time.perf_counter() - inicio)
+
+
+async def sin_guardar(envios):
+    pass   # sin base de datos: los descartados solo se cuentan
+
+
+async def con_despachador(buzon, n, trabajadores, **opciones):
+    despachador = correo.MailDispatcher(
+        hostname="127.0.0.1", port=PUERTO, username="", password="",
+        start_tls=False, use_tls=False, trabajadores=trabajadores, guardar=sin_guardar, **opciones,
+    )
+    despachador.iniciar()
+    lote = mensajes(n)
+    inicio = time.perf_counter()
+    for mensaje in lote:
+        despachador.encolar(mensaje)
+    encolado = time.perf_counter() - inicio
+
+    while buzon.recibidos + despachador.metrics()["fallidos"] < n:
+        await asyncio.sleep(0.01)
+    total = time.perf_counter() - inicio
+    await despachador.detener()
+    return n / total, encolado / n * 1e6, despachador.metrics()
+
+
+async def main(n, trabajadores):
+    buzon = Buzon()
+    controlador = Controller(buzon, hostname="127.0.0.1", port=PUERTO)
+    controlador.start()
+    try:
+        print(f"correos={n} trabajadores={trabajadores}")
+        print(f"una sesión por correo : {await sin_sesion(n):>10,.1f} correos/s")
+        buzon.recibidos = 0
+
+        cps, us, m = await con_despachador(buzon, n, trabajadores)
+        print(f"despachador           : {cps:>10,.1f} correos/s  "
+              f"(encolar {us:.1f} us, sesiones={m['sesiones']}, lotes={m['lotes']})")
+
+        # el servidor rechaza los primeros envíos: deben reintentarse y llegar
+        buzon.recibidos, buzon.rechazar = 0, 10
+        cps, _, m = await con_despachador(buzon, n, trabajadores, backoff=0.05)
+        print(f"con 10 rechazos       : {cps:>10,.1f} correos/s  "
+              f"(reintentos={m['reintentos']}, fallidos={m['fallidos']}, recibidos={buzon.recibidos})")
+    finally:
+        controlador.stop()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    trabajadores = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    asyncio.run(main(n, trabajadores))
@@ -0,0 +1,63 @@
+"""Logins por segundo de services.hashing con distintos costos de KDF.
+
+Mide verificaciones concurrentes a través del HashService (pool de hilos con
+tope de concurrencia) y la ruta rápida de logins repetidos.
+
+Uso: python benchmarks/hashing_logins.py [concurrencia] [logins]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import hashing  # noqa: E402
+
+COSTOS = [
+    ("sha256 (legado)", "sha256", {}),
+    ("pbkdf2 100k", "pbkdf2_sha256", {"iteraciones": 100_000}),
+    ("pbkdf2 300k", "pbkdf2_sha256", {"iteraciones": 300_000}),
+    ("pbkdf2 600k", "pbkdf2_sha256", {"iteraciones": 600_000}),
+    ("scrypt n=2^14", "scrypt", {"n": 2 ** 14, "r": 8, "p": 1}),
+    ("scrypt n=2^15", "scrypt", {"n": 2 ** 15, "r": 8, "p": 1}),
+]
+
+
+async def medir(servicio, almacenado, concurrencia, logins):
+    sem = asyncio.Semaphore(concurrencia)
+
+    async def uno():
+        async with sem:
+            valida, _ = await servicio.verificar("contraseña-segura", almacenado)
+            assert valida
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(uno() for _ in range(logins)))
+    return logins / (time.perf_counter() - inicio)
+
+
+async def main(concurrencia, logins):
+    print(f"workers={hashing.HASH_WORKERS} concurrencia={concurrencia} logins={logins}")
+    print(f"{'costo':<18}{'frío (logins/s)':>18}{'repetido (logins/s)':>22}")
+    for nombre, algoritmo, params in COSTOS:
+        almacenado = hashing.hash_password("contraseña-segura", algoritmo, **params)
+
+        # frío: sin caché, cada login paga el KDF completo
+        frio = hashing.HashService(cache_max=0)
+        frio_lps = await medir(frio, almacenado, concurrencia, logins)
+        frio.shutdown()
+
+        # repetido: el mismo usuario vuelve a entrar dentro del TTL
+        caliente = hashing.HashService()
+        await caliente.verificar("contraseña-segura", almacenado)
+        caliente_lps = await medir(caliente, almacenado, concurrencia, logins)
+        caliente.shutdown()
+
+        print(f"{nombre:<18}{frio_lps:>18,.1f}{caliente_lps:>22,.1f}")
+
+
+if __name__ == "__main__":
+    concurrencia = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    logins = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    asyncio.run(main(concurrencia, logins))
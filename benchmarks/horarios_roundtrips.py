@@ -0,0 +1,119 @@
+"""Round trips de /citas/disponibles/{id_especialidad}: algoritmo anterior vs. la ruta actual.
+
+La ruta actual es routers.citas._cargar_agenda (indice.agenda): en frío hace
+las consultas de días, franjas y ocupación; en caliente responde desde el
+índice en memoria sin tocar la BD.
+
+Uso: python benchmarks/horarios_roundtrips.py [medicos] [horas_turno]
+"""
+import os
+import sys
+import time as reloj
+from datetime import datetime, time, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routers import citas  # noqa: E402
+from services import horarios  # noqa: E402
+from services.indice_disponibilidad import indice  # noqa: E402
+
+DIAS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+class CursorContador:
+    """Cursor falso que responde las consultas del endpoint y cuenta cada execute()."""
+
+    def __init__(self, medicos, horas_turno):
+        self.medicos = medicos
+        self.horas_turno = horas_turno
+        self.round_trips = 0
+        self._filas = []
+
+    def execute(self, sql, *params):
+        self.round_trips += 1
+        sql = " ".join(sql.split())
+        if "DATENAME(WEEKDAY, v.d)" in sql:
+            self._filas = [(f"2024-01-0{d}", DIAS[d - 1]) for d in range(1, 8)]
+        elif "d.dia_semana, d.hora_inicio" in sql:
+            # franjas de toda la semana (la ruta actual filtra el día en Python)
+            self._filas = [
+                (m, f"Médico {m}", dia, time(7, 0), time(7 + self.horas_turno, 0))
+                for m in range(1, self.medicos + 1) for dia in DIAS[:5]
+            ]
+        elif "UNION ALL" in sql:
+            self._filas = [(0, m, time(9, 0), None) for m in range(1, self.medicos + 1, 2)]
+        elif "JOIN DisponibilidadMedica" in sql:
+            self._filas = [
+                (m, f"Médico {m}", time(7, 0), time(7 + self.horas_turno, 0))
+                for m in range(1, self.medicos + 1)
+            ]
+        elif sql.startswith("SELECT DATEADD"):
+            hora = params[0]
+            self._filas = [((datetime.combine(datetime.min, hora) + timedelta(hours=1)).time(),)]
+        else:
+            self._filas = [(time(9, 0),)] if (params[0][0] % 2) else []
+
+    def fetchall(self):
+        return self._filas
+
+    def fetchone(self):
+        return self._filas[0]
+
+
+class ConexionContador:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+def algoritmo_anterior(cursor, id_especialidad, fecha):
+    cursor.execute("""
+        SELECT m.id_medico, m.nombre, d.hora_inicio, d.hora_fin
+        FROM Medicos m
+        JOIN DisponibilidadMedica d ON m.id_medico = d.id_medico
+        WHERE m.id_especialidad = ?
+          AND DATENAME(WEEKDAY, ?) = d.dia_semana
+    """, (id_especialidad, fecha))
+    resultados = []
+    for medico_id, nombre, inicio, fin in cursor.fetchall():
+        cursor.execute("SELECT hora FROM Citas WHERE id_medico=? AND fecha=?", (medico_id, fecha))
+        horas_ocupadas = {str(r[0]) for r in cursor.fetchall()}
+        hora_actual = inicio
+        while hora_actual < fin:
+            if str(hora_actual) not in horas_ocupadas:
+                resultados.append((medico_id, str(hora_actual)))
+            cursor.execute("SELECT DATEADD(hour, 1, ?)", hora_actual)
+            hora_actual = cursor.fetchone()[0]
+    return resultados
+
+
+def algoritmo_actual(cursor, id_especialidad, fecha):
+    # lo mismo que hace el endpoint: índice en memoria y, si falta, run_db(_cargar_agenda)
+    agenda = indice.agenda_en_memoria(id_especialidad, fecha)
+    if agenda is None:
+        agenda = citas._cargar_agenda(ConexionContador(cursor), id_especialidad, fecha)
+    disponibilidad, ocupadas = agenda
+    return horarios.generar_slots(disponibilidad, ocupadas, fecha, 60)
+
+
+def medir(nombre, fn, cursor):
+    inicio = reloj.perf_counter()
+    antes = cursor.round_trips
+    slots = fn(cursor, 1, "2025-03-10")
+    duracion = (reloj.perf_counter() - inicio) * 1000
+    print(f"{nombre:<18} round trips={cursor.round_trips - antes:>5}  slots={len(slots):>5}  python={duracion:.2f} ms")
+    return slots
+
+
+if __name__ == "__main__":
+    medicos = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    horas_turno = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"Especialidad con {medicos} médicos y turnos de {horas_turno} h")
+    anterior = medir("anterior", algoritmo_anterior, CursorContador(medicos, horas_turno))
+    indice.limpiar()
+    cursor = CursorContador(medicos, horas_turno)
+    frio = medir("actual (frío)", algoritmo_actual, cursor)
+    caliente = medir("actual (caliente)", algoritmo_actual, cursor)
+    assert len(anterior) == len(frio) == len(caliente), "los algoritmos deben ofrecer los mismos turnos"
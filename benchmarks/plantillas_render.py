@@ -0,0 +1,64 @@
+"""Costo de armar correos en lote: f-string + EmailMessage vs. services.plantillas.
+
+Renderiza N recordatorios (texto + HTML) y arma el mensaje MIME de cada uno.
+
+Uso: python benchmarks/plantillas_render.py [mensajes]
+"""
+import os
+import sys
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import correo  # noqa: E402
+from services.plantillas import Plantillas  # noqa: E402
+
+
+def datos(i):
+    return {"nombre_usuario": f"Paciente {i}", "medico": f"Médico {i % 40}",
+            "fecha": "2026-10-18", "hora": f"{8 + i % 10:02d}:00"}
+
+
+def anterior(i):
+    # lo que hacía cada endpoint: f-string indentada y EmailMessage (política moderna)
+    d = datos(i)
+    mensaje = EmailMessage()
+    mensaje["From"] = correo.REMITENTE
+    mensaje["To"] = f"paciente{i}@example.com"
+    mensaje["Subject"] = "⏰ Recordatorio de cita médica - MediciCol"
+    mensaje.set_content(f"""
+        Hola {d['nombre_usuario']},
+
+        Este es un recordatorio de tu cita médica:
+        🩺 Médico: {d['medico']}
+        📅 Fecha: {d['fecha']}
+        ⏰ Hora: {d['hora']}
+
+        ¡No faltes! Recuerda llegar unos minutos antes.
+        """)
+    return mensaje
+
+
+def medir(nombre, fn, n):
+    inicio = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    segundos = time.perf_counter() - inicio
+    print(f"{nombre:<38}{segundos:>8.3f} s{n / segundos:>12,.0f} msg/s{segundos / n * 1e6:>10.1f} us/msg")
+
+
+def main(n):
+    inicio = time.perf_counter()
+    plantillas = Plantillas().cargar()
+    print(f"compilación de plantillas: {(time.perf_counter() - inicio) * 1e3:.1f} ms (una vez)")
+    print(f"mensajes={n}")
+
+    medir("f-string + EmailMessage (texto)", anterior, n)
+    medir("plantillas: solo render (txt+html)", lambda i: plantillas.render("recordatorio", **datos(i)), n)
+    medir("plantillas: render + MIME (txt+html)",
+          lambda i: plantillas.mensaje("recordatorio", [f"paciente{i}@example.com"], **datos(i)), n)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
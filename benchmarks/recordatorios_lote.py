@@ -0,0 +1,84 @@
+"""Lote de recordatorios de services.recordatorios contra SQLite y un SMTP local.
+
+Siembra N citas para mañana, corre el lote dos veces y muestra el informe:
+la segunda corrida no debe enviar nada (RecordatoriosEnviados evita duplicados).
+
+Requiere aiosmtpd (pip install aiosmtpd), solo para esta prueba.
+Uso: python benchmarks/recordatorios_lote.py [citas] [concurrencia]
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller  # noqa: E402
+
+import database  # noqa: E402
+from services import correo, recordatorios  # noqa: E402
+
+PUERTO = 8026
+
+
+class Buzon:
+    def __init__(self):
+        self.recibidos = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.recibidos += 1
+        return "250 OK"
+
+
+def sembrar(ruta, citas, fecha):
+    conn = sqlite3.connect(ruta)
+    conn.executescript("""
+        CREATE TABLE Usuarios (id_usuario INTEGER PRIMARY KEY, nombre TEXT, correo TEXT);
+        CREATE TABLE Medicos (id_medico INTEGER PRIMARY KEY, nombre TEXT);
+        CREATE TABLE Citas (id_cita INTEGER PRIMARY KEY, id_usuario INT, id_medico INT,
+                            fecha TEXT, hora TEXT, estado TEXT);
+        CREATE TABLE RecordatoriosEnviados (id_cita INT, fecha TEXT, PRIMARY KEY (id_cita, fecha));
+    """)
+    conn.executemany("INSERT INTO Usuarios VALUES (?, ?, ?)",
+                     [(i, f"Paciente {i}", f"paciente{i}@example.com") for i in range(1, citas + 1)])
+    conn.executemany("INSERT INTO Medicos VALUES (?, ?)", [(i, f"Médico {i}") for i in range(1, 11)])
+    conn.executemany("INSERT INTO Citas VALUES (?, ?, ?, ?, ?, ?)", [
+        (i, i, i % 10 + 1, fecha.isoformat(), f"{8 + i % 10:02d}:00",
+         "Cancelada" if i % 20 == 0 else None)
+        for i in range(1, citas + 1)
+    ])
+    conn.commit()
+    conn.close()
+
+
+async def main(citas, concurrencia):
+    fecha = date.today() + timedelta(days=1)
+    ruta = os.path.join(tempfile.mkdtemp(), "recordatorios.db")
+    sembrar(ruta, citas, fecha)
+    database.configure_pool(lambda: sqlite3.connect(ruta, check_same_thread=False), backend="sqlite",
+                            ping_query="SELECT 1")
+
+    buzon = Buzon()
+    controlador = Controller(buzon, hostname="127.0.0.1", port=PUERTO)
+    controlador.start()
+    despachador = correo.MailDispatcher(hostname="127.0.0.1", port=PUERTO, username="", password="",
+                                        start_tls=False, use_tls=False)
+    try:
+        for corrida in (1, 2):
+            informe = await recordatorios.enviar_lote(fecha, concurrencia, despachador)
+            informe.pop("ids_fallidos")
+            print(f"corrida {corrida}: {informe}")
+        print(f"recibidos por el servidor: {buzon.recibidos}")
+    finally:
+        await despachador.detener()
+        controlador.stop()
+        database.pool.dispose()
+        database.executor.shutdown()
+
+
+if __name__ == "__main__":
+    citas = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    concurrencia = int(sys.argv[2]) if len(sys.argv) > 2 else recordatorios.RECORDATORIOS_CONCURRENCIA
+    asyncio.run(main(citas, concurrencia))
@@ -0,0 +1,156 @@
+"""Base local de reemplazo para los benchmarks: SQLite con el almacén de almacen/sqlite.py.
+
+Crea el esquema que usan los routers (las migraciones de schema.py) y lo siembra
+con volúmenes realistas; las conexiones son las mismas que usa la app con
+DB_BACKEND=sqlite.
+
+La siembra es determinista (semilla fija) y se guarda en benchmarks/.datos/,
+así que dos corridas con la misma escala parten de la misma base.
+
+Uso: python benchmarks/standin.py [pacientes] [medicos] [citas] [semilla]
+"""
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schema  # noqa: E402
+from almacen.sqlite import DIAS, ESQUEMA, conectar  # noqa: E402,F401
+
+DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".datos")
+
+CONTRASENA = "clave-benchmark"
+
+
+# ---------------------------------------------------
+# SIEMBRA
+# ---------------------------------------------------
+def ruta_datos(pacientes, medicos, citas, semilla):
+    return os.path.join(DATOS, f"standin-{pacientes}-{medicos}-{citas}-{semilla}.db")
+
+
+def sembrar(ruta, pacientes=100_000, medicos=500, citas=5_000_000, semilla=42,
+            especialidades=20, hoy=None):
+    """Crea la base en `ruta`; citas repartidas en días alrededor de `hoy` (un año atrás, uno adelante)."""
+    from services import hashing   # hash real del algoritmo configurado, calculado una sola vez
+
+    rng = random.Random(semilla)
+    hoy = hoy or date(2026, 1, 1)   # fijo para que la base no dependa del día en que se siembra
+    inicio = time.perf_counter()
+
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = ruta + ".tmp"
+    if os.path.exists(temporal):
+        os.remove(temporal)
+    conn = sqlite3.connect(temporal)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(ESQUEMA)
+
+    conn.executemany(
+        "INSERT INTO Especialidades (id_especialidad, nombre) VALUES (?, ?)",
+        [(i, f"Especialidad {i}") for i in range(1, especialidades + 1)],
+    )
+
+    hash_comun = hashing.hash_password(CONTRASENA)
+    conn.executemany(
+        "INSERT INTO Usuarios (id_usuario, nombre, cedula, correo, contrasena, genero, rol, contrasena2, fecha_registro)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"Paciente {i}", str(10_000_000 + i), f"paciente{i}@bench.test", hash_comun,
+             rng.choice("HM"), "paciente", hash_comun, "2025-01-01 00:00:00")
+            for i in range(1, pacientes + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO Usuarios (id_usuario, nombre, cedula, correo, contrasena, genero, rol, contrasena2, fecha_registro)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (pacientes + i, f"Médico {i}", str(90_000_000 + i), f"medico{i}@bench.test", hash_comun,
+             "H", "medico", hash_comun, "2025-01-01 00:00:00")
+            for i in range(1, medicos + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO Medicos (id_medico, nombre, cedula, correo, telefono, id_especialidad) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"Médico {i}", str(90_000_000 + i), f"medico{i}@bench.test", f"300{i:07d}",
+             (i - 1) % especialidades + 1)
+            for i in range(1, medicos + 1)
+        ),
+    )
+    # lunes a viernes, 08-12 y 14-18
+    conn.executemany(
+        "INSERT INTO DisponibilidadMedica (id_medico, dia_semana, hora_inicio, hora_fin) VALUES (?, ?, ?, ?)",
+        (
+            (m, DIAS[d], inicio_franja, fin_franja)
+            for m in range(1, medicos + 1)
+            for d in range(1, 6)
+            for inicio_franja, fin_franja in (("08:00:00", "12:00:00"), ("14:00:00", "18:00:00"))
+        ),
+    )
+
+    # turnos de 15 min en días hábiles; por médico y día se toma una muestra sin repetir
+    turnos = [f"{h:02d}:{mi:02d}:00" for h in (8, 9, 10, 11, 14, 15, 16, 17) for mi in (0, 15, 30, 45)]
+    habiles = [d for d in (hoy + timedelta(days=k) for k in range(-365, 366)) if d.isoweekday() <= 5]
+    por_dia = max(1, min(len(turnos), math.ceil(citas / (medicos * len(habiles)))))
+
+    def generar():
+        n = 0
+        for dia in habiles:
+            fecha = dia.isoformat()
+            pasado = dia < hoy
+            for m in range(1, medicos + 1):
+                especialidad = (m - 1) % especialidades + 1
+                for hora in rng.sample(turnos, por_dia):
+                    if n >= citas:
+                        return
+                    n += 1
+                    if pasado:
+                        estado = "Atendida" if rng.random() < 0.8 else "Cancelada"
+                    else:
+                        estado = "Pendiente" if rng.random() < 0.9 else "Cancelada"
+                    yield (rng.randint(1, pacientes), m, especialidad, fecha, hora, estado)
+
+    conn.executemany(
+        "INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado) VALUES (?, ?, ?, ?, ?, ?)",
+        generar(),
+    )
+    conn.execute("""
+        INSERT INTO CitasResumenDiario (fecha, id_medico, estado, total)
+        SELECT fecha, id_medico, COALESCE(estado, 'Pendiente'), COUNT(*)
+        FROM Citas GROUP BY fecha, id_medico, COALESCE(estado, 'Pendiente')
+    """)
+    conn.commit()
+    # índices al final (mucho más rápido que mantenerlos durante la carga)
+    schema.migrar_sqlite(conn)
+    conn.execute("ANALYZE")
+    total = conn.execute("SELECT COUNT(*) FROM Citas").fetchone()[0]
+    conn.close()
+    os.replace(temporal, ruta)
+    return {"ruta": ruta, "citas": total, "segundos": round(time.perf_counter() - inicio, 1)}
+
+
+def asegurar(pacientes=100_000, medicos=500, citas=5_000_000, semilla=42):
+    """Ruta de la base sembrada para esta escala; la crea si no existe."""
+    ruta = ruta_datos(pacientes, medicos, citas, semilla)
+    if not os.path.exists(ruta):
+        print(f"Sembrando {ruta} ...", file=sys.stderr)
+        print(sembrar(ruta, pacientes, medicos, citas, semilla), file=sys.stderr)
+    else:
+        # una base sembrada con un esquema anterior recibe las migraciones nuevas
+        conn = sqlite3.connect(ruta)
+        if schema.migrar_sqlite(conn):
+            conn.execute("ANALYZE")
+        conn.close()
+    return ruta
+
+
+if __name__ == "__main__":
+    argumentos = [int(a) for a in sys.argv[1:5]]
+    print(asegurar(*argumentos))
@@ -1,30 +1,407 @@
-import pyodbc
+import asyncio
+import contextvars
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from services import metricas, perfilador
 
 load_dotenv()
 
+# "sqlserver" (pyodbc, producción) o "sqlite" (pruebas, benchmarks y despliegues
+# de una sola máquina). El SQL de cada uno está en almacen/.
+DB_BACKEND = os.getenv("DB_BACKEND", "sqlserver").lower()
+DB_SQLITE_RUTA = os.getenv("DB_SQLITE_RUTA", "medicicol.db")
+
+
+def _conectar():
+    if DB_BACKEND == "sqlite":
+        from almacen.sqlite import conectar
+        return conectar(DB_SQLITE_RUTA)
+
+    # Import diferido: el pool puede usarse con otro driver (sqlite3, falsos) sin unixODBC
+    import pyodbc
+
+    # conn = pyodbc.connect(
+    #     f"DRIVER={{{os.getenv('DRIVER')}}};"
+    #     f"SERVER={os.getenv('DB_SERVER')};"
+    #     f"DATABASE={os.getenv('DB_NAME')};"
+    #     "Encrypt=yes;"
+    #     "TrustServerCertificate=yes;"
+    #     "Trusted_Connection=yes;"
+    # )
+    return pyodbc.connect(
+        f"DRIVER={{{os.getenv('DRIVER')}}};"
+        f"SERVER={os.getenv('DB_SERVER')},1433;"
+        f"DATABASE={os.getenv('DB_NAME')};"
+        f"UID={os.getenv('DB_USER')};"
+        f"PWD={os.getenv('DB_PASSWORD')};"
+        "Encrypt=yes;"
+        "TrustServerCertificate=no;"
+        "Connection Timeout=30;"
+    )
+
+
+# ---------------------------------------------------
+# POOL DE CONEXIONES
+# ---------------------------------------------------
+class PoolTimeout(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera."""
+
+
+class PooledConnection:
+    """Conexión prestada por el pool: close() la devuelve en lugar de cerrarla."""
+
+    def __init__(self, pool, raw, creada):
+        self._pool = pool
+        self._raw = raw
+        self._creada = creada
+
+    def cursor(self):
+        cursor = self._raw.cursor()
+        if metricas.METRICAS or perfilador.ACTIVO:
+            return metricas.CursorMedido(cursor)
+        return cursor
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._devolver(raw, self._creada)
+
+    def __getattr__(self, nombre):
+        return getattr(self._raw, nombre)
+
+
+class ConnectionPool:
+    def __init__(self, creator, max_size=10, timeout=10.0, recycle=1800.0,
+                 ping_interval=30.0, ping_query="SELECT 1"):
+        self.creator = creator
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.ping_query = ping_query
+
+        self._cond = threading.Condition()
+        self._libres = []      # (conexión, creada, último uso) — LIFO
+        self._abiertas = 0     # libres + prestadas
+        self._esperando = 0
+        self._stats = {
+            "creadas": 0,
+            "recicladas": 0,
+            "descartadas": 0,
+            "prestamos": 0,
+            "timeouts": 0,
+            "espera_total_s": 0.0,
+        }
+
+    # ---- préstamo ----
+    def acquire(self):
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        entrada = None
+
+        with self._cond:
+            while True:
+                if self._libres:
+                    entrada = self._libres.pop()
+                    break
+                if self._abiertas < self.max_size:
+                    self._abiertas += 1
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No hay conexiones libres tras {self.timeout}s (máximo {self.max_size})"
+                    )
+                self._esperando += 1
+                try:
+                    self._cond.wait(restante)
+                finally:
+                    self._esperando -= 1
+            espera = time.monotonic() - inicio
+            self._stats["prestamos"] += 1
+            self._stats["espera_total_s"] += espera
+        metricas.registro.observar_espera_pool(espera)
+
+        # Validar fuera del lock: el ping y la reconexión son I/O
+        if entrada is not None:
+            raw, creada, usada = entrada
+            ahora = time.monotonic()
+            if ahora - creada > self.recycle:
+                self._cerrar(raw)
+                self._contar("recicladas")
+                entrada = None
+            elif ahora - usada > self.ping_interval and not self._viva(raw):
+                self._cerrar(raw)
+                self._contar("descartadas")
+                entrada = None
+
+        if entrada is None:
+            abrir = time.monotonic()
+            try:
+                raw = self.creator()
+            except Exception:
+                with self._cond:
+                    self._abiertas -= 1
+                    self._cond.notify()
+                raise
+            creada = time.monotonic()
+            metricas.registro.observar_conexion(creada - abrir)
+            self._contar("creadas")
+        return PooledConnection(self, raw, creada)
+
+    def _devolver(self, raw, creada):
+        # Deshacer lo que el handler no confirmó antes de reutilizarla
+        try:
+            raw.rollback()
+            sana = True
+        except Exception:
+            sana = False
+
+        with self._cond:
+            if sana:
+                self._libres.append((raw, creada, time.monotonic()))
+            else:
+                self._abiertas -= 1
+                self._stats["descartadas"] += 1
+            self._cond.notify()
+        if not sana:
+            self._cerrar(raw)
+
+    def _viva(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute(self.ping_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _cerrar(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _contar(self, clave):
+        with self._cond:
+            self._stats[clave] += 1
+
+    # ---- administración ----
+    def dispose(self):
+        with self._cond:
+            libres, self._libres = self._libres, []
+            self._abiertas -= len(libres)
+        for raw, _, _ in libres:
+            self._cerrar(raw)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "abiertas": self._abiertas,
+                "libres": len(self._libres),
+                "en_uso": self._abiertas - len(self._libres),
+                "esperando": self._esperando,
+                **self._stats,
+            }
+
+
+pool = ConnectionPool(
+    _conectar,
+    max_size=int(os.getenv("DB_POOL_SIZE", 10)),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", 10)),
+    recycle=float(os.getenv("DB_POOL_RECYCLE", 1800)),
+    ping_interval=float(os.getenv("DB_POOL_PING", 30)),
+)
+
+
+def configure_pool(creator=None, backend=None, **opciones):
+    """Reemplaza el pool global (p. ej. con sqlite3 o un driver falso en pruebas).
+
+    Con `backend` ("sqlserver" / "sqlite") cambia también el almacén que usan los routers.
+    """
+    global pool
+    if backend is not None:
+        from almacen import almacen
+        almacen.usar(backend)
+    pool.dispose()
+    pool = ConnectionPool(creator or _conectar, **{
+        "max_size": pool.max_size,
+        "timeout": pool.timeout,
+        "recycle": pool.recycle,
+        "ping_interval": pool.ping_interval,
+        **opciones,
+    })
+    return pool
+
+
 def get_connection():
     try:
-        # conn = pyodbc.connect(
-        #     f"DRIVER={{{os.getenv('DRIVER')}}};"
-        #     f"SERVER={os.getenv('DB_SERVER')};"
-        #     f"DATABASE={os.getenv('DB_NAME')};"
-        #     "Encrypt=yes;"
-        #     "TrustServerCertificate=yes;"
-        #     "Trusted_Connection=yes;"
-        # )
-        conn = pyodbc.connect(
-            f"DRIVER={{{os.getenv('DRIVER')}}};"
-            f"SERVER={os.getenv('DB_SERVER')},1433;"
-            f"DATABASE={os.getenv('DB_NAME')};"
-            f"UID={os.getenv('DB_USER')};"
-            f"PWD={os.getenv('DB_PASSWORD')};"
-            "Encrypt=yes;"
-            "TrustServerCertificate=no;"
-            "Connection Timeout=30;"
-        )
-        return conn
+        return pool.acquire()
+    except PoolTimeout:
+        raise
     except Exception as e:
         print("❌ Error al conectar con la base de datos:", e)
         return None
+
+
+# ---------------------------------------------------
+# PRÉSTAMO PARA run_db / stream_db
+# ---------------------------------------------------
+def _prestar():
+    try:
+        conn = get_connection()
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Base de datos ocupada, intenta de nuevo")
+
+    if conn is None:
+        raise HTTPException(status_code=500, detail="Error de conexión con la base de datos")
+    return conn
+
+
+# ---------------------------------------------------
+# EJECUTOR DEDICADO (RUTA ASÍNCRONA)
+# ---------------------------------------------------
+class DBSaturated(Exception):
+    """La cola del ejecutor de base de datos está llena."""
+
+
+class DBExecutor:
+    """Hilos propios para pyodbc: las consultas lentas no agotan el pool de anyio."""
+
+    def __init__(self, workers=10, max_queue=100):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._en_cola = 0
+        self._en_ejecucion = 0
+        self._stats = {
+            "completadas": 0,
+            "fallidas": 0,
+            "rechazadas": 0,
+            "espera_total_s": 0.0,
+            "ejecucion_total_s": 0.0,
+            "cola_maxima": 0,
+        }
+
+    async def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._en_cola >= self.max_queue:
+                self._stats["rechazadas"] += 1
+                raise DBSaturated(f"Cola de base de datos llena ({self.max_queue})")
+            self._en_cola += 1
+            self._stats["cola_maxima"] = max(self._stats["cola_maxima"], self._en_cola)
+
+        # copy_context: el trabajo de BD se atribuye a la petición que lo pidió
+        futuro = self._executor.submit(
+            contextvars.copy_context().run, self._ejecutar, time.monotonic(), fn, args, kwargs
+        )
+        futuro.add_done_callback(self._si_cancelada)
+        return await asyncio.wrap_future(futuro)
+
+    def _si_cancelada(self, futuro):
+        # Cancelada antes de arrancar (el cliente se fue): sale de la cola sin ejecutarse
+        if futuro.cancelled():
+            with self._lock:
+                self._en_cola -= 1
+
+    def _ejecutar(self, encolada, fn, args, kwargs):
+        inicio = time.monotonic()
+        with self._lock:
+            self._en_cola -= 1
+            self._en_ejecucion += 1
+            self._stats["espera_total_s"] += inicio - encolada
+        ok = False
+        try:
+            resultado = fn(*args, **kwargs)
+            ok = True
+            return resultado
+        finally:
+            with self._lock:
+                self._en_ejecucion -= 1
+                self._stats["completadas" if ok else "fallidas"] += 1
+                self._stats["ejecucion_total_s"] += time.monotonic() - inicio
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "en_cola": self._en_cola,
+                "en_ejecucion": self._en_ejecucion,
+                **self._stats,
+            }
+
+
+executor = DBExecutor(
+    workers=int(os.getenv("DB_EXECUTOR_WORKERS", 10)),
+    max_queue=int(os.getenv("DB_EXECUTOR_QUEUE", 100)),
+)
+
+
+def _con_conexion(fn, args, kwargs):
+    conn = _prestar()
+    try:
+        return fn(conn, *args, **kwargs)
+    finally:
+        conn.close()
+
+
+async def _submit(fn, *args, **kwargs):
+    try:
+        return await executor.submit(fn, *args, **kwargs)
+    except DBSaturated:
+        raise HTTPException(status_code=503, detail="Base de datos saturada, intenta de nuevo")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Ejecuta fn(conn, *args) en el ejecutor de BD con una conexión del pool."""
+    return await _submit(_con_conexion, fn, args, kwargs)
+
+
+async def stream_db(query, params=(), batch_size=1000):
+    """Generador asíncrono de lotes de filas (fetchmany) sobre una conexión del pool.
+
+    El generador es dueño del préstamo: toma la conexión al pedir el primer lote
+    (uno que nunca se itera no retiene nada) y la devuelve en el ejecutor al
+    agotarse, al cerrarse con aclose() o al cancelarse. Para que un error de la
+    consulta llegue como respuesta HTTP normal, pide el primer lote antes de
+    empezar a responder (ver admin.exportar_citas).
+    """
+    conn = await _submit(_prestar)
+    try:
+        cursor = conn.cursor()
+        await _submit(cursor.execute, query, params)
+        while True:
+            filas = await _submit(cursor.fetchmany, batch_size)
+            if not filas:
+                break
+            yield filas
+    finally:
+        # protegido: aunque cancelen al que espera, la conexión vuelve al pool
+        await asyncio.shield(_devolver(conn))
+
+
+async def _devolver(conn):
+    """close() de una conexión prestada (rollback y vuelta al pool) fuera del event loop."""
+    try:
+        await executor.submit(conn.close)
+    except DBSaturated:
+        conn.close()
@@ -1,9 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routers import usuarios, medicos, citas, admin, notificaciones, dudas
+from routers import usuarios, medicos, citas, admin, notificaciones, dudas, metricas as rutas_metricas
 from fastapi.middleware.cors import CORSMiddleware
+from services import correo, hashing, metricas, outbox, perfilador, plantillas, recordatorios, resumenes, tareas
+import database
+import schema
+import logging
 import os
 
-app = FastAPI(title="MediciCol API")
+RESUMEN_HORA = os.getenv("RESUMEN_HORA", "02:00")
+
+log = logging.getLogger("medicicol")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sin el esquema al día (índice único de turnos, resúmenes) la API no arranca
+    try:
+        await database.run_db(schema.asegurar_esquema)
+    except Exception:
+        log.exception("❌ No se pudo migrar el esquema; la API no arranca")
+        raise
+
+    # Reconstrucción nocturna del resumen diario de citas
+    nocturna = asyncio.create_task(
+        tareas.diaria(RESUMEN_HORA, lambda: database.run_db(resumenes.reconstruir), "resumen diario")
+    )
+
+    # Plantillas de correo compiladas una sola vez
+    plantillas.plantillas.cargar()
+
+    # Sesiones SMTP persistentes que atienden la cola de correo
+    correo.despachador.iniciar()
+    # Relay del outbox: citas creadas / reprogramadas / canceladas -> correo
+    outbox.relay.iniciar()
+
+    # Recordatorios de las citas de mañana, una vez al día
+    diaria_recordatorios = asyncio.create_task(
+        tareas.diaria(recordatorios.RECORDATORIOS_HORA, recordatorios.enviar_lote, "recordatorios")
+    )
+
+    yield
+
+    nocturna.cancel()
+    diaria_recordatorios.cancel()
+    await outbox.relay.detener()
+    await correo.despachador.detener()
+    # Cerrar hilos de BD y conexiones abiertas del pool
+    database.executor.shutdown()
+    database.pool.dispose()
+    hashing.servicio.shutdown()
+
+
+app = FastAPI(title="MediciCol API", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -17,12 +67,19 @@ app.add_middleware(
     allow_methods=["*"],        
     allow_headers=["*"],         
 )
+# Latencia, sentencias SQL y filas por ruta (expuestas en /metrics)
+if metricas.METRICAS:
+    app.add_middleware(metricas.MiddlewareMetricas)
+# Solo desarrollo / staging: detector de N+1 y peticiones lentas
+if perfilador.ACTIVO:
+    app.add_middleware(perfilador.MiddlewarePerfilador)
 app.include_router(usuarios.router)
 app.include_router(medicos.router)
 app.include_router(citas.router)
 app.include_router(admin.router)
 app.include_router(notificaciones.router)
 app.include_router(dudas.router)
+app.include_router(rutas_metricas.router)
 
 @app.get("/")
 def root():
@@ -1,8 +1,22 @@
-from fastapi import APIRouter, HTTPException, Query
+import csv
+import io
+import json
+import os
+from contextlib import aclosing
+from datetime import date, timedelta
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from database import get_connection
+from almacen import almacen
+from database import run_db, stream_db
+from services import horarios, paginacion, resumenes
+from services.auth import requiere_rol
+from services.cache import TTLCache
+from services.catalogo import catalogo
+from services.indice_disponibilidad import indice
 
-router = APIRouter(prefix="/admin", tags=["Administración"])
+router = APIRouter(prefix="/admin", tags=["Administración"], dependencies=[Depends(requiere_rol("admin"))])
 
 class UsuarioUpdate(BaseModel):
     nombre: str | None = None
@@ -23,20 +37,13 @@ class MedicoUpdate(BaseModel):
 # 1️⃣ LISTAR TODOS LOS USUARIOS
 # ---------------------------------------------------
 @router.get("/usuarios")
-def listar_usuarios(rol: str | None = None):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    query = "SELECT id_usuario, nombre, cedula, correo, rol, fecha_registro FROM Usuarios WHERE rol = 'paciente'"
-    params = []
+async def listar_usuarios(rol: str | None = None):
+    return await run_db(_listar_usuarios, rol)
 
-    if rol:
-        query += " WHERE rol = ?"
-        params.append(rol)
 
-    cursor.execute(query, tuple(params))
-    rows = cursor.fetchall()
-    conn.close()
+def _listar_usuarios(conn, rol: str | None = None):
+    cursor = conn.cursor()
+    rows = almacen.listar_pacientes(cursor, rol)
 
     keys = ["id_usuario", "nombre", "cedula", "correo", "rol", "fecha_registro"]
     return [dict(zip(keys, r)) for r in rows]
@@ -45,27 +52,13 @@ def listar_usuarios(rol: str | None = None):
 # 1️⃣ LISTAR TODOS LOS MÉDICOS
 # ---------------------------------------------------
 @router.get("/medicos")
-def listar_medicos():
-    conn = get_connection()
-    cursor = conn.cursor()
+async def listar_medicos(request: Request):
+    return await catalogo.responder(request, "medicos", _listar_medicos)
 
-    cursor.execute("""
-        SELECT 
-            m.id_medico,
-            m.nombre,
-            m.cedula,
-            m.correo,
-            m.telefono,
-            e.nombre AS especialidad
-        FROM Medicos m
-        JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
-    """)
-
-    rows = cursor.fetchall()
-    conn.close()
 
+def _listar_medicos(especialidades, medicos):
     keys = ["id_medico", "nombre", "cedula", "correo", "telefono", "especialidad"]
-    return [dict(zip(keys, r)) for r in rows]
+    return [{k: m[k] for k in keys} for m in medicos]
 
 
 
@@ -73,132 +66,102 @@ def listar_medicos():
 # 2️⃣ EDITAR USUARIO / MÉDICO
 # ---------------------------------------------------
 @router.put("/usuarios/{id_usuario}")
-def editar_usuario(id_usuario: int, data: UsuarioUpdate):
-    conn = get_connection()
+async def editar_usuario(id_usuario: int, data: UsuarioUpdate):
+    return await run_db(_editar_usuario, id_usuario, data)
+
+
+def _editar_usuario(conn, id_usuario: int, data: UsuarioUpdate):
     cursor = conn.cursor()
 
-    campos = []
-    valores = []
+    campos = {}
 
     if data.nombre:
-        campos.append("nombre=?")
-        valores.append(data.nombre)
+        campos["nombre"] = data.nombre
 
     if data.correo:
-        campos.append("correo=?")
-        valores.append(data.correo)
+        campos["correo"] = data.correo
 
     if data.cedula:
-        campos.append("cedula=?")
-        valores.append(data.cedula)
+        campos["cedula"] = data.cedula
 
     if data.genero:
-        campos.append("genero=?")
-        valores.append(data.genero)
+        campos["genero"] = data.genero
 
     if data.rol:
-        campos.append("rol=?")
-        valores.append(data.rol)
+        campos["rol"] = data.rol
 
     if not campos:
         raise HTTPException(status_code=400, detail="No se proporcionaron campos para actualizar")
 
-    query = f"UPDATE Usuarios SET {', '.join(campos)} WHERE id_usuario=?"
-    valores.append(id_usuario)
-
     try:
-        cursor.execute(query, tuple(valores))
+        almacen.actualizar_usuario(cursor, id_usuario, campos)
         conn.commit()
         return {"message": "Usuario actualizado correctamente"}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al actualizar usuario: {e}")
-    finally:
-        conn.close()
         
         # ---------------------------------------------------
+
 # ✏️ EDITAR MÉDICO (y su usuario asociado)
 # ---------------------------------------------------
 @router.put("/medicos/{id_medico}")
-def editar_medico(id_medico: int, data: MedicoUpdate):
-    conn = get_connection()
+async def editar_medico(id_medico: int, data: MedicoUpdate):
+    return await run_db(_editar_medico, id_medico, data)
+
+
+def _editar_medico(conn, id_medico: int, data: MedicoUpdate):
     cursor = conn.cursor()
 
     try:
         # 1️⃣ Obtener el correo del médico
-        cursor.execute("SELECT correo FROM Medicos WHERE id_medico=?", id_medico)
-        medico = cursor.fetchone()
-
-        if not medico:
+        if almacen.correo_medico(cursor, id_medico) is None:
             raise HTTPException(status_code=404, detail="Médico no encontrado")
 
-        correo_actual = medico[0]
-
         # 2️⃣ Obtener el id_usuario asociado
-        # cursor.execute("SELECT id_usuario FROM Usuarios WHERE correo=?", correo_actual)
-        cursor.execute("""
-    SELECT U.id_usuario 
-    FROM Usuarios U
-    JOIN Medicos M ON U.correo = M.correo
-    WHERE M.id_medico = ?
-""", (id_medico,))
-
-        usuario = cursor.fetchone()
+        id_usuario = almacen.usuario_de_medico(cursor, id_medico)
 
-        if not usuario:
+        if id_usuario is None:
             raise HTTPException(status_code=404, detail="Usuario asociado no encontrado")
 
-        id_usuario = usuario[0]
-
         # 3️⃣ Construir updates dinámicos para Medicos
-        campos_medicos = []
-        valores_medicos = []
+        campos_medicos = {}
 
         if data.nombre:
-            campos_medicos.append("nombre=?")
-            valores_medicos.append(data.nombre)
+            campos_medicos["nombre"] = data.nombre
 
         if data.cedula:
-            campos_medicos.append("cedula=?")
-            valores_medicos.append(data.cedula)
+            campos_medicos["cedula"] = data.cedula
 
         if data.correo:
-            campos_medicos.append("correo=?")
-            valores_medicos.append(data.correo)
+            campos_medicos["correo"] = data.correo
 
         if data.telefono:
-            campos_medicos.append("telefono=?")
-            valores_medicos.append(data.telefono)
+            campos_medicos["telefono"] = data.telefono
 
         # 4️⃣ Construir updates dinámicos para Usuarios
-        campos_usuarios = []
-        valores_usuarios = []
+        campos_usuarios = {}
 
         if data.nombre:
-            campos_usuarios.append("nombre=?")
-            valores_usuarios.append(data.nombre)
+            campos_usuarios["nombre"] = data.nombre
 
         if data.cedula:
-            campos_usuarios.append("cedula=?")
-            valores_usuarios.append(data.cedula)
+            campos_usuarios["cedula"] = data.cedula
 
         if data.correo:
-            campos_usuarios.append("correo=?")
-            valores_usuarios.append(data.correo)
+            campos_usuarios["correo"] = data.correo
 
         # 5️⃣ Ejecutar UPDATE en Medicos
         if campos_medicos:
-            query_medico = f"UPDATE Medicos SET {', '.join(campos_medicos)} WHERE id_medico=?"
-            valores_medicos.append(id_medico)
-            cursor.execute(query_medico, tuple(valores_medicos))
+            almacen.actualizar_medico(cursor, id_medico, campos_medicos)
 
         # 6️⃣ Ejecutar UPDATE en Usuarios
         if campos_usuarios:
-            query_usuario = f"UPDATE Usuarios SET {', '.join(campos_usuarios)} WHERE id_usuario=?"
-            valores_usuarios.append(id_usuario)
-            cursor.execute(query_usuario, tuple(valores_usuarios))
+            almacen.actualizar_usuario(cursor, id_usuario, campos_usuarios)
 
         conn.commit()
+        indice.invalidar_medico(id_medico)
+        catalogo.invalidar()
         return {"message": "📝 Médico actualizado correctamente"}
 
     except Exception as e:
@@ -206,41 +169,42 @@ def editar_medico(id_medico: int, data: MedicoUpdate):
         print("🔥 ERROR EXACTO:", e)   # <- Esto te mostrará el error real
         raise HTTPException(status_code=400, detail=f"Error al actualizar médico: {e}")
 
-    finally:
-        conn.close()
-
 
 # ---------------------------------------------------
 # 3️⃣ ELIMINAR USUARIO
 # ---------------------------------------------------
 @router.delete("/usuarios/{id_usuario}")
-def eliminar_usuario(id_usuario: int):
-    conn = get_connection()
+async def eliminar_usuario(id_usuario: int):
+    return await run_db(_eliminar_usuario, id_usuario)
+
+
+def _eliminar_usuario(conn, id_usuario: int):
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM Usuarios WHERE id_usuario=?", id_usuario)
+        almacen.eliminar_usuario(cursor, id_usuario)
         conn.commit()
         return {"message": "🗑️ Usuario eliminado correctamente"}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al eliminar usuario: {e}")
-    finally:
-        conn.close()
 
 # ---------------------------------------------------
 # 3️⃣ ELIMINAR MÉDICO
 # ---------------------------------------------------
 @router.delete("/medicos/{id_medico}")
-def eliminar_medico(id_medico: int):
-    conn = get_connection()
+async def eliminar_medico(id_medico: int):
+    return await run_db(_eliminar_medico, id_medico)
+
+
+def _eliminar_medico(conn, id_medico: int):
     cursor = conn.cursor()
 
     try:
-        # 1️⃣ Buscar el correo del médico
-        # cursor.execute("SELECT correo FROM Medicos WHERE id_medico=?", id_medico)
-        cursor.execute("DELETE FROM Medicos WHERE id_medico=?", id_medico)
+        almacen.eliminar_medico(cursor, id_medico)
 
         conn.commit()
+        indice.invalidar_medico(id_medico)
+        catalogo.invalidar()
         return {"message": "🗑️ Médico y usuario eliminados correctamente"}
 
     except Exception as e:
@@ -248,83 +212,214 @@ def eliminar_medico(id_medico: int):
         print("🔥 ERROR EXACTO:", e)   # <- Esto te mostrará el error real
         raise HTTPException(status_code=400, detail=f"Error al eliminar médico: {e}")
 
-    finally:
-        conn.close()
-
 # ---------------------------------------------------
 # 4️⃣ LISTAR TODAS LAS CITAS (FILTRAR POR ESTADO O FECHA)
 # ---------------------------------------------------
 @router.get("/citas")
-def listar_citas(estado: str | None = None, fecha: str | None = None):
-    conn = get_connection()
+async def listar_citas(
+    estado: str | None = None,
+    fecha: str | None = None,
+    limit: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    cursor: str | None = None,
+    id_medico: int | None = None,
+    id_usuario: int | None = None,
+    id_especialidad: int | None = None,
+    desde: str | None = None,
+    hasta: str | None = None,
+):
+    return await run_db(
+        _listar_citas, estado, fecha, limit, cursor,
+        id_medico, id_usuario, id_especialidad, desde, hasta
+    )
+
+
+def _listar_citas(conn, estado, fecha, limit, token, id_medico, id_usuario, id_especialidad, desde, hasta):
     cursor = conn.cursor()
 
-    query = """
-        SELECT c.id_cita, u.nombre AS paciente, m.nombre AS medico,
-               e.nombre AS especialidad, c.fecha, c.hora, c.estado
-        FROM Citas c
-        JOIN Usuarios u ON c.id_usuario = u.id_usuario
-        JOIN Medicos m ON c.id_medico = m.id_medico
-        JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
-    """
-
-    params = []
-    filtros = []
-
-    if estado:
-        filtros.append("c.estado = ?")
-        params.append(estado)
-    if fecha:
-        filtros.append("c.fecha = ?")
-        params.append(fecha)
-
-    if filtros:
-        query += " WHERE " + " AND ".join(filtros)
+    filas = almacen.pagina_citas_admin(
+        cursor, limit + 1, token, estado, fecha, id_medico, id_usuario, id_especialidad, desde, hasta
+    )
+    rows, next_cursor = paginacion.recortar(filas, limit, lambda r: (r[4], r[5], r[0]))
 
-    query += " ORDER BY c.fecha DESC, c.hora DESC"
+    keys = ["id_cita", "paciente", "medico", "especialidad", "fecha", "hora", "estado"]
+    return {"items": [dict(zip(keys, r)) for r in rows], "next_cursor": next_cursor}
 
-    cursor.execute(query, tuple(params))
-    rows = cursor.fetchall()
-    conn.close()
 
-    keys = ["id_cita", "paciente", "medico", "especialidad", "fecha", "hora", "estado"]
-    return [dict(zip(keys, r)) for r in rows]
+# ---------------------------------------------------
+# 4️⃣.1️⃣ EXPORTAR CITAS (STREAMING NDJSON / CSV)
+# ---------------------------------------------------
+EXPORT_COLUMNAS = [
+    "id_cita", "fecha", "hora", "estado",
+    "id_usuario", "paciente", "correo_paciente",
+    "id_medico", "medico", "id_especialidad", "especialidad",
+]
+EXPORT_LOTE = 1000
+
+
+@router.get("/citas/export")
+async def exportar_citas(
+    formato: Literal["ndjson", "csv"] = "ndjson",
+    estado: str | None = None,
+    fecha: str | None = None,
+    id_medico: int | None = None,
+    id_usuario: int | None = None,
+    id_especialidad: int | None = None,
+    desde: str | None = None,
+    hasta: str | None = None,
+):
+    query, params = almacen.consulta_exportar(estado, fecha, id_medico, id_usuario, id_especialidad, desde, hasta)
+    lotes = stream_db(query, params, EXPORT_LOTE)
+    # el primer lote antes de responder: un error de la consulta llega como HTTP normal
+    # (si falla, el generador ya devolvió su conexión)
+    primero = await anext(lotes, [])
+
+    if formato == "csv":
+        cuerpo, media_type = _csv(primero, lotes), "text/csv; charset=utf-8"
+    else:
+        cuerpo, media_type = _ndjson(primero, lotes), "application/x-ndjson"
+
+    return StreamingResponse(
+        cuerpo,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="citas.{formato}"'},
+    )
+
+
+async def _todos(primero, lotes):
+    # aclosing: si el cliente se va a mitad de la descarga, la conexión vuelve ya
+    async with aclosing(lotes):
+        if primero:
+            yield primero
+        async for filas in lotes:
+            yield filas
+
+
+async def _ndjson(primero, lotes):
+    async for filas in _todos(primero, lotes):
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNAS, r)), default=str, ensure_ascii=False) + "\n"
+            for r in filas
+        )
+
+
+async def _csv(primero, lotes):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNAS)
+    async for filas in _todos(primero, lotes):
+        writer.writerows(filas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
 
 
 # ---------------------------------------------------
 # 5️⃣ ESTADÍSTICAS BÁSICAS DEL SISTEMA
 # ---------------------------------------------------
-@router.get("/estadisticas")
-def estadisticas():
-    conn = get_connection()
-    cursor = conn.cursor()
+ESTADISTICAS_TTL = float(os.getenv("ESTADISTICAS_TTL", 30))
+cache_estadisticas = TTLCache(ESTADISTICAS_TTL, max_entradas=64)
 
-    # Total de pacientes
-    cursor.execute("SELECT COUNT(*) FROM Usuarios WHERE rol='paciente'")
-    pacientes = cursor.fetchone()[0]
 
-    # Total de médicos
-    cursor.execute("SELECT COUNT(*) FROM Usuarios WHERE rol='medico'")
-    medicos = cursor.fetchone()[0]
-
-    # Total de citas
-    cursor.execute("SELECT COUNT(*) FROM Citas")
-    citas_totales = cursor.fetchone()[0]
+@router.get("/estadisticas")
+async def estadisticas(detalle: bool = False, dias: int = Query(30, ge=1, le=366)):
+    # el dashboard hace polling: se sirve de caché durante unos segundos y, al
+    # vencer, una sola petición recalcula mientras las demás la esperan
+    clave = (detalle, dias if detalle else None)
+    return await cache_estadisticas.obtener(clave, lambda: run_db(_estadisticas, detalle, dias))
 
-    # Citas atendidas
-    cursor.execute("SELECT COUNT(*) FROM Citas WHERE estado='Atendida'")
-    atendidas = cursor.fetchone()[0]
 
-    # Citas canceladas
-    cursor.execute("SELECT COUNT(*) FROM Citas WHERE estado='Cancelada'")
-    canceladas = cursor.fetchone()[0]
+def _estadisticas(conn, detalle: bool, dias: int):
+    cursor = conn.cursor()
 
-    conn.close()
+    pacientes, medicos, citas_totales, atendidas, canceladas = almacen.totales(cursor)
 
-    return {
+    datos = {
         "pacientes_registrados": pacientes,
         "medicos_registrados": medicos,
         "citas_totales": citas_totales,
         "citas_atendidas": atendidas,
         "citas_canceladas": canceladas
     }
+
+    if not detalle:
+        return datos
+
+    # Desgloses por estado (del resumen diario, como los totales)
+    datos["por_especialidad"] = _por_estado(almacen.citas_por_especialidad(cursor), "id_especialidad")
+    datos["por_medico"] = _por_estado(almacen.citas_por_medico(cursor), "id_medico")
+
+    por_dia = {}
+    for fecha, estado, total in almacen.citas_por_dia(cursor, date.today() - timedelta(days=dias)):
+        dia = por_dia.setdefault(str(fecha)[:10], {"fecha": str(fecha)[:10], "total": 0, "estados": {}})
+        dia["estados"][estado] = total
+        dia["total"] += total
+    datos["por_dia"] = sorted(por_dia.values(), key=lambda d: d["fecha"])
+
+    return datos
+
+
+def _por_estado(filas, campo_id):
+    grupos = {}
+    for id_, nombre, estado, total in filas:
+        grupo = grupos.setdefault(id_, {campo_id: id_, "nombre": nombre, "total": 0, "estados": {}})
+        grupo["estados"][estado] = total
+        grupo["total"] += total
+    return list(grupos.values())
+
+
+# ---------------------------------------------------
+# 5️⃣.1️⃣ SERIES DE TIEMPO (DESDE EL RESUMEN DIARIO)
+# ---------------------------------------------------
+@router.get("/estadisticas/series")
+async def estadisticas_series(
+    desde: date | None = None,
+    hasta: date | None = None,
+    granularidad: Literal["dia", "semana", "mes"] = "dia",
+    id_medico: int | None = None,
+):
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(days=30)
+
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'")
+    if (hasta - desde).days > 731:
+        raise HTTPException(status_code=400, detail="El rango máximo es de dos años")
+
+    return await run_db(_estadisticas_series, desde, hasta, granularidad, id_medico)
+
+
+@router.post("/estadisticas/series/reconstruir")
+async def reconstruir_series():
+    # la misma reconstrucción que corre cada noche, a demanda (p. ej. tras crear la tabla)
+    await run_db(resumenes.reconstruir)
+    return {"message": "📊 Resumen diario reconstruido"}
+
+
+def _estadisticas_series(conn, desde, hasta, granularidad, id_medico):
+    cursor = conn.cursor()
+
+    filas = almacen.resumen(cursor, desde, hasta, id_medico)
+    franjas = almacen.franjas_semanales(cursor, id_medico)
+
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "granularidad": granularidad,
+        "series": resumenes.series(filas, granularidad),
+        "utilizacion": resumenes.utilizacion(
+            filas, franjas, indice.nombres_dias(cursor), desde, hasta, horarios.SLOT_MINUTOS
+        ),
+    }
+
+
+# ---------------------------------------------------
+# 6️⃣ ESTADO DE LAS CACHÉS EN MEMORIA
+# ---------------------------------------------------
+@router.get("/cache")
+async def estado_cache():
+    return {
+        "catalogo": catalogo.metrics(),
+        "estadisticas": cache_estadisticas.metrics(),
+    }
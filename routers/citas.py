@@ -1,10 +1,21 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from database import get_connection
+import json
+import os
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel, ValidationError
+from almacen import almacen
+from database import run_db
+from services import horarios, outbox, paginacion, reservas, resumenes
+from services.catalogo import catalogo
+from services.indice_disponibilidad import indice
 from typing import Optional
 
 router = APIRouter(prefix="/citas", tags=["Citas Médicas"])
 
+CITAS_LOTE_MAX = int(os.getenv("CITAS_LOTE_MAX", 10_000))
+DESCARTADA = "❌ Lote descartado por errores en otras citas"
+
 # ---------------------------------------------------
 # MODELOS
 # ---------------------------------------------------
@@ -36,123 +47,97 @@ class ReprogramarCita(BaseModel):
 # 1️⃣ LISTAR ESPECIALIDADES DISPONIBLES
 # ---------------------------------------------------
 @router.get("/especialidades")
-def listar_especialidades():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id_especialidad, nombre FROM Especialidades")
-    rows = cursor.fetchall()
-    conn.close()
-
-    return [{"id_especialidad": r[0], "nombre": r[1]} for r in rows]
+async def listar_especialidades(request: Request):
+    return await catalogo.responder(request, "especialidades", lambda especialidades, _: especialidades)
 
 # ---------------------------------------------------
 # 1️⃣ CREAR ESPECIALIDAD
 # ---------------------------------------------------
 @router.post("/especialidades")
-def crear_especialidad(data: Especialidad):
-    conn = get_connection()
+async def crear_especialidad(data: Especialidad):
+    return await run_db(_crear_especialidad, data)
+
+
+def _crear_especialidad(conn, data: Especialidad):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            INSERT INTO Especialidades (nombre)
-            VALUES (?)
-        """, (data.nombre,))
+        almacen.crear_especialidad(cursor, data.nombre)
 
         conn.commit()
+        catalogo.invalidar()
         return {"message": "✅ Especialidad creada correctamente"}
 
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al crear especialidad: {e}")
 
-    finally:
-        conn.close()
-
 ###Citas disponibles
 @router.get("/disponibles/{id_especialidad}")
-def horarios_disponibles(id_especialidad: int, fecha: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT m.id_medico, m.nombre, d.hora_inicio, d.hora_fin
-        FROM Medicos m
-        JOIN DisponibilidadMedica d ON m.id_medico = d.id_medico
-        WHERE m.id_especialidad = ?
-          AND DATENAME(WEEKDAY, ?) = d.dia_semana
-    """, (id_especialidad, fecha))
+async def horarios_disponibles(
+    id_especialidad: int,
+    fecha: date,
+    minutos: int = Query(horarios.SLOT_MINUTOS, ge=5, le=240),
+):
+    # con el índice caliente no hace falta pedir conexión
+    agenda = indice.agenda_en_memoria(id_especialidad, fecha)
+    if agenda is None:
+        agenda = await run_db(_cargar_agenda, id_especialidad, fecha)
 
-    disponibilidad = cursor.fetchall()
+    disponibilidad, ocupadas = agenda
+    return horarios.generar_slots(disponibilidad, ocupadas, fecha, minutos)
 
-    resultados = []
 
-    for medico_id, nombre, inicio, fin in disponibilidad:
-        # buscar horas ya ocupadas
-        cursor.execute("""
-            SELECT hora FROM Citas 
-            WHERE id_medico=? AND fecha=?
-        """, (medico_id, fecha))
-
-        horas_ocupadas = {str(r[0]) for r in cursor.fetchall()}
-
-        hora_actual = inicio
-
-        while hora_actual < fin:
-            hora_str = str(hora_actual)
-
-            if hora_str not in horas_ocupadas:
-                resultados.append({
-                    "id_medico": medico_id,
-                    "medico": nombre,
-                    "hora": hora_str,
-                    "fecha": fecha
-                })
-
-            # sumar 1 hora
-            cursor.execute("SELECT DATEADD(hour, 1, ?)", hora_actual)
-            hora_actual = cursor.fetchone()[0]
-
-    conn.close()
-    return resultados
+def _cargar_agenda(conn, id_especialidad: int, fecha: date):
+    return indice.agenda(conn.cursor(), id_especialidad, fecha)
 
 
 ###ELIMINAR CITAS
 @router.delete("/citas/{id_cita}")
-def eliminar_cita(id_cita: int):
-    conn = get_connection()
+async def eliminar_cita(id_cita: int):
+    return await run_db(_eliminar_cita, id_cita)
+
+
+def _eliminar_cita(conn, id_cita: int):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("DELETE FROM Citas WHERE id_cita = ?", (id_cita,))
+        borrada = almacen.borrar_cita(cursor, id_cita)
+
+        if borrada:
+            id_medico, fecha, hora, estado, id_usuario = borrada
+            resumenes.mover(cursor, (fecha, id_medico, estado), None)
+            if estado != "Cancelada":
+                outbox.registrar(cursor, outbox.CANCELADA, id_cita, id_usuario, id_medico, fecha, hora)
+
         conn.commit()
 
+        if borrada:
+            indice.liberar(id_medico, fecha, hora)
+            outbox.relay.avisar()
+
         return {"message": "🗑️ Cita eliminada correctamente"}
 
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"❌ Error al eliminar la cita: {e}")
 
-    finally:
-        conn.close()
-
 
 @router.put("/citas/{id_cita}/reprogramar")
-def reprogramar_cita(id_cita: int, data: ReprogramarCita):
-    conn = get_connection()
+async def reprogramar_cita(id_cita: int, data: ReprogramarCita):
+    return await run_db(_reprogramar_cita, id_cita, data)
+
+
+def _reprogramar_cita(conn, id_cita: int, data: ReprogramarCita):
     cursor = conn.cursor()
 
     # traer la cita actual
-    cursor.execute("""
-        SELECT id_medico, id_especialidad, fecha, hora 
-        FROM Citas WHERE id_cita = ?
-    """, (id_cita,))
-    cita_actual = cursor.fetchone()
+    cita_actual = almacen.cita(cursor, id_cita)
 
     if not cita_actual:
         raise HTTPException(status_code=404, detail="❌ La cita no existe")
 
-    medico_actual, especialidad, fecha_actual, hora_actual = cita_actual
+    medico_actual, especialidad, fecha_actual, hora_actual, estado, id_usuario = cita_actual
 
     # Determinar valores nuevos
     nuevo_medico = data.id_medico or medico_actual
@@ -160,67 +145,69 @@ def reprogramar_cita(id_cita: int, data: ReprogramarCita):
     nueva_hora = data.hora or hora_actual
 
     # 1. Validar que el médico pertenezca a la especialidad
-    cursor.execute("""
-        SELECT COUNT(*) FROM Medicos 
-        WHERE id_medico = ? AND id_especialidad = ?
-    """, (nuevo_medico, especialidad))
-
-    if cursor.fetchone()[0] == 0:
+    if not almacen.medico_en_especialidad(cursor, nuevo_medico, especialidad):
         raise HTTPException(
             status_code=400,
             detail="❌ El nuevo médico no pertenece a esta especialidad."
         )
 
-    # 2. Validar que no tenga otra cita en ese horario
-    cursor.execute("""
-        SELECT COUNT(*) FROM Citas
-        WHERE id_medico = ?
-        AND fecha = ?
-        AND hora = ?
-        AND id_cita != ?
-    """, (nuevo_medico, nueva_fecha, nueva_hora, id_cita))
+    # 2. Validar que no tenga otra cita en ese horario (si no es el mismo turno de esta cita)
+    mismo_turno = (
+        nuevo_medico == medico_actual
+        and str(nueva_fecha)[:10] == str(fecha_actual)[:10]
+        and horarios.a_minutos(nueva_hora) == horarios.a_minutos(hora_actual)
+    )
 
-    if cursor.fetchone()[0] > 0:
-        raise HTTPException(
-            status_code=400,
-            detail="❌ El médico ya tiene una cita en ese horario."
-        )
+    if not mismo_turno and indice.esta_ocupado(cursor, nuevo_medico, nueva_fecha, nueva_hora):
+        raise HTTPException(status_code=400, detail=reservas.OCUPADO)
 
     # 3. Actualizar
     try:
-        cursor.execute("""
-            UPDATE Citas
-            SET id_medico = ?, fecha = ?, hora = ?
-            WHERE id_cita = ?
-        """, (nuevo_medico, nueva_fecha, nueva_hora, id_cita))
+        almacen.mover_cita(cursor, id_cita, nuevo_medico, nueva_fecha, nueva_hora)
+        resumenes.mover(cursor, (fecha_actual, medico_actual, estado), (nueva_fecha, nuevo_medico, estado))
+        if not mismo_turno:
+            outbox.registrar(cursor, outbox.REPROGRAMADA, id_cita, id_usuario, nuevo_medico, nueva_fecha, nueva_hora)
 
         conn.commit()
 
+        indice.liberar(medico_actual, fecha_actual, hora_actual)
+        indice.reservar(nuevo_medico, nueva_fecha, nueva_hora)
+        outbox.relay.avisar()
+
         return {"message": "🔄 Cita reprogramada correctamente"}
 
     except Exception as e:
         conn.rollback()
+        if almacen.es_duplicado(e):
+            # el índice en memoria no es la última palabra: otra reserva tomó el turno antes del UPDATE
+            raise HTTPException(status_code=400, detail=reservas.OCUPADO)
         raise HTTPException(status_code=500, detail=f"❌ Error al reprogramar la cita: {e}")
 
-    finally:
-        conn.close()
-
 
 @router.get("", tags=["Citas Médicas"])
-def listar_todas_citas():
-    conn = get_connection()
+async def listar_todas_citas(
+    limit: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    cursor: str | None = None,
+    id_medico: int | None = None,
+    id_usuario: int | None = None,
+    id_especialidad: int | None = None,
+    desde: str | None = None,
+    hasta: str | None = None,
+):
+    return await run_db(
+        _listar_todas_citas, limit, cursor, id_medico, id_usuario, id_especialidad, desde, hasta
+    )
+
+
+def _listar_todas_citas(conn, limit, token, id_medico, id_usuario, id_especialidad, desde, hasta):
     cursor = conn.cursor()
+
     # ejemplo: join Usuarios y Medicos para enviar email/nombre/medico
-    cursor.execute("""
-        SELECT c.id_cita, c.id_usuario, u.nombre as nombre_usuario, u.correo, c.id_medico, m.nombre as medico, c.id_especialidad, e.nombre as especialidad, c.fecha, c.hora
-        FROM Citas c
-        LEFT JOIN Usuarios u ON c.id_usuario = u.id_usuario
-        LEFT JOIN Medicos m ON c.id_medico = m.id_medico
-        LEFT JOIN Especialidades e ON c.id_especialidad = e.id_especialidad
-        ORDER BY c.fecha DESC, c.hora DESC
-    """)
-    rows = cursor.fetchall()
-    conn.close()
+    filas = almacen.pagina_citas(
+        cursor, limit + 1, token, id_medico, id_usuario, id_especialidad, desde, hasta
+    )
+    rows, next_cursor = paginacion.recortar(filas, limit, lambda r: (r[8], r[9], r[0]))
+
     result = []
     for r in rows:
         result.append({
@@ -235,89 +222,148 @@ def listar_todas_citas():
             "fecha": r[8],
             "hora": r[9],
         })
-    return result
+    return {"items": result, "next_cursor": next_cursor}
 
 @router.post("/")
-def agendar_cita(data: CrearCita):
-    conn = get_connection()
-    cursor = conn.cursor()
+async def agendar_cita(data: CrearCita):
+    return await run_db(_agendar_cita, data)
 
-    # validar que no esté ocupada
-    cursor.execute("""
-        SELECT COUNT(*) FROM Citas
-        WHERE id_medico=? AND fecha=? AND hora=?
-    """, (data.id_medico, data.fecha, data.hora))
 
-    if cursor.fetchone()[0] > 0:
-        raise HTTPException(400, "Ese horario ya está ocupado")
+def _agendar_cita(conn, data: CrearCita):
+    cursor = conn.cursor()
 
+    # el turno se toma en el mismo INSERT (services/reservas.py)
     try:
-        cursor.execute("""
-            INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora)
-            VALUES (?, ?, ?, ?, ?)
-        """, (data.id_usuario, data.id_medico, data.id_especialidad, data.fecha, data.hora))
-
+        id_cita = reservas.reservar(
+            cursor, data.id_usuario, data.id_medico, data.id_especialidad, data.fecha, data.hora,
+            validar_especialidad=False,
+        )
         conn.commit()
-        return {"message": "Cita agendada correctamente"}
+        reservas.confirmar(data.id_medico, data.fecha, data.hora)
+        return {"message": "Cita agendada correctamente", "id_cita": id_cita}
 
+    except HTTPException:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(400, f"Error: {e}")
-    finally:
-        conn.close()
   
 ##CREAR CITA        
 @router.post("/citas")
-def crear_cita(data: CitaCreate):
-    conn = get_connection()
-    cursor = conn.cursor()
+async def crear_cita(data: CitaCreate):
+    return await run_db(_crear_cita, data)
 
-    # 1. Validar que el médico pertenece a la especialidad
-    cursor.execute("""
-        SELECT COUNT(*) FROM Medicos
-        WHERE id_medico = ? AND id_especialidad = ?
-    """, (data.id_medico, data.id_especialidad))
 
-    if cursor.fetchone()[0] == 0:
-        raise HTTPException(
-            status_code=400,
-            detail="❌ El médico no pertenece a esa especialidad."
-        )
-
-    # 2. Validar que el médico NO tenga otra cita en la misma fecha/hora
-    cursor.execute("""
-        SELECT COUNT(*) FROM Citas
-        WHERE id_medico = ? AND fecha = ? AND hora = ?
-    """, (data.id_medico, data.fecha, data.hora))
-
-    if cursor.fetchone()[0] > 0:
-        raise HTTPException(
-            status_code=400,
-            detail="❌ El médico ya tiene una cita en ese horario."
-        )
+def _crear_cita(conn, data: CitaCreate):
+    cursor = conn.cursor()
 
-    # 3. Insertar la cita
+    # especialidad, turno libre e inserción en una sola sentencia (services/reservas.py)
     try:
-        cursor.execute("""
-            INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado, nota_medica)
-            VALUES (?, ?, ?, ?, ?, 'Pendiente', NULL)
-        """, (
-            data.id_usuario,
-            data.id_medico,
-            data.id_especialidad,
-            data.fecha,
-            data.hora
-        ))
-
+        id_cita = reservas.reservar(
+            cursor, data.id_usuario, data.id_medico, data.id_especialidad, data.fecha, data.hora
+        )
         conn.commit()
+        reservas.confirmar(data.id_medico, data.fecha, data.hora)
 
-        return {"message": "✅ Cita creada correctamente"}
+        return {"message": "✅ Cita creada correctamente", "id_cita": id_cita}
 
+    except HTTPException:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"❌ Error creando la cita: {e}"
         )
-    finally:
-        conn.close()
+
+
+##CREAR CITAS EN LOTE (campañas, importaciones)
+@router.post("/lote")
+async def crear_citas_lote(request: Request, atomico: bool = False):
+    """Lista JSON de CitaCreate, o NDJSON (una cita por línea) con Content-Type application/x-ndjson.
+
+    Devuelve un resultado por elemento, en el mismo orden. Con atomico=true,
+    un solo error descarta el lote completo.
+    """
+    if "ndjson" in request.headers.get("content-type", ""):
+        crudos = await _leer_ndjson(request)
+    else:
+        try:
+            crudos = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="El cuerpo debe ser una lista JSON de citas")
+        if not isinstance(crudos, list):
+            raise HTTPException(status_code=400, detail="El cuerpo debe ser una lista JSON de citas")
+
+    if len(crudos) > CITAS_LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {CITAS_LOTE_MAX} citas por lote")
+
+    citas, errores = [], {}
+    for i, crudo in enumerate(crudos):
+        try:
+            c = CitaCreate.model_validate(crudo)
+            citas.append((i, (c.id_usuario, c.id_medico, c.id_especialidad, c.fecha, c.hora)))
+        except ValidationError as e:
+            errores[i] = f"❌ Datos inválidos: {e.errors()[0]['msg']}"
+
+    if atomico and errores:
+        resultados = [DESCARTADA] * len(citas)
+    else:
+        resultados = await run_db(_crear_citas_lote, [c for _, c in citas], atomico)
+
+    por_indice = dict(errores)
+    por_indice.update({i: r for (i, _), r in zip(citas, resultados)})
+
+    items = []
+    for i in range(len(crudos)):
+        r = por_indice[i]
+        if isinstance(r, int):
+            items.append({"indice": i, "ok": True, "id_cita": r})
+        else:
+            items.append({"indice": i, "ok": False, "error": r})
+    creadas = sum(1 for it in items if it["ok"])
+    return {"total": len(items), "creadas": creadas, "rechazadas": len(items) - creadas, "items": items}
+
+
+async def _leer_ndjson(request: Request):
+    crudos, resto = [], b""
+    async for trozo in request.stream():
+        lineas = (resto + trozo).split(b"\n")
+        resto = lineas.pop()
+        crudos.extend(lineas)
+        if len(crudos) > CITAS_LOTE_MAX:
+            raise HTTPException(status_code=413, detail=f"Máximo {CITAS_LOTE_MAX} citas por lote")
+    crudos.append(resto)
+
+    citas = []
+    for n, linea in enumerate(crudos, start=1):
+        if not linea.strip():
+            continue
+        try:
+            citas.append(json.loads(linea))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Línea {n}: JSON inválido")
+    return citas
+
+
+def _crear_citas_lote(conn, citas, atomico):
+    if not citas:
+        return []
+    cursor = conn.cursor()
+    try:
+        resultados = reservas.reservar_lote(cursor, citas)
+        if atomico and not all(isinstance(r, int) for r in resultados):
+            conn.rollback()
+            return [DESCARTADA if isinstance(r, int) else r for r in resultados]
+        conn.commit()
+    except HTTPException:
+        conn.rollback()
+        raise
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"❌ Error creando las citas: {e}")
+
+    reservas.confirmar_lote(citas, resultados)
+    return resultados
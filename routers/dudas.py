@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, EmailStr
-from database import get_connection
+from almacen import almacen
+from database import run_db
 
 router = APIRouter(prefix="/dudas", tags=["Dudas y Quejas"])
 
@@ -12,15 +13,15 @@ class Duda(BaseModel):
 
 # 1️⃣ CREAR
 @router.post("/")
-def crear_duda(data: Duda):
-    conn = get_connection()
+async def crear_duda(data: Duda):
+    return await run_db(_crear_duda, data)
+
+
+def _crear_duda(conn, data: Duda):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            INSERT INTO DudasYQuejas (correo, nombre, observaciones)
-            VALUES (?, ?, ?)
-        """, (data.correo, data.nombre, data.observaciones))
+        almacen.crear_duda(cursor, data.correo, data.nombre, data.observaciones)
 
         conn.commit()
         return {"message": "✅ Duda/queja registrada correctamente"}
@@ -29,24 +30,18 @@ def crear_duda(data: Duda):
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al crear el registro: {e}")
 
-    finally:
-        conn.close()
-
 
 # 2️⃣ LISTAR
 @router.get("/")
-def listar_dudas():
-    conn = get_connection()
+async def listar_dudas():
+    return await run_db(_listar_dudas)
+
+
+def _listar_dudas(conn):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            SELECT id_observacion, correo, nombre, observaciones
-            FROM DudasYQuejas
-            ORDER BY id_observacion DESC
-        """)
-        rows = cursor.fetchall()
-        conn.close()
+        rows = almacen.listar_dudas(cursor)
 
         keys = ["id_observacion", "correo", "nombre", "observaciones"]
         return [dict(zip(keys, r)) for r in rows]
@@ -57,15 +52,18 @@ def listar_dudas():
 
 # 3️⃣ ELIMINAR
 @router.delete("/{id_observacion}")
-def eliminar_duda(id_observacion: int):
-    conn = get_connection()
+async def eliminar_duda(id_observacion: int):
+    return await run_db(_eliminar_duda, id_observacion)
+
+
+def _eliminar_duda(conn, id_observacion: int):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("DELETE FROM DudasYQuejas WHERE id_observacion = ?", id_observacion)
+        borrados = almacen.eliminar_duda(cursor, id_observacion)
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if borrados == 0:
             raise HTTPException(status_code=404, detail="No existe un registro con ese ID")
 
         return {"message": "🗑️ Registro eliminado correctamente"}
@@ -73,6 +71,3 @@ def eliminar_duda(id_observacion: int):
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al eliminar registro: {e}")
-
-    finally:
-        conn.close()
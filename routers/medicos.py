@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from database import get_connection
-import hashlib
+from almacen import almacen
+from database import run_db
+from services import calendario, disponibilidad, hashing, outbox, paginacion, resumenes
+from services.auth import crear_token, guardar_sesion, requiere_rol
+from services.catalogo import NO_ENCONTRADO, catalogo
+from services.horarios import a_hora, a_minutos
+from services.indice_disponibilidad import indice
 
 router = APIRouter(prefix="/medicos", tags=["Médicos"])
 
+# agenda, disponibilidad y citas propias: médicos (y admins) con sesión iniciada
+SOLO_MEDICOS = [Depends(requiere_rol("medico", "admin"))]
+
 # ---------------------------------------------------
 # MODELOS
 # ---------------------------------------------------
@@ -36,23 +46,49 @@ class Disponibilidad(BaseModel):
     hora_inicio: str
     hora_fin: str
 
+
+class FranjaSemanal(BaseModel):
+    dia_semana: int | str   # 1 = lunes … 7 = domingo, o el nombre que usa la BD
+    hora_inicio: str
+    hora_fin: str
+
+
+class ReglaRecurrente(BaseModel):
+    dias: list[int | str]
+    hora_inicio: str
+    hora_fin: str
+
+
+class ExcepcionDisponibilidad(BaseModel):
+    fecha: str
+    hora_inicio: str | None = None   # sin horas = no atiende en todo el día
+    hora_fin: str | None = None
+    motivo: str | None = None
+
+
+class PlantillaSemanal(BaseModel):
+    franjas: list[FranjaSemanal] = []
+    reglas: list[ReglaRecurrente] = []
+    excepciones: list[ExcepcionDisponibilidad] | None = None   # None = no tocar las excepciones
+
 # ---------------------------------------------------
 # 1️⃣ REGISTRAR MÉDICO
 # ---------------------------------------------------
 @router.post("/registro")
-def registrar_medico(data: MedicoRegistro):
-    conn = get_connection()
+async def registrar_medico(data: MedicoRegistro):
+    hashed_pass = await hashing.servicio.hash(data.contrasena)
+    return await run_db(_registrar_medico, data, hashed_pass)
+
+
+def _registrar_medico(conn, data: MedicoRegistro, hashed_pass: str):
     cursor = conn.cursor()
 
-    hashed_pass = hashlib.sha256(data.contrasena.encode()).hexdigest()
     hashed_pass2 = hashed_pass
 
     try:
         # ---------- INSERT USUARIOS (CORREGIDO) ----------
-        cursor.execute("""
-            INSERT INTO Usuarios (nombre, cedula, correo, contrasena, genero, rol, contrasena2)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+        almacen.crear_usuario(
+            cursor,
             data.nombre,
             data.cedula,
             data.correo,
@@ -60,24 +96,21 @@ def registrar_medico(data: MedicoRegistro):
             "H",
             "medico",
             hashed_pass2
-        ))
-
-        cursor.execute("SELECT SCOPE_IDENTITY()")
-        id_usuario = cursor.fetchone()[0]
+        )
 
         # ---------- INSERT MEDICOS (CORREGIDO) ----------
-        cursor.execute("""
-            INSERT INTO dbo.Medicos (nombre, cedula, correo, telefono, id_especialidad)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
+        almacen.crear_medico(
+            cursor,
             data.nombre,
             data.cedula,
             data.correo,
             data.telefono,
             data.id_especialidad
-        ))
+        )
 
         conn.commit()
+        indice.invalidar_especialidad(data.id_especialidad)
+        catalogo.invalidar()
         return {"message": "Médico registrado exitosamente"}
 
     except Exception as e:
@@ -85,30 +118,18 @@ def registrar_medico(data: MedicoRegistro):
         print("🔥 ERROR EXACTO:", e)   # <- Esto te mostrará el error real
         raise HTTPException(status_code=400, detail=f"Error al registrar médico: {e}")
 
-    finally:
-        conn.close()
-
 # ---------------------------------------------------
 # 2️⃣ LOGIN MÉDICO
 # ---------------------------------------------------
 @router.post("/login")
-def login_medico(data: LoginMedico):
-    conn = get_connection()
-    cursor = conn.cursor()
-    hashed_pass = hashlib.sha256(data.contrasena.encode()).hexdigest()
-
-    cursor.execute("""
-        SELECT id_usuario, nombre, correo, rol
-        FROM Usuarios
-        WHERE correo=? AND contrasena=? AND rol='medico'
-    """, (data.correo, hashed_pass))
-
-    medico = cursor.fetchone()
-    conn.close()
+async def login_medico(data: LoginMedico, response: Response):
+    medico = await hashing.autenticar(data.correo, data.contrasena, rol="medico")
 
     if not medico:
         raise HTTPException(status_code=401, detail="Credenciales incorrectas o usuario no es médico")
 
+    guardar_sesion(response, crear_token(*medico))
+
     return {
         "message": "Inicio de sesión exitoso",
         "medico": {"id": medico[0], "nombre": medico[1], "correo": medico[2], "rol": medico[3]}
@@ -116,65 +137,179 @@ def login_medico(data: LoginMedico):
 
 
 # ---------------------------------------------------
-# 3️⃣ CONSULTAR PERFIL MÉDICO
+# 2️⃣.1️⃣ CALENDARIO DE VARIOS MÉDICOS (UNA SOLA PETICIÓN)
 # ---------------------------------------------------
-@router.get("/{id_medico}")
-def obtener_perfil_medico(id_medico: int):
-    conn = get_connection()
+CALENDARIO_MAX_MEDICOS = 200
+CALENDARIO_MAX_DIAS = 62
+
+
+@router.get("/calendario")
+async def calendario_medicos(
+    desde: date,
+    hasta: date,
+    ids: list[int] | None = Query(None),
+    id_especialidad: int | None = None,
+):
+    # ?ids=1&ids=2… o ?id_especialidad=…; respuesta columnar (listas paralelas por campo)
+    if not ids and id_especialidad is None:
+        raise HTTPException(status_code=400, detail="Indica ids de médicos o id_especialidad")
+    if ids and len(ids) > CALENDARIO_MAX_MEDICOS:
+        raise HTTPException(status_code=400, detail=f"Máximo {CALENDARIO_MAX_MEDICOS} médicos por consulta")
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior a 'hasta'")
+    if (hasta - desde).days >= CALENDARIO_MAX_DIAS:
+        raise HTTPException(status_code=400, detail=f"El rango máximo es de {CALENDARIO_MAX_DIAS} días")
+
+    return await run_db(_calendario_medicos, desde, hasta, sorted(set(ids or [])), id_especialidad)
+
+
+def _calendario_medicos(conn, desde, hasta, ids, id_especialidad):
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT m.nombre, m.cedula, m.correo, e.nombre AS especialidad
-        FROM Medicos m
-        JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
-        WHERE m.id_medico = ?
-    """, id_medico)
 
-    medico = cursor.fetchone()
-    conn.close()
+    # franjas semanales, y citas y excepciones del rango: dos consultas para todos los médicos
+    franjas, filas = almacen.calendario(cursor, ids, id_especialidad, desde, hasta)
+
+    return calendario.armar(franjas, filas, indice.nombres_dias(cursor), desde, hasta)
 
-    if not medico:
-        raise HTTPException(status_code=404, detail="Médico no encontrado")
 
+# ---------------------------------------------------
+# 3️⃣ CONSULTAR PERFIL MÉDICO
+# ---------------------------------------------------
+@router.get("/{id_medico}")
+async def obtener_perfil_medico(id_medico: int, request: Request):
+    return await catalogo.responder(
+        request, ("medico", id_medico),
+        lambda _, medicos: _obtener_perfil_medico(medicos, id_medico),
+        "Médico no encontrado",
+    )
+
+
+def _obtener_perfil_medico(medicos, id_medico: int):
     keys = ["nombre", "cedula", "correo", "especialidad"]
-    return dict(zip(keys, medico))
+    for m in medicos:
+        if m["id_medico"] == id_medico:
+            return {k: m[k] for k in keys}
+    return NO_ENCONTRADO
 
 
 # ---------------------------------------------------
 # 4️⃣ DEFINIR DISPONIBILIDAD
 # ---------------------------------------------------
-@router.post("/{id_medico}/disponibilidad")
-def definir_disponibilidad(id_medico: int, data: Disponibilidad):
-    conn = get_connection()
+@router.post("/{id_medico}/disponibilidad", dependencies=SOLO_MEDICOS)
+async def definir_disponibilidad(id_medico: int, data: Disponibilidad):
+    return await run_db(_definir_disponibilidad, id_medico, data)
+
+
+def _definir_disponibilidad(conn, id_medico: int, data: Disponibilidad):
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            INSERT INTO DisponibilidadMedica (id_medico, dia_semana, hora_inicio, hora_fin)
-            VALUES (?, ?, ?, ?)
-        """, (id_medico, data.dia_semana, data.hora_inicio, data.hora_fin))
+        almacen.agregar_franja(cursor, id_medico, data.dia_semana, data.hora_inicio, data.hora_fin)
         conn.commit()
+        indice.invalidar_medico(id_medico)
         return {"message": "✅ Disponibilidad registrada correctamente"}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al registrar disponibilidad: {e}")
-    finally:
-        conn.close()
+
+
+# ---------------------------------------------------
+# 4️⃣.1️⃣ PLANTILLA SEMANAL COMPLETA (REGLAS Y EXCEPCIONES)
+# ---------------------------------------------------
+@router.put("/{id_medico}/disponibilidad/semana", dependencies=SOLO_MEDICOS)
+async def definir_semana(id_medico: int, data: PlantillaSemanal, simular: bool = False):
+    # reemplaza la semana del médico aplicando solo las diferencias; simular=true no escribe
+    return await run_db(_definir_semana, id_medico, data, simular)
+
+
+def _definir_semana(conn, id_medico: int, data: PlantillaSemanal, simular: bool):
+    cursor = conn.cursor()
+
+    deseadas = disponibilidad.expandir(
+        [(f.dia_semana, f.hora_inicio, f.hora_fin) for f in data.franjas],
+        [(r.dias, r.hora_inicio, r.hora_fin) for r in data.reglas],
+        indice.nombres_dias(cursor),
+    )
+    actuales = {(d, a_minutos(i), a_minutos(f)) for d, i, f in almacen.franjas_medico(cursor, id_medico)}
+    borrar, insertar, iguales = disponibilidad.diferencias(actuales, deseadas)
+
+    borrar_exc, insertar_exc, iguales_exc = set(), set(), 0
+    ids_excepcion = {}
+    if data.excepciones is not None:
+        hoy = date.today()
+        deseadas_exc = disponibilidad.normalizar_excepciones(
+            (e.fecha, e.hora_inicio, e.hora_fin, e.motivo) for e in data.excepciones
+        )
+        if any(e[0] < hoy for e in deseadas_exc):
+            raise HTTPException(status_code=400, detail="Las excepciones deben ser de hoy en adelante")
+
+        # solo se comparan las excepciones futuras; el historial no se toca
+        for id_excepcion, fecha, inicio, fin, motivo in almacen.excepciones(cursor, id_medico, hoy):
+            clave = (date.fromisoformat(str(fecha)[:10]),
+                     a_minutos(inicio) if inicio is not None else None,
+                     a_minutos(fin) if fin is not None else None,
+                     motivo)
+            ids_excepcion.setdefault(clave, []).append(id_excepcion)
+        borrar_exc, insertar_exc, iguales_exc = disponibilidad.diferencias(set(ids_excepcion), deseadas_exc)
+
+    resumen = {
+        "franjas": {"agregadas": len(insertar), "eliminadas": len(borrar), "sin_cambios": iguales},
+        "excepciones": {"agregadas": len(insertar_exc), "eliminadas": len(borrar_exc), "sin_cambios": iguales_exc},
+    }
+    if simular or not (borrar or insertar or borrar_exc or insertar_exc):
+        return {"message": "Sin cambios" if not simular else "Simulación", **resumen}
+
+    def hora(minutos):
+        return a_hora(minutos) if minutos is not None else None
+
+    try:
+        almacen.cambiar_franjas(
+            cursor, id_medico,
+            [(d, hora(i), hora(f)) for d, i, f in borrar],
+            [(d, hora(i), hora(f)) for d, i, f in sorted(insertar)],
+        )
+        almacen.cambiar_excepciones(
+            cursor, id_medico,
+            [i for clave in borrar_exc for i in ids_excepcion[clave]],
+            [(f, hora(i), hora(fin), m) for f, i, fin, m in sorted(insertar_exc, key=str)],
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=400, detail=f"Error al actualizar la disponibilidad: {e}")
+
+    # una sola invalidación para todo el lote
+    indice.invalidar_medico(id_medico)
+    return {"message": "✅ Disponibilidad semanal actualizada", **resumen}
+
+
+@router.get("/{id_medico}/disponibilidad/excepciones")
+async def consultar_excepciones(id_medico: int, desde: date | None = None):
+    return await run_db(_consultar_excepciones, id_medico, desde or date.today())
+
+
+def _consultar_excepciones(conn, id_medico: int, desde: date):
+    cursor = conn.cursor()
+    return [
+        {"fecha": str(fecha)[:10],
+         "hora_inicio": str(inicio) if inicio is not None else None,
+         "hora_fin": str(fin) if fin is not None else None,
+         "motivo": motivo}
+        for _, fecha, inicio, fin, motivo in almacen.excepciones(cursor, id_medico, desde)
+    ]
 
 
 # ---------------------------------------------------
 # 5️⃣ CONSULTAR DISPONIBILIDAD
 # ---------------------------------------------------
 @router.get("/{id_medico}/disponibilidad")
-def consultar_disponibilidad(id_medico: int):
-    conn = get_connection()
+async def consultar_disponibilidad(id_medico: int):
+    return await run_db(_consultar_disponibilidad, id_medico)
+
+
+def _consultar_disponibilidad(conn, id_medico: int):
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT dia_semana, hora_inicio, hora_fin
-        FROM DisponibilidadMedica
-        WHERE id_medico = ?
-    """, id_medico)
-    rows = cursor.fetchall()
-    conn.close()
+    rows = almacen.franjas_medico(cursor, id_medico)
 
     return [{"dia_semana": r[0], "hora_inicio": str(r[1]), "hora_fin": str(r[2])} for r in rows]
 
@@ -182,23 +317,30 @@ def consultar_disponibilidad(id_medico: int):
 # ---------------------------------------------------
 # 6️⃣ CONSULTAR CITAS PROGRAMADAS
 # ---------------------------------------------------
-@router.get("/{id_medico}/citas")
-def consultar_citas_medico(id_medico: int):
-    conn = get_connection()
+@router.get("/{id_medico}/citas", dependencies=SOLO_MEDICOS)
+async def consultar_citas_medico(
+    id_medico: int,
+    desde: date | None = None,
+    hasta: date | None = None,
+    estado: str | None = None,
+    historial: bool = False,
+    limit: int = Query(paginacion.LIMITE_DEFECTO, ge=1, le=paginacion.LIMITE_MAXIMO),
+    cursor: str | None = None,
+):
+    # sin rango ni historial=true solo se listan las citas de hoy en adelante
+    if desde is None and hasta is None and not historial:
+        desde = date.today()
+    return await run_db(_consultar_citas_medico, id_medico, desde, hasta, estado, limit, cursor)
+
+
+def _consultar_citas_medico(conn, id_medico: int, desde, hasta, estado, limit, token):
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT c.id_cita, u.nombre AS paciente, c.fecha, c.hora, c.estado
-        FROM Citas c
-        JOIN Usuarios u ON c.id_usuario = u.id_usuario
-        WHERE c.id_medico = ?
-        ORDER BY c.fecha, c.hora
-    """, id_medico)
 
-    citas = cursor.fetchall()
-    conn.close()
+    filas = almacen.pagina_citas_medico(cursor, limit + 1, token, id_medico, desde, hasta, estado)
+    citas, next_cursor = paginacion.recortar(filas, limit, lambda r: (r[2], r[3], r[0]))
 
     keys = ["id_cita", "paciente", "fecha", "hora", "estado"]
-    return [dict(zip(keys, c)) for c in citas]
+    return {"items": [dict(zip(keys, c)) for c in citas], "next_cursor": next_cursor}
 
 
 # ---------------------------------------------------
@@ -207,22 +349,31 @@ def consultar_citas_medico(id_medico: int):
 class EstadoCita(BaseModel):
     estado: str
 
-@router.put("/citas/{id_cita}/estado")
-def actualizar_estado_cita(id_cita: int, data: EstadoCita):
-    conn = get_connection()
+@router.put("/citas/{id_cita}/estado", dependencies=SOLO_MEDICOS)
+async def actualizar_estado_cita(id_cita: int, data: EstadoCita):
+    return await run_db(_actualizar_estado_cita, id_cita, data)
+
+
+def _actualizar_estado_cita(conn, id_cita: int, data: EstadoCita):
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE Citas SET estado=?, fecha_actualizacion=GETDATE()
-            WHERE id_cita=?
-        """, (data.estado, id_cita))
+        filas = almacen.cambiar_estado(cursor, id_cita, data.estado)
+        _mover_resumen(cursor, filas)
+        for fecha, id_medico, antes, despues, id_usuario, hora in filas:
+            if despues == "Cancelada" and antes != "Cancelada":
+                outbox.registrar(cursor, outbox.CANCELADA, id_cita, id_usuario, id_medico, fecha, hora)
         conn.commit()
+        outbox.relay.avisar()
         return {"message": f"✅ Cita marcada como {data.estado}"}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al actualizar cita: {e}")
-    finally:
-        conn.close()
+
+
+def _mover_resumen(cursor, filas):
+    # (fecha, id_medico, estado anterior, estado nuevo, ...) de almacen.cambiar_estado / agregar_nota
+    for fecha, id_medico, antes, despues, *_ in filas:
+        resumenes.mover(cursor, (fecha, id_medico, antes), (fecha, id_medico, despues))
 
 
 # ---------------------------------------------------
@@ -231,46 +382,35 @@ def actualizar_estado_cita(id_cita: int, data: EstadoCita):
 class NotaMedica(BaseModel):
     nota_medica: str
 
-@router.put("/citas/{id_cita}/nota")
-def agregar_nota_medica(id_cita: int, data: NotaMedica):
-    conn = get_connection()
+@router.put("/citas/{id_cita}/nota", dependencies=SOLO_MEDICOS)
+async def agregar_nota_medica(id_cita: int, data: NotaMedica):
+    return await run_db(_agregar_nota_medica, id_cita, data)
+
+
+def _agregar_nota_medica(conn, id_cita: int, data: NotaMedica):
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE Citas
-            SET nota_medica=?, estado='Atendida', fecha_actualizacion=GETDATE()
-            WHERE id_cita=?
-        """, (data.nota_medica, id_cita))
+        _mover_resumen(cursor, almacen.agregar_nota(cursor, id_cita, data.nota_medica))
         conn.commit()
         return {"message": "✅ Nota médica agregada correctamente"}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al agregar nota médica: {e}")
-    finally:
-        conn.close()
 
 
 # ---------------------------------------------------
 # 3️⃣.5️⃣ OBTENER MÉDICOS POR ESPECIALIDAD
 # ---------------------------------------------------
 @router.get("/especialidad/{id_especialidad}")
-def medicos_por_especialidad(id_especialidad: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT m.id_medico, m.nombre, m.cedula, m.correo, m.telefono, e.nombre AS especialidad
-        FROM Medicos m
-        JOIN Especialidades e ON m.id_especialidad = e.id_especialidad
-        WHERE m.id_especialidad = ?
-    """, id_especialidad)
+async def medicos_por_especialidad(id_especialidad: int, request: Request):
+    return await catalogo.responder(
+        request, ("especialidad", id_especialidad),
+        lambda _, medicos: _medicos_por_especialidad(medicos, id_especialidad),
+        "No hay médicos en esta especialidad",
+    )
 
-    rows = cursor.fetchall()
-    conn.close()
-
-    if not rows:
-        raise HTTPException(status_code=404, detail="No hay médicos en esta especialidad")
 
+def _medicos_por_especialidad(medicos, id_especialidad: int):
     keys = ["id_medico", "nombre", "cedula", "correo", "telefono", "especialidad"]
-
-    return [dict(zip(keys, r)) for r in rows]
+    rows = [{k: m[k] for k in keys} for m in medicos if m["id_especialidad"] == id_especialidad]
+    return rows or NO_ENCONTRADO
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import database
+from services import auth, correo, hashing, metricas, outbox
+from services.catalogo import catalogo
+from services.indice_disponibilidad import indice
+
+router = APIRouter(tags=["Métricas"])
+
+
+# ---------------------------------------------------
+# 1️⃣ MÉTRICAS EN FORMATO PROMETHEUS
+# ---------------------------------------------------
+@router.get("/metrics", response_class=PlainTextResponse)
+async def exponer_metricas():
+    # estado de los componentes: se lee al momento del scrape
+    gauges = [
+        ("db_pool", "Estado y contadores del pool de conexiones.", database.pool.metrics()),
+        ("db_executor", "Cola e hilos del ejecutor de BD.", database.executor.metrics()),
+        ("correo", "Cola de correo y sesiones SMTP.", correo.despachador.metrics()),
+        ("outbox", "Relay del outbox de notificaciones.", outbox.relay.metrics()),
+        ("hashing", "Servicio de hash de contraseñas.", hashing.servicio.metrics()),
+        ("auth_tokens", "Caché de tokens decodificados.", auth.tokens.metrics()),
+        ("catalogo", "Caché de especialidades y médicos.", catalogo.metrics()),
+        ("indice_disponibilidad", "Índice de disponibilidad en memoria.", indice.metrics()),
+    ]
+    return PlainTextResponse(
+        metricas.registro.prometheus(gauges),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
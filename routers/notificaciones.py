@@ -1,24 +1,17 @@
-from fastapi import APIRouter, HTTPException
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, EmailStr
-from decouple import config
 
-router = APIRouter(prefix="/notificaciones", tags=["Notificaciones"])
+from almacen import almacen
+from database import run_db
+from services import correo, outbox, recordatorios
+from services.plantillas import plantillas
 
-# ---------------------------------------------------
-# CONFIGURACIÓN DEL SERVIDOR DE CORREO
-# ---------------------------------------------------
-conf = ConnectionConfig(
-    MAIL_USERNAME=config("MAIL_USERNAME"),
-    MAIL_PASSWORD=config("MAIL_PASSWORD"),
-    MAIL_FROM=config("MAIL_FROM"),
-    MAIL_PORT=config("MAIL_PORT", cast=int),
-    MAIL_SERVER=config("MAIL_SERVER"),
-    MAIL_FROM_NAME=config("MAIL_FROM_NAME"),
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-)
+# Los correos se encolan y los envía services.correo en segundo plano (202).
+# Las citas creadas, reprogramadas y canceladas ya avisan solas vía
+# services.outbox; estos endpoints quedan para envíos manuales.
+router = APIRouter(prefix="/notificaciones", tags=["Notificaciones"])
 
 # ---------------------------------------------------
 # MODELOS
@@ -41,59 +34,31 @@ class NotificacionCitaCancelada(BaseModel):
 # ---------------------------------------------------
 # 1️⃣ CONFIRMACIÓN DE CITA
 # ---------------------------------------------------
-@router.post("/cita-confirmada")
+@router.post("/cita-confirmada", status_code=202)
 async def enviar_confirmacion_cita(data: NotificacionCita):
-    mensaje = MessageSchema(
-        subject="✅ Confirmación de cita médica - MediciCol",
-        recipients=[data.correo],
-        body=f"""
-        Hola {data.nombre_usuario},
-
-        Tu cita médica ha sido confirmada:
-        🩺 Médico: {data.medico}
-        📅 Fecha: {data.fecha}
-        ⏰ Hora: {data.hora}
-
-        ¡Te esperamos puntual!
-        """,
-        subtype="plain"
-    )
-
-    fm = FastMail(conf)
-    try:
-        await fm.send_message(mensaje)
-        return {"message": "📨 Correo de confirmación enviado correctamente"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al enviar correo: {e}")
+    id_envio = correo.enviar(plantillas.mensaje("cita_confirmada", [data.correo], **data.model_dump()))
+    return {"message": "📨 Correo de confirmación en cola de envío", "id_envio": id_envio}
 
 
 # ---------------------------------------------------
 # 2️⃣ RECORDATORIO DE CITA
 # ---------------------------------------------------
-@router.post("/recordatorio")
+@router.post("/recordatorio", status_code=202)
 async def enviar_recordatorio_cita(data: NotificacionCita):
-    mensaje = MessageSchema(
-        subject="⏰ Recordatorio de cita médica - MediciCol",
-        recipients=[data.correo],
-        body=f"""
-        Hola {data.nombre_usuario},
-
-        Este es un recordatorio de tu cita médica:
-        🩺 Médico: {data.medico}
-        📅 Fecha: {data.fecha}
-        ⏰ Hora: {data.hora}
-
-        ¡No faltes! Recuerda llegar unos minutos antes.
-        """,
-        subtype="plain"
-    )
-
-    fm = FastMail(conf)
-    try:
-        await fm.send_message(mensaje)
-        return {"message": "📨 Correo de recordatorio enviado correctamente"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al enviar correo: {e}")
+    id_envio = correo.enviar(plantillas.mensaje("recordatorio", [data.correo], **data.model_dump()))
+    return {"message": "📨 Correo de recordatorio en cola de envío", "id_envio": id_envio}
+
+
+# ---------------------------------------------------
+# 2️⃣.1️⃣ RECORDATORIOS EN LOTE (TODAS LAS CITAS DE UNA FECHA)
+# ---------------------------------------------------
+@router.post("/recordatorios")
+async def enviar_recordatorios(fecha: date | None = None):
+    # por defecto las citas de mañana; las que ya tienen recordatorio se omiten
+    informe = await recordatorios.enviar_lote(fecha)
+    if informe is None:
+        raise HTTPException(status_code=409, detail="Ya hay un envío de recordatorios en curso para esa fecha")
+    return informe
 
 
 # ---------------------------------------------------
@@ -108,70 +73,34 @@ class NotificacionCambio(BaseModel):
     nueva_hora: str | None = None
 
 
-@router.post("/cita-cambio")
+@router.post("/cita-cambio", status_code=202)
 async def enviar_cambio_cita(data: NotificacionCambio):
-    if data.motivo == "cancelada":
-        body = f"""
-        Hola {data.nombre_usuario},
-
-        Lamentamos informarte que tu cita médica con {data.medico} ha sido cancelada.
-        Por favor, comunícate con nosotros si deseas reagendarla.
-
-        Equipo MediciCol 💙
-        """
-    else:
-        body = f"""
-        Hola {data.nombre_usuario},
-
-        Tu cita médica con {data.medico} ha sido reprogramada:
-        📅 Nueva fecha: {data.nueva_fecha}
-        ⏰ Nueva hora: {data.nueva_hora}
-
-        Equipo MediciCol 💙
-        """
-
-    mensaje = MessageSchema(
-        subject=f"🔄 Cita {data.motivo} - MediciCol",
-        recipients=[data.correo],
-        body=body,
-        subtype="plain"
-    )
-
-    fm = FastMail(conf)
-    try:
-        await fm.send_message(mensaje)
-        return {"message": f"📨 Correo de cita {data.motivo} enviado correctamente"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al enviar correo: {e}")
+    nombre = "cambio_cancelada" if data.motivo == "cancelada" else "cambio_reprogramada"
+    id_envio = correo.enviar(plantillas.mensaje(nombre, [data.correo], **data.model_dump()))
+    return {"message": f"📨 Correo de cita {data.motivo} en cola de envío", "id_envio": id_envio}
 
 
 ###Cita cancelada
-@router.post("/cita-cancelada")
+@router.post("/cita-cancelada", status_code=202)
 async def enviar_cita_cancelada(data: NotificacionCitaCancelada):
 
-    mensaje = MessageSchema(
-        subject="❌ Tu cita ha sido cancelada - MediciCol",
-        recipients=[data.correo],
-        body=f"""
-        Hola {data.nombre_usuario},
-
-        Queremos informarte que tu cita ha sido cancelada:
-        
-        🩺 Médico: {data.medico}
-        📅 Fecha: {data.fecha}
-        ⏰ Hora: {data.hora}
-
-        Si deseas volver a agendar la cita, puedes hacerlo desde nuestra plataforma
-        o contactando al equipo de soporte.
-
-        Equipo MediciCol 💙
-        """,
-        subtype="plain"
-    )
-
-    fm = FastMail(conf)
-    try:
-        await fm.send_message(mensaje)
-        return {"message": "📨 Notificación de cita cancelada enviada correctamente"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al enviar correo: {e}")
+    id_envio = correo.enviar(plantillas.mensaje("cita_cancelada", [data.correo], **data.model_dump()))
+    return {"message": "📨 Notificación de cita cancelada en cola de envío", "id_envio": id_envio}
+
+
+# ---------------------------------------------------
+# ESTADO DE LA COLA DE CORREO
+# ---------------------------------------------------
+@router.get("/cola")
+async def estado_cola(fallidos: int = Query(50, ge=1, le=500)):
+    columnas = ("id", "para", "asunto", "intentos", "error", "encolado", "descartado")
+    filas = await run_db(_correos_fallidos, fallidos)
+    return {
+        **correo.despachador.metrics(),
+        "fallidos": [dict(zip(columnas, f)) for f in filas],
+        "outbox": outbox.relay.metrics(),
+    }
+
+
+def _correos_fallidos(conn, limite):
+    return almacen.correos_fallidos(conn.cursor(), limite)
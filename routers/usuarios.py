@@ -1,13 +1,9 @@
-import jwt
-from datetime import datetime, timedelta, timezone
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
-from database import get_connection
-import hashlib
-
-SECRET_KEY = "SECRET_MEDICICOL_ACCESTOKEN_KEY"  # cámbiala por algo más seguro
-ALGORITHM = "HS256"
-TOKEN_EXPIRE_HOURS = 1
+from almacen import almacen
+from database import run_db
+from services import hashing
+from services.auth import crear_token, guardar_sesion, usuario_actual
 
 router = APIRouter(prefix="/usuarios", tags=["Usuarios"])
 
@@ -30,34 +26,29 @@ class UsuarioEditar(BaseModel):
 
 # ---- 1️⃣ Registrar usuario ----
 @router.post("/registro")
-def registrar_usuario(usuario: Usuario):
-    conn = get_connection()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Error de conexión con la base de datos")
-
-    cursor = conn.cursor()
-
+async def registrar_usuario(usuario: Usuario):
     # Validar que las contraseñas coincidan
     if usuario.contrasena != usuario.contrasena2:
         raise HTTPException(status_code=400, detail="Las contraseñas no coinciden")
 
-    # Encriptar las contraseñas
-    hashed_pass = hashlib.sha256(usuario.contrasena.encode()).hexdigest()
-    hashed_pass2 = hashlib.sha256(usuario.contrasena2.encode()).hexdigest()
+    # Encriptar las contraseñas (KDF fuera del event loop)
+    hashed_pass = await hashing.servicio.hash(usuario.contrasena)
+    return await run_db(_registrar_usuario, usuario, hashed_pass, hashed_pass)
+
+
+def _registrar_usuario(conn, usuario: Usuario, hashed_pass: str, hashed_pass2: str):
+    cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            INSERT INTO Usuarios (nombre, cedula, correo, contrasena, genero, rol, contrasena2)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (usuario.nombre, usuario.cedula, usuario.correo,
-              hashed_pass, usuario.genero, usuario.rol, hashed_pass2))
+        almacen.crear_usuario(cursor, usuario.nombre, usuario.cedula, usuario.correo,
+                              hashed_pass, usuario.genero, usuario.rol, hashed_pass2)
         conn.commit()
         return {"message": "✅ Usuario registrado exitosamente"}
     except Exception as e:
         conn.rollback()
+        if almacen.es_duplicado(e):
+            raise HTTPException(status_code=400, detail="❌ Ya existe un usuario con ese correo")
         raise HTTPException(status_code=400, detail=f"Error al registrar usuario: {e}")
-    finally:
-        conn.close()
 
 # ---- 2️⃣ Login ----
 class LoginData(BaseModel):
@@ -65,23 +56,8 @@ class LoginData(BaseModel):
     contrasena: str
 
 @router.post("/login")
-def login(data: LoginData, response: Response):
-
-    conn = get_connection()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Error de conexión con la base de datos")
-
-    cursor = conn.cursor()
-
-    hashed_pass = hashlib.sha256(data.contrasena.encode()).hexdigest()
-
-    cursor.execute(
-        "SELECT id_usuario, nombre, correo, rol FROM Usuarios WHERE correo=? AND contrasena=?", 
-        (data.correo, hashed_pass)
-    )
-
-    user = cursor.fetchone()
-    conn.close()
+async def login(data: LoginData, response: Response):
+    user = await hashing.autenticar(data.correo, data.contrasena)
 
     if not user:
         raise HTTPException(status_code=401, detail="Correo o contraseña incorrectos")
@@ -89,29 +65,12 @@ def login(data: LoginData, response: Response):
     # ------------------------------
     # 1. CREAR TOKEN JWT
     # ------------------------------
-    payload = {
-        "id": user[0],
-        "nombre": user[1],
-        "correo": user[2],
-        "rol": user[3],
-        "exp": datetime.now(timezone.utc) + timedelta(hours=TOKEN_EXPIRE_HOURS)
-        # "exp": datetime.utcnow() + timedelta(minutes=1)
-    }
-
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    token = crear_token(*user)
 
     # ------------------------------
     # 2. GUARDAR TOKEN EN COOKIE HTTPONLY
     # ------------------------------
-    response.set_cookie(
-        key="access_token",
-        value=token,
-        httponly=True,
-        secure=False,         # activar solo si usas HTTPS. Si estás en local -> poner False
-        samesite="lax",
-        max_age=60 * 60 * TOKEN_EXPIRE_HOURS,
-        path="/"
-    )
+    guardar_sesion(response, token)
 
     # ------------------------------
     # 3. RETORNAR INFO DEL USUARIO
@@ -126,20 +85,26 @@ def login(data: LoginData, response: Response):
         }
     }
 
+# ---- 2️⃣.1️⃣ Sesión actual (solo con el token, sin consultar la BD) ----
+@router.get("/me")
+async def sesion_actual(usuario=Depends(usuario_actual)):
+    return {
+        "id": usuario["id"],
+        "nombre": usuario["nombre"],
+        "correo": usuario["correo"],
+        "rol": usuario["rol"]
+    }
+
 # ---- 3️⃣ Obtener perfil ----
 @router.get("/{id_usuario}")
-def obtener_perfil(id_usuario: int):
-    conn = get_connection()
-    cursor = conn.cursor()
+async def obtener_perfil(id_usuario: int):
+    return await run_db(_obtener_perfil, id_usuario)
 
-    cursor.execute("""
-        SELECT nombre, cedula, correo, genero, rol, fecha_registro
-        FROM Usuarios
-        WHERE id_usuario=?
-    """, id_usuario)
 
-    user = cursor.fetchone()
-    conn.close()
+def _obtener_perfil(conn, id_usuario: int):
+    cursor = conn.cursor()
+
+    user = almacen.perfil_usuario(cursor, id_usuario)
 
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
@@ -148,45 +113,35 @@ def obtener_perfil(id_usuario: int):
     return dict(zip(keys, user))
 
 @router.put("/{id_usuario}")
-def editar_usuario(id_usuario: int, data: UsuarioEditar):
-    conn = get_connection()
+async def editar_usuario(id_usuario: int, data: UsuarioEditar):
+    return await run_db(_editar_usuario, id_usuario, data)
+
+
+def _editar_usuario(conn, id_usuario: int, data: UsuarioEditar):
     cursor = conn.cursor()
 
-    campos = []
-    valores = []
+    campos = {}
 
     if data.nombre is not None:
-        campos.append("nombre=?")
-        valores.append(data.nombre)
+        campos["nombre"] = data.nombre
 
     if data.cedula is not None:
-        campos.append("cedula=?")
-        valores.append(data.cedula)
+        campos["cedula"] = data.cedula
 
     if data.correo is not None:
-        campos.append("correo=?")
-        valores.append(data.correo)
+        campos["correo"] = data.correo
 
     if data.genero is not None:
-        campos.append("genero=?")
-        valores.append(data.genero)
+        campos["genero"] = data.genero
 
     if len(campos) == 0:
         raise HTTPException(status_code=400, detail="No hay campos válidos para actualizar")
 
-    valores.append(id_usuario)
-
-    query = f"""
-        UPDATE Usuarios 
-        SET {", ".join(campos)}
-        WHERE id_usuario=?
-    """
-
     try:
-        cursor.execute(query, valores)
+        actualizados = almacen.actualizar_usuario(cursor, id_usuario, campos)
         conn.commit()
 
-        if cursor.rowcount == 0:
+        if actualizados == 0:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
         return {"message": "✅ Usuario actualizado correctamente"}
@@ -194,6 +149,3 @@ def editar_usuario(id_usuario: int, data: UsuarioEditar):
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=400, detail=f"Error al editar usuario: {e}")
-
-    finally:
-        conn.close()
\ No newline at end of file
@@ -0,0 +1,375 @@
+from almacen import sqlite
+
+# ---------------------------------------------------
+# ESQUEMA VERSIONADO
+# ---------------------------------------------------
+# Migraciones numeradas que se aplican en orden al arrancar la app (ver
+# main.lifespan) y quedan registradas en EsquemaVersion: cada una corre una
+# sola vez por base. Cada migración trae su DDL para SQL Server y para
+# DB_BACKEND=sqlite; una base nueva o existente termina con el mismo esquema.
+# Para cambiar el esquema se agrega una migración al final, nunca se edita
+# una ya publicada.
+
+# Versión 1: tablas auxiliares del backend (idempotente: las bases que ya las
+# tenían solo quedan registradas)
+DDL = [
+    # Resumen diario de citas por médico y estado (lo mantiene services/resumenes.py)
+    """
+    IF OBJECT_ID('dbo.CitasResumenDiario', 'U') IS NULL
+    CREATE TABLE dbo.CitasResumenDiario (
+        fecha DATE NOT NULL,
+        id_medico INT NOT NULL,
+        estado NVARCHAR(50) NOT NULL,
+        total INT NOT NULL,
+        CONSTRAINT PK_CitasResumenDiario PRIMARY KEY (fecha, id_medico, estado)
+    )
+    """,
+    # Recordatorios ya enviados por cita y fecha (evita duplicados al relanzar el lote)
+    """
+    IF OBJECT_ID('dbo.RecordatoriosEnviados', 'U') IS NULL
+    CREATE TABLE dbo.RecordatoriosEnviados (
+        id_cita INT NOT NULL,
+        fecha DATE NOT NULL,
+        enviado DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        CONSTRAINT PK_RecordatoriosEnviados PRIMARY KEY (id_cita, fecha)
+    )
+    """,
+    # Outbox de notificaciones: se escribe en la misma transacción que la cita
+    # y lo drena services/outbox.py hacia la cola de correo
+    """
+    IF OBJECT_ID('dbo.NotificacionesOutbox', 'U') IS NULL
+    CREATE TABLE dbo.NotificacionesOutbox (
+        id_evento BIGINT IDENTITY(1,1) NOT NULL CONSTRAINT PK_NotificacionesOutbox PRIMARY KEY,
+        tipo NVARCHAR(50) NOT NULL,
+        id_cita INT NOT NULL,
+        id_usuario INT NOT NULL,
+        id_medico INT NOT NULL,
+        fecha DATE NOT NULL,
+        hora TIME NOT NULL,
+        creado DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        intentos INT NOT NULL DEFAULT 0,
+        bloqueado_hasta DATETIME2 NULL,
+        enviado DATETIME2 NULL
+    )
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_NotificacionesOutbox_pendientes')
+    CREATE INDEX IX_NotificacionesOutbox_pendientes
+        ON dbo.NotificacionesOutbox (id_evento) WHERE enviado IS NULL
+    """,
+    # Un turno (médico, fecha, hora) solo puede tener una cita: respaldo de
+    # services/reservas.py. Si ya hay duplicados se omite hasta depurarlos.
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_Citas_medico_fecha_hora')
+       AND NOT EXISTS (SELECT 1 FROM dbo.Citas GROUP BY id_medico, fecha, hora HAVING COUNT(*) > 1)
+    CREATE UNIQUE INDEX UX_Citas_medico_fecha_hora ON dbo.Citas (id_medico, fecha, hora)
+    """,
+    # Agenda del médico (GET /medicos/{id}/citas) y choques de turno: si el
+    # índice único no se pudo crear por duplicados, uno normal con la misma clave
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE name IN ('UX_Citas_medico_fecha_hora', 'IX_Citas_medico_fecha_hora'))
+    CREATE INDEX IX_Citas_medico_fecha_hora ON dbo.Citas (id_medico, fecha, hora)
+        INCLUDE (estado, id_usuario)
+    """,
+    # Feriados y excepciones por médico y fecha (sin horas = día completo)
+    """
+    IF OBJECT_ID('dbo.DisponibilidadExcepciones', 'U') IS NULL
+    CREATE TABLE dbo.DisponibilidadExcepciones (
+        id_excepcion INT IDENTITY(1,1) NOT NULL CONSTRAINT PK_DisponibilidadExcepciones PRIMARY KEY,
+        id_medico INT NOT NULL,
+        fecha DATE NOT NULL,
+        hora_inicio TIME NULL,
+        hora_fin TIME NULL,
+        motivo NVARCHAR(200) NULL
+    )
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DisponibilidadExcepciones_medico_fecha')
+    CREATE INDEX IX_DisponibilidadExcepciones_medico_fecha
+        ON dbo.DisponibilidadExcepciones (id_medico, fecha)
+    """,
+]
+
+
+# Versión 2: índices de las consultas calientes. Las columnas INCLUDE cubren
+# lo que lee cada consulta para que no vuelva a la tabla por cada fila.
+INDICES_SQLSERVER = [
+    # listados de citas (admin, /citas) ordenados por fecha y hora, filtros por
+    # rango de fechas, recordatorios del día y la serie por día de estadísticas
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Citas_fecha_hora')
+    CREATE INDEX IX_Citas_fecha_hora ON dbo.Citas (fecha, hora, id_cita)
+        INCLUDE (id_usuario, id_medico, id_especialidad, estado)
+    """,
+    # citas de un paciente
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Citas_usuario_fecha_hora')
+    CREATE INDEX IX_Citas_usuario_fecha_hora ON dbo.Citas (id_usuario, fecha, hora)
+        INCLUDE (id_medico, id_especialidad, estado)
+    """,
+    # desglose por especialidad y estado de /admin/estadisticas
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Citas_especialidad_estado')
+    CREATE INDEX IX_Citas_especialidad_estado ON dbo.Citas (id_especialidad, estado)
+    """,
+    # login (hashing.autenticar) y registro
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Usuarios_correo')
+    CREATE INDEX IX_Usuarios_correo ON dbo.Usuarios (correo)
+        INCLUDE (nombre, rol, contrasena)
+    """,
+    # JOIN Medicos.correo = Usuarios.correo de admin.editar_medico
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Medicos_correo')
+    CREATE INDEX IX_Medicos_correo ON dbo.Medicos (correo)
+    """,
+    # médicos de una especialidad (disponibles, índice de disponibilidad)
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Medicos_especialidad')
+    CREATE INDEX IX_Medicos_especialidad ON dbo.Medicos (id_especialidad)
+        INCLUDE (nombre)
+    """,
+    # franjas de un médico (perfil, plantilla semanal, disponibles)
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DisponibilidadMedica_medico')
+    CREATE INDEX IX_DisponibilidadMedica_medico ON dbo.DisponibilidadMedica (id_medico, dia_semana)
+        INCLUDE (hora_inicio, hora_fin)
+    """,
+]
+# SQLite no tiene INCLUDE; la clave primaria (rowid) ya va al final de cada índice,
+# así que las búsquedas por igualdad salen ordenadas por id_cita / id_medico
+INDICES_SQLITE = """
+CREATE INDEX IF NOT EXISTS IX_Citas_fecha_hora ON Citas (fecha, hora);
+CREATE INDEX IF NOT EXISTS IX_Citas_usuario_fecha_hora ON Citas (id_usuario, fecha, hora);
+CREATE INDEX IF NOT EXISTS IX_Citas_especialidad_estado ON Citas (id_especialidad, estado);
+CREATE INDEX IF NOT EXISTS IX_Usuarios_correo ON Usuarios (correo);
+CREATE INDEX IF NOT EXISTS IX_Medicos_correo ON Medicos (correo);
+CREATE INDEX IF NOT EXISTS IX_Medicos_especialidad ON Medicos (id_especialidad);
+CREATE INDEX IF NOT EXISTS IX_DisponibilidadMedica_medico
+    ON DisponibilidadMedica (id_medico, dia_semana, hora_inicio, hora_fin);
+"""
+
+# Versión 3: el turno (médico, fecha, hora) pasa a ser único y cubriente en
+# todas las bases. La versión 1 lo omitía si había duplicados; aquí la
+# migración falla (y se reintenta en el próximo arranque) hasta depurarlos.
+TURNO_UNICO_SQLSERVER = [
+    """
+    IF EXISTS (SELECT 1 FROM dbo.Citas GROUP BY id_medico, fecha, hora HAVING COUNT(*) > 1)
+        THROW 50001, N'Citas tiene turnos (id_medico, fecha, hora) duplicados: depúralos para aplicar la versión 3', 1
+    """,
+    """
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_Citas_medico_fecha_hora')
+        CREATE UNIQUE INDEX UX_Citas_medico_fecha_hora ON dbo.Citas (id_medico, fecha, hora)
+            INCLUDE (estado, id_usuario, id_especialidad) WITH (DROP_EXISTING = ON)
+    ELSE
+        CREATE UNIQUE INDEX UX_Citas_medico_fecha_hora ON dbo.Citas (id_medico, fecha, hora)
+            INCLUDE (estado, id_usuario, id_especialidad)
+    """,
+    # el índice no único de la versión 1 queda de más
+    """
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Citas_medico_fecha_hora')
+    DROP INDEX IX_Citas_medico_fecha_hora ON dbo.Citas
+    """,
+]
+
+# Versión 4: contador de usuarios por rol para /admin/estadisticas (lo mantiene
+# el almacén en cada alta, baja o cambio de rol y se reconstruye cada noche con
+# el resumen diario); se llena una vez con lo que ya hay en Usuarios
+USUARIOS_POR_ROL_SQLSERVER = [
+    """
+    IF OBJECT_ID('dbo.UsuariosPorRol', 'U') IS NULL
+    CREATE TABLE dbo.UsuariosPorRol (
+        rol NVARCHAR(50) NOT NULL CONSTRAINT PK_UsuariosPorRol PRIMARY KEY,
+        total INT NOT NULL
+    )
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM dbo.UsuariosPorRol)
+    INSERT INTO dbo.UsuariosPorRol (rol, total)
+    SELECT rol, COUNT(*) FROM dbo.Usuarios WHERE rol IS NOT NULL GROUP BY rol
+    """,
+]
+USUARIOS_POR_ROL_SQLITE = """
+CREATE TABLE IF NOT EXISTS UsuariosPorRol (rol TEXT PRIMARY KEY, total INTEGER NOT NULL);
+INSERT OR IGNORE INTO UsuariosPorRol (rol, total)
+SELECT rol, COUNT(*) FROM Usuarios WHERE rol IS NOT NULL GROUP BY rol;
+"""
+
+# Versión 5: la versión 1 creó CitasResumenDiario vacía y solo la reconstrucción
+# nocturna la llenaba; en una base con citas, las estadísticas salían en cero y
+# los ajustes de -1 la dejaban negativa hasta esa noche. Se recalcula aquí
+# desde Citas, con la misma consulta que almacen.reconstruir_resumen
+# ('Pendiente' = resumenes.ESTADO_INICIAL).
+RESUMEN_INICIAL_SQLSERVER = [
+    "DELETE FROM dbo.CitasResumenDiario",
+    """
+    INSERT INTO dbo.CitasResumenDiario (fecha, id_medico, estado, total)
+    SELECT fecha, id_medico, COALESCE(estado, N'Pendiente'), COUNT(*)
+    FROM dbo.Citas
+    GROUP BY fecha, id_medico, COALESCE(estado, N'Pendiente')
+    """,
+]
+RESUMEN_INICIAL_SQLITE = """
+DELETE FROM CitasResumenDiario;
+INSERT INTO CitasResumenDiario (fecha, id_medico, estado, total)
+SELECT fecha, id_medico, COALESCE(estado, 'Pendiente'), COUNT(*)
+FROM Citas
+GROUP BY fecha, id_medico, COALESCE(estado, 'Pendiente');
+"""
+
+# Versión 6: correos que el despachador descarta tras agotar los intentos
+# (services/correo.py). Antes vivían en una cola en memoria que se perdía al
+# reiniciar; aquí guardan el mensaje completo para reenviarlo.
+CORREOS_FALLIDOS_SQLSERVER = [
+    """
+    IF OBJECT_ID('dbo.CorreosFallidos', 'U') IS NULL
+    CREATE TABLE dbo.CorreosFallidos (
+        id_fallido BIGINT IDENTITY(1,1) NOT NULL CONSTRAINT PK_CorreosFallidos PRIMARY KEY,
+        destinatario NVARCHAR(400) NOT NULL,
+        asunto NVARCHAR(400) NULL,
+        mensaje NVARCHAR(MAX) NOT NULL,
+        intentos INT NOT NULL,
+        error NVARCHAR(MAX) NULL,
+        encolado DATETIME2 NOT NULL,
+        descartado DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+    )
+    """,
+]
+CORREOS_FALLIDOS_SQLITE = """
+CREATE TABLE IF NOT EXISTS CorreosFallidos (
+    id_fallido INTEGER PRIMARY KEY,
+    destinatario TEXT NOT NULL, asunto TEXT, mensaje TEXT NOT NULL, intentos INTEGER NOT NULL,
+    error TEXT, encolado TEXT NOT NULL, descartado TEXT NOT NULL DEFAULT (datetime('now'))
+);
+"""
+
+# Versión 7: el correo identifica al usuario en el login (hashing.autenticar) y
+# en el rehash de su contraseña, así que pasa a ser único. Como en la versión 3,
+# la migración falla (y la API no arranca) hasta depurar los duplicados; el
+# índice no único de la versión 2 queda de más.
+CORREO_UNICO_SQLSERVER = [
+    """
+    IF EXISTS (SELECT 1 FROM dbo.Usuarios WHERE correo IS NOT NULL GROUP BY correo HAVING COUNT(*) > 1)
+        THROW 50002, N'Usuarios tiene correos duplicados: depúralos para aplicar la versión 7', 1
+    """,
+    """
+    IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_Usuarios_correo')
+    CREATE UNIQUE INDEX UX_Usuarios_correo ON dbo.Usuarios (correo)
+        INCLUDE (nombre, rol, contrasena) WHERE correo IS NOT NULL
+    """,
+    """
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Usuarios_correo')
+    DROP INDEX IX_Usuarios_correo ON dbo.Usuarios
+    """,
+]
+# en SQLite los NULL no chocan en un índice único y un duplicado hace fallar el script
+CORREO_UNICO_SQLITE = """
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Usuarios_correo ON Usuarios (correo);
+DROP INDEX IF EXISTS IX_Usuarios_correo;
+"""
+
+# (versión, descripción, DDL de SQL Server, script de SQLite)
+MIGRACIONES = [
+    (1, "tablas auxiliares del backend", DDL, sqlite.ESQUEMA + sqlite.INDICES_CITAS),
+    (2, "índices de las consultas calientes", INDICES_SQLSERVER, INDICES_SQLITE),
+    # en SQLite el índice único existe desde la versión 1
+    (3, "turno único y cubriente en Citas", TURNO_UNICO_SQLSERVER, ""),
+    (4, "usuarios por rol", USUARIOS_POR_ROL_SQLSERVER, USUARIOS_POR_ROL_SQLITE),
+    (5, "resumen diario calculado desde Citas", RESUMEN_INICIAL_SQLSERVER, RESUMEN_INICIAL_SQLITE),
+    (6, "correos fallidos", CORREOS_FALLIDOS_SQLSERVER, CORREOS_FALLIDOS_SQLITE),
+    (7, "correo único en Usuarios", CORREO_UNICO_SQLSERVER, CORREO_UNICO_SQLITE),
+]
+VERSION_ACTUAL = MIGRACIONES[-1][0]
+
+VERSIONES_SQLSERVER = """
+IF OBJECT_ID('dbo.EsquemaVersion', 'U') IS NULL
+CREATE TABLE dbo.EsquemaVersion (
+    version INT NOT NULL CONSTRAINT PK_EsquemaVersion PRIMARY KEY,
+    descripcion NVARCHAR(200) NOT NULL,
+    aplicada DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+)
+"""
+VERSIONES_SQLITE = """
+CREATE TABLE IF NOT EXISTS EsquemaVersion (
+    version INTEGER PRIMARY KEY,
+    descripcion TEXT NOT NULL,
+    aplicada TEXT NOT NULL DEFAULT (datetime('now'))
+);
+"""
+
+
+def version_actual(conn):
+    """Última versión aplicada en esta base (0 si no hay registro)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(version) FROM EsquemaVersion")
+    fila = cursor.fetchone()
+    return (fila[0] if fila else None) or 0
+
+
+def asegurar_esquema(conn):
+    """Aplica las migraciones pendientes; devuelve las versiones aplicadas."""
+    if getattr(conn, "dialecto", "sqlserver") == "sqlite":
+        return migrar_sqlite(conn)
+
+    cursor = conn.cursor()
+    cursor.execute(VERSIONES_SQLSERVER)
+    conn.commit()
+    cursor.execute("SELECT version FROM dbo.EsquemaVersion")
+    aplicadas = {r[0] for r in cursor.fetchall()}
+
+    nuevas = []
+    for version, descripcion, ddl, _ in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        try:
+            # varias instancias arrancando a la vez: una aplica y las demás
+            # esperan el bloqueo (se libera con el commit) y la encuentran hecha
+            cursor.execute("""
+                DECLARE @r INT;
+                EXEC @r = sp_getapplock @Resource = 'medicicol_esquema', @LockMode = 'Exclusive',
+                                        @LockTimeout = 60000;
+                IF @r < 0 THROW 50000, 'No se obtuvo el bloqueo de migraciones', 1;
+            """)
+            cursor.execute("SELECT 1 FROM dbo.EsquemaVersion WHERE version = ?", (version,))
+            if cursor.fetchone() is None:
+                for sentencia in ddl:
+                    cursor.execute(sentencia)
+                cursor.execute(
+                    "INSERT INTO dbo.EsquemaVersion (version, descripcion) VALUES (?, ?)",
+                    (version, descripcion),
+                )
+                nuevas.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    _informar(nuevas)
+    return nuevas
+
+
+def migrar_sqlite(conn):
+    """Igual que asegurar_esquema para DB_BACKEND=sqlite (también lo usa la siembra de benchmarks)."""
+    conn.executescript(VERSIONES_SQLITE)
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM EsquemaVersion")
+    aplicadas = {r[0] for r in cursor.fetchall()}
+
+    nuevas = []
+    for version, descripcion, _, script in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        # DDL y registro en una sola transacción; IMMEDIATE serializa arranques concurrentes
+        conn.executescript(
+            f"BEGIN IMMEDIATE;\n{script}\n"
+            f"INSERT OR IGNORE INTO EsquemaVersion (version, descripcion) "
+            f"VALUES ({version}, '{descripcion.replace(chr(39), chr(39) * 2)}');\nCOMMIT;"
+        )
+        nuevas.append(version)
+    _informar(nuevas)
+    return nuevas
+
+
+def _informar(nuevas):
+    if nuevas:
+        print(f"🗂️ Esquema actualizado a la versión {VERSION_ACTUAL} (aplicadas: {nuevas})")
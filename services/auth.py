@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from fastapi import Cookie, Depends, HTTPException, Response
+
+SECRET_KEY = os.getenv("JWT_SECRET", "SECRET_MEDICICOL_ACCESTOKEN_KEY")  # cámbiala por algo más seguro
+ALGORITHM = "HS256"
+TOKEN_EXPIRE_HOURS = 1
+
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", 10_000))
+
+
+def crear_token(id_usuario, nombre, correo, rol):
+    payload = {
+        "id": id_usuario,
+        "nombre": nombre,
+        "correo": correo,
+        "rol": rol,
+        "exp": datetime.now(timezone.utc) + timedelta(hours=TOKEN_EXPIRE_HOURS)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+class TokenCache:
+    """Claims ya verificados por token; cada entrada vive hasta el `exp` del propio token."""
+
+    def __init__(self, max_entradas=AUTH_CACHE_MAX):
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()   # token -> (exp, claims)
+        self._stats = {"hits": 0, "misses": 0, "invalidos": 0}
+
+    def verificar(self, token):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._tokens.get(token)
+            if entrada is not None:
+                if entrada[0] > ahora:
+                    self._tokens.move_to_end(token)
+                    self._stats["hits"] += 1
+                    return entrada[1]
+                del self._tokens[token]
+            self._stats["misses"] += 1
+
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            self._contar("invalidos")
+            raise HTTPException(status_code=401, detail="La sesión expiró, inicia sesión de nuevo")
+        except jwt.InvalidTokenError:
+            self._contar("invalidos")
+            raise HTTPException(status_code=401, detail="Token inválido")
+
+        with self._lock:
+            self._tokens[token] = (claims.get("exp", ahora), claims)
+            while len(self._tokens) > self.max_entradas:
+                self._tokens.popitem(last=False)
+        return claims
+
+    def _contar(self, clave):
+        with self._lock:
+            self._stats[clave] += 1
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {"entradas": len(self._tokens), **self._stats}
+
+
+tokens = TokenCache()
+
+
+def guardar_sesion(response: Response, token):
+    """Deja el JWT en la cookie httponly access_token que leen las dependencias de abajo."""
+    response.set_cookie(
+        key="access_token",
+        value=token,
+        httponly=True,
+        secure=False,         # activar solo si usas HTTPS. Si estás en local -> poner False
+        samesite="lax",
+        max_age=60 * 60 * TOKEN_EXPIRE_HOURS,
+        path="/"
+    )
+
+
+# ---------------------------------------------------
+# DEPENDENCIAS FASTAPI
+# ---------------------------------------------------
+def usuario_actual(access_token: str | None = Cookie(None)):
+    """Claims del JWT de la cookie access_token; no consulta Usuarios."""
+    if not access_token:
+        raise HTTPException(status_code=401, detail="No autenticado")
+    return tokens.verificar(access_token)
+
+
+def requiere_rol(*roles):
+    """Dependencia que exige uno de los roles (paciente / medico / admin) según el token."""
+    def verificar(usuario=Depends(usuario_actual)):
+        if usuario.get("rol") not in roles:
+            raise HTTPException(status_code=403, detail="No tienes permisos para esta acción")
+        return usuario
+    return verificar
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Caché pequeña en memoria con expiración por tiempo y tope LRU."""
+
+    def __init__(self, ttl, max_entradas=256):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()   # clave -> (expira, valor)
+        self._cargas = {}             # clave -> asyncio.Lock: una sola carga en vuelo por clave
+        self._stats = {"hits": 0, "misses": 0, "cargas": 0}
+
+    def get(self, clave, defecto=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                self._datos.pop(clave, None)
+                self._stats["misses"] += 1
+                return defecto
+            self._datos.move_to_end(clave)
+            self._stats["hits"] += 1
+            return entrada[1]
+
+    async def obtener(self, clave, cargar):
+        """Valor de `clave`; si falta o venció, `await cargar()` una sola vez aunque lo pidan muchos."""
+        valor = self.get(clave)
+        if valor is not None:
+            return valor
+        async with self._cargas.setdefault(clave, asyncio.Lock()):
+            valor = self.get(clave)   # otra petición pudo cargarlo mientras esperábamos
+            if valor is None:
+                valor = await cargar()
+                self.set(clave, valor)
+                with self._lock:
+                    self._stats["cargas"] += 1
+        return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {"entradas": len(self._datos), **self._stats}
@@ -0,0 +1,66 @@
+from datetime import date
+
+from services.horarios import a_hora, a_minutos, bloqueos_por_medico, restar_bloqueos
+from services.resumenes import dias_del_rango
+
+# Calendario de varios médicos en formato columnar: cada sección es un objeto
+# de listas paralelas (una lista por campo), no una lista de objetos.
+
+
+def _hhmm(valor):
+    return a_hora(a_minutos(valor)).strftime("%H:%M")
+
+
+def armar(franjas, filas, nombres_dias, desde, hasta):
+    """Cruza franjas semanales con citas y excepciones del rango.
+
+    franjas: (id_medico, nombre, dia_semana | None, hora_inicio, hora_fin)
+    filas:   (tipo, id_medico, fecha, hora | hora_inicio, hora_fin | None, id_cita | None, estado)
+             con tipo 0 = cita y 1 = excepción
+    """
+    medicos = {"id_medico": [], "nombre": []}
+    vistos = set()
+    semanal = {}   # dia_semana -> [(id_medico, nombre, inicio, fin)]
+    for id_medico, nombre, dia, inicio, fin in franjas:
+        if id_medico not in vistos:
+            vistos.add(id_medico)
+            medicos["id_medico"].append(id_medico)
+            medicos["nombre"].append(nombre)
+        if dia is not None:
+            semanal.setdefault(dia, []).append((id_medico, nombre, inicio, fin))
+
+    citas = {"id_cita": [], "id_medico": [], "fecha": [], "hora": [], "estado": []}
+    excepciones = {}   # fecha -> [(id_medico, inicio, fin)]
+    for tipo, id_medico, fecha, inicio, fin, id_cita, estado in filas:
+        fecha = str(fecha)[:10]
+        if tipo == 0:
+            citas["id_cita"].append(id_cita)
+            citas["id_medico"].append(id_medico)
+            citas["fecha"].append(fecha)
+            citas["hora"].append(_hhmm(inicio))
+            citas["estado"].append(estado)
+        else:
+            excepciones.setdefault(fecha, []).append((id_medico, inicio, fin))
+
+    disponibilidad = {"id_medico": [], "fecha": [], "hora_inicio": [], "hora_fin": []}
+    for dia in dias_del_rango(desde, hasta):
+        fecha = dia.isoformat()
+        del_dia = semanal.get(nombres_dias[dia.isoweekday()], [])
+        if not del_dia:
+            continue
+        for id_medico, _, inicio, fin in sorted(
+            restar_bloqueos(del_dia, bloqueos_por_medico(excepciones.get(fecha, []))),
+            key=lambda f: (f[0], a_minutos(f[2])),
+        ):
+            disponibilidad["id_medico"].append(id_medico)
+            disponibilidad["fecha"].append(fecha)
+            disponibilidad["hora_inicio"].append(_hhmm(inicio))
+            disponibilidad["hora_fin"].append(_hhmm(fin))
+
+    return {
+        "desde": desde.isoformat() if isinstance(desde, date) else desde,
+        "hasta": hasta.isoformat() if isinstance(hasta, date) else hasta,
+        "medicos": medicos,
+        "disponibilidad": disponibilidad,
+        "citas": citas,
+    }
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from almacen import almacen
+from database import run_db
+
+# Datos de referencia (especialidades y directorio de médicos) en memoria.
+# Cambian pocas veces al mes, así que se cargan enteros en dos consultas y se
+# sirven ya serializados con ETag. Los endpoints que escriben llaman a
+# invalidar() después del commit; el TTL cubre cambios hechos por otra
+# instancia o directamente en la BD.
+
+CATALOGO_TTL = float(os.getenv("CATALOGO_TTL", 300))
+
+NO_ENCONTRADO = object()
+
+
+def _serializar(datos):
+    # mismo formato que JSONResponse
+    return json.dumps(jsonable_encoder(datos), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _etag(cuerpo):
+    # depende solo del contenido: igual entre reinicios e instancias
+    return f'"{hashlib.blake2b(cuerpo, digest_size=8).hexdigest()}"'
+
+
+def _coincide(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidatos or any(c.removeprefix("W/") == etag for c in candidatos)
+
+
+def cargar(conn):
+    especialidades, medicos = almacen.catalogo(conn.cursor())
+    keys = ["id_medico", "nombre", "cedula", "correo", "telefono", "id_especialidad", "especialidad"]
+    return (
+        [{"id_especialidad": r[0], "nombre": r[1]} for r in especialidades],
+        [dict(zip(keys, r)) for r in medicos],
+    )
+
+
+class Catalogo:
+    """Caché de lectura versionada: cada invalidar() sube la versión y descarta la foto."""
+
+    def __init__(self, ttl=CATALOGO_TTL, cargador=None):
+        self.ttl = ttl
+        self.cargador = cargador or (lambda: run_db(cargar))
+        self._lock = threading.Lock()   # invalidar() llega desde los hilos de run_db
+        self._carga = asyncio.Lock()    # una sola carga en vuelo
+        self._version = 0
+        self._foto = None               # (version, expira, especialidades, medicos)
+        self._vistas = {}               # clave -> (etag, cuerpo) de la versión actual
+        self._stats = {"hits": 0, "misses": 0, "cargas": 0, "invalidaciones": 0, "no_modificado": 0}
+
+    def invalidar(self):
+        with self._lock:
+            self._version += 1
+            self._foto = None
+            self._vistas.clear()
+            self._stats["invalidaciones"] += 1
+
+    def _vigente(self):
+        foto = self._foto
+        if foto is not None and foto[0] == self._version and foto[1] > time.monotonic():
+            return foto
+        return None
+
+    async def _foto_actual(self):
+        foto = self._vigente()
+        if foto is not None:
+            return foto
+        async with self._carga:
+            foto = self._vigente()   # otra petición pudo cargarla mientras esperábamos
+            if foto is not None:
+                return foto
+            version = self._version
+            especialidades, medicos = await self.cargador()
+            foto = (version, time.monotonic() + self.ttl, especialidades, medicos)
+            with self._lock:
+                self._stats["cargas"] += 1
+                # si alguien invalidó durante la carga, se sirve pero no se guarda
+                if self._version == version:
+                    self._foto = foto
+                    self._vistas.clear()
+            return foto
+
+    async def vista(self, clave, construir):
+        """(etag, cuerpo) de `clave`; construir(especialidades, medicos) arma los datos."""
+        foto = self._vigente()
+        if foto is not None:
+            vista = self._vistas.get(clave)
+            if vista is not None:
+                self._stats["hits"] += 1
+                return vista
+
+        self._stats["misses"] += 1
+        foto = await self._foto_actual()
+        datos = construir(foto[2], foto[3])
+        if datos is NO_ENCONTRADO:
+            return None
+        cuerpo = _serializar(datos)
+        vista = (_etag(cuerpo), cuerpo)
+        with self._lock:
+            if self._foto is foto:
+                self._vistas[clave] = vista
+        return vista
+
+    async def responder(self, request: Request, clave, construir, detalle_404="No encontrado"):
+        vista = await self.vista(clave, construir)
+        if vista is None:
+            raise HTTPException(status_code=404, detail=detalle_404)
+        etag, cuerpo = vista
+        cabeceras = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _coincide(request.headers.get("if-none-match"), etag):
+            self._stats["no_modificado"] += 1
+            return Response(status_code=304, headers=cabeceras)
+        return Response(content=cuerpo, media_type="application/json", headers=cabeceras)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "version": self._version,
+                "cargado": self._foto is not None,
+                "vistas": len(self._vistas),
+                **self._stats,
+            }
+
+
+catalogo = Catalogo()
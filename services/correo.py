@@ -0,0 +1,338 @@
+import asyncio
+import itertools
+import time
+from datetime import datetime, timezone
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formataddr
+
+import aiosmtplib
+from decouple import config
+from fastapi import HTTPException
+
+from almacen import almacen
+from database import run_db
+from services import metricas
+
+# ---------------------------------------------------
+# CONFIGURACIÓN DEL SERVIDOR DE CORREO
+# ---------------------------------------------------
+MAIL_USERNAME = config("MAIL_USERNAME", default="")
+MAIL_PASSWORD = config("MAIL_PASSWORD", default="")
+MAIL_FROM = config("MAIL_FROM", default="no-reply@medicicol.site")
+MAIL_FROM_NAME = config("MAIL_FROM_NAME", default="MediciCol")
+MAIL_SERVER = config("MAIL_SERVER", default="localhost")
+MAIL_PORT = config("MAIL_PORT", default=587, cast=int)
+MAIL_STARTTLS = config("MAIL_STARTTLS", default=True, cast=bool)
+MAIL_SSL_TLS = config("MAIL_SSL_TLS", default=False, cast=bool)
+
+# Sesiones SMTP de larga vida (una por trabajador) y tamaño de la cola en memoria
+CORREO_TRABAJADORES = config("CORREO_TRABAJADORES", default=2, cast=int)
+CORREO_COLA_MAX = config("CORREO_COLA_MAX", default=1000, cast=int)
+CORREO_LOTE_MAX = config("CORREO_LOTE_MAX", default=50, cast=int)
+# Una sesión sin uso se cierra tras este tiempo (los servidores cortan a los ~5 min)
+CORREO_SESION_IDLE = config("CORREO_SESION_IDLE", default=60.0, cast=float)
+CORREO_INTENTOS = config("CORREO_INTENTOS", default=5, cast=int)
+CORREO_BACKOFF = config("CORREO_BACKOFF", default=2.0, cast=float)
+CORREO_BACKOFF_MAX = config("CORREO_BACKOFF_MAX", default=300.0, cast=float)
+
+
+class ColaLlena(Exception):
+    """La cola de correo alcanzó CORREO_COLA_MAX."""
+
+
+class Envio:
+    """Un correo pendiente con su historial de intentos."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, mensaje):
+        self.id = next(self._ids)
+        self.mensaje = mensaje
+        self.intentos = 0
+        self.ultimo_error = None
+        self.encolado = time.time()
+        # True al entregarse, False al descartarse (ver MailDispatcher.entregar)
+        self.resultado = asyncio.get_running_loop().create_future()
+
+    def fila(self):
+        """(destinatario, asunto, mensaje, intentos, error, encolado) para CorreosFallidos."""
+        encolado = datetime.fromtimestamp(self.encolado, timezone.utc)
+        return (self.mensaje["To"], str(self.mensaje["Subject"]), self.mensaje.as_string(),
+                self.intentos, self.ultimo_error, encolado.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def _guardar_fallidos(conn, filas):
+    cursor = conn.cursor()
+    try:
+        almacen.guardar_correos_fallidos(cursor, filas)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+async def guardar_fallidos(envios):
+    """Persiste los correos descartados en CorreosFallidos."""
+    await run_db(_guardar_fallidos, [envio.fila() for envio in envios])
+
+
+REMITENTE = formataddr((MAIL_FROM_NAME, MAIL_FROM))
+
+
+def crear_mensaje(asunto, destinatarios, texto, html=None, remitente=None):
+    """Mensaje MIME en texto plano, o multipart/alternative si hay versión HTML.
+
+    Usa las clases email.mime (política compat32): armar un EmailMessage con
+    la política moderna cuesta ~10 veces más y domina los envíos en lote.
+    """
+    if html is None:
+        mensaje = MIMEText(texto, "plain", "utf-8")
+    else:
+        mensaje = MIMEMultipart("alternative")
+        mensaje.attach(MIMEText(texto, "plain", "utf-8"))
+        mensaje.attach(MIMEText(html, "html", "utf-8"))
+    mensaje["From"] = remitente or REMITENTE
+    mensaje["To"] = ", ".join(destinatarios)
+    mensaje["Subject"] = Header(asunto, "utf-8")
+    return mensaje
+
+
+# ---------------------------------------------------
+# DESPACHADOR
+# ---------------------------------------------------
+class MailDispatcher:
+    """Cola asíncrona de correo atendida por sesiones SMTP persistentes.
+
+    Cada trabajador mantiene su propia conexión (connect + STARTTLS + login una
+    sola vez), toma hasta `lote_max` mensajes seguidos de la cola y los envía
+    por esa misma sesión. Un fallo descarta la sesión y reprograma el mensaje
+    con backoff exponencial; agotados los intentos se descarta y `guardar`
+    (por defecto la tabla CorreosFallidos) lo conserva.
+    """
+
+    def __init__(self, hostname=MAIL_SERVER, port=MAIL_PORT, username=MAIL_USERNAME,
+                 password=MAIL_PASSWORD, start_tls=MAIL_STARTTLS, use_tls=MAIL_SSL_TLS,
+                 trabajadores=CORREO_TRABAJADORES, cola_max=CORREO_COLA_MAX,
+                 lote_max=CORREO_LOTE_MAX, sesion_idle=CORREO_SESION_IDLE,
+                 intentos=CORREO_INTENTOS, backoff=CORREO_BACKOFF,
+                 backoff_max=CORREO_BACKOFF_MAX, guardar=guardar_fallidos):
+        self.smtp_opciones = {
+            "hostname": hostname,
+            "port": port,
+            "username": username or None,
+            "password": password or None,
+            "start_tls": start_tls,
+            "use_tls": use_tls,
+        }
+        self.trabajadores = trabajadores
+        self.cola_max = cola_max
+        self.lote_max = lote_max
+        self.sesion_idle = sesion_idle
+        self.intentos = intentos
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.guardar = guardar
+
+        self._cola = None
+        self._tareas = []
+        self._reintentos = set()
+        # descartados que aún no llegaron a `guardar` (se reintenta con el siguiente)
+        self._sin_guardar = []
+        self._guardado = None
+        self._stats = {"encolados": 0, "enviados": 0, "reintentos": 0, "fallidos": 0,
+                       "rechazados": 0, "sesiones": 0, "lotes": 0, "errores_guardado": 0}
+
+    # --- ciclo de vida -------------------------------------------------
+    def iniciar(self):
+        if self._tareas:
+            return
+        self._cola = asyncio.Queue(maxsize=self.cola_max)
+        self._tareas = [
+            asyncio.create_task(self._trabajador(), name=f"correo-{n}")
+            for n in range(self.trabajadores)
+        ]
+
+    async def detener(self, timeout=10.0):
+        """Intenta vaciar la cola antes de cortar; lo que quede (también lo que esperaba
+        su backoff) se descarta, resolviendo a False a quien espera en `entregar`."""
+        if not self._tareas:
+            return
+        try:
+            await asyncio.wait_for(self._cola.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        for tarea in self._tareas + list(self._reintentos):
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, *self._reintentos, return_exceptions=True)
+        self._tareas = []
+        self._reintentos.clear()
+
+        while not self._cola.empty():
+            envio = self._cola.get_nowait()
+            self._cola.task_done()
+            self._descartar(envio, "Servicio detenido antes del envío")
+
+        if self._guardado is not None:
+            await self._guardado
+        if self._sin_guardar:
+            await self._guardar()
+
+    # --- API pública ---------------------------------------------------
+    def encolar(self, mensaje):
+        """Agrega el mensaje a la cola sin esperar al servidor SMTP; devuelve su id."""
+        if self._cola is None:
+            self.iniciar()
+        envio = Envio(mensaje)
+        try:
+            self._cola.put_nowait(envio)
+        except asyncio.QueueFull:
+            self._stats["rechazados"] += 1
+            raise ColaLlena()
+        self._stats["encolados"] += 1
+        return envio.id
+
+    async def entregar(self, mensaje):
+        """Encola esperando turno si la cola está llena y espera el resultado final.
+
+        Devuelve True si el servidor aceptó el correo, False si agotó los intentos.
+        """
+        if self._cola is None:
+            self.iniciar()
+        envio = Envio(mensaje)
+        await self._cola.put(envio)
+        self._stats["encolados"] += 1
+        return await envio.resultado
+
+    def pendientes(self):
+        return (self._cola.qsize() if self._cola else 0) + len(self._reintentos)
+
+    # --- trabajadores --------------------------------------------------
+    async def _trabajador(self):
+        smtp = None
+        try:
+            while True:
+                try:
+                    primero = await asyncio.wait_for(self._cola.get(), self.sesion_idle)
+                except asyncio.TimeoutError:
+                    smtp = await self._cerrar(smtp)
+                    continue
+
+                lote = [primero]
+                while len(lote) < self.lote_max:
+                    try:
+                        lote.append(self._cola.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+
+                self._stats["lotes"] += 1
+                while lote:
+                    envio = lote.pop(0)
+                    try:
+                        smtp = await self._enviar(smtp, envio)
+                    except asyncio.CancelledError:
+                        for resto in [envio] + lote:
+                            self._descartar(resto, "Servicio detenido antes del envío")
+                            self._cola.task_done()
+                        raise
+                    self._cola.task_done()
+        finally:
+            await self._cerrar(smtp)
+
+    async def _enviar(self, smtp, envio):
+        envio.intentos += 1
+        inicio = time.perf_counter()
+        try:
+            if smtp is None or not smtp.is_connected:
+                smtp = aiosmtplib.SMTP(**self.smtp_opciones)
+                await smtp.connect()
+                self._stats["sesiones"] += 1
+            await smtp.send_message(envio.mensaje)
+        except Exception as e:
+            metricas.registro.observar_smtp(time.perf_counter() - inicio, ok=False)
+            envio.ultimo_error = str(e)
+            self._reprogramar(envio)
+            # la sesión pudo quedar en un estado desconocido: se abre otra
+            return await self._cerrar(smtp)
+
+        metricas.registro.observar_smtp(time.perf_counter() - inicio)
+        self._stats["enviados"] += 1
+        if not envio.resultado.done():
+            envio.resultado.set_result(True)
+        return smtp
+
+    async def _cerrar(self, smtp):
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+        return None
+
+    def _reprogramar(self, envio):
+        if envio.intentos >= self.intentos:
+            self._descartar(envio, envio.ultimo_error)
+            return
+        self._stats["reintentos"] += 1
+        espera = min(self.backoff * 2 ** (envio.intentos - 1), self.backoff_max)
+        tarea = asyncio.create_task(self._reencolar(envio, espera))
+        self._reintentos.add(tarea)
+        tarea.add_done_callback(self._reintentos.discard)
+
+    async def _reencolar(self, envio, espera):
+        try:
+            await asyncio.sleep(espera)
+        except asyncio.CancelledError:
+            self._descartar(envio, "Servicio detenido durante el backoff")
+            raise
+        try:
+            self._cola.put_nowait(envio)
+        except asyncio.QueueFull:
+            self._descartar(envio, "Cola llena al reintentar")
+
+    def _descartar(self, envio, error):
+        envio.ultimo_error = error
+        self._sin_guardar.append(envio)
+        self._stats["fallidos"] += 1
+        if not envio.resultado.done():
+            envio.resultado.set_result(False)
+        print(f"❌ Correo {envio.id} a {envio.mensaje['To']} descartado:", error)
+        if self._guardado is None:
+            self._guardado = asyncio.create_task(self._guardar())
+
+    async def _guardar(self):
+        try:
+            while self._sin_guardar:
+                lote, self._sin_guardar = self._sin_guardar, []
+                try:
+                    await self.guardar(lote)
+                except Exception as e:
+                    # se conservan para el próximo descarte o para detener()
+                    self._sin_guardar[:0] = lote
+                    self._stats["errores_guardado"] += 1
+                    print("❌ No se pudieron guardar los correos fallidos:", e)
+                    return
+        finally:
+            self._guardado = None
+
+    def metrics(self):
+        return {
+            "trabajadores": len(self._tareas),
+            "en_cola": self._cola.qsize() if self._cola else 0,
+            "reintentando": len(self._reintentos),
+            "sin_guardar": len(self._sin_guardar),
+            **self._stats,
+        }
+
+
+despachador = MailDispatcher()
+
+
+def enviar(mensaje):
+    """Encola un mensaje ya armado; 503 si la cola está llena."""
+    try:
+        return despachador.encolar(mensaje)
+    except ColaLlena:
+        raise HTTPException(status_code=503, detail="Demasiados correos pendientes, intenta de nuevo")
@@ -0,0 +1,79 @@
+from datetime import date
+
+from fastapi import HTTPException
+
+from services.horarios import a_hora, a_minutos
+
+# Plantilla semanal de disponibilidad de un médico: franjas sueltas, reglas que
+# se repiten en varios días y excepciones por fecha. Se compara con lo que ya
+# hay en la BD y solo se aplican las diferencias.
+
+
+def _dia(valor, nombres):
+    """Nombre del día tal como lo guarda DisponibilidadMedica (DATENAME del servidor)."""
+    if isinstance(valor, int) or str(valor).isdigit():
+        numero = int(valor)
+        if numero not in nombres:
+            raise HTTPException(status_code=400, detail=f"Día inválido: {valor} (1 = lunes … 7 = domingo)")
+        return nombres[numero]
+    por_nombre = {n.lower(): n for n in nombres.values()}
+    nombre = por_nombre.get(str(valor).strip().lower())
+    if nombre is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Día inválido: {valor} (usa 1-7 o uno de {', '.join(nombres[i] for i in sorted(nombres))})",
+        )
+    return nombre
+
+
+def _rango(inicio, fin):
+    try:
+        rango = (a_minutos(inicio), a_minutos(fin))
+    except (ValueError, IndexError):
+        raise HTTPException(status_code=400, detail=f"Hora inválida: {inicio}-{fin} (HH:MM)")
+    if rango[0] >= rango[1]:
+        raise HTTPException(status_code=400, detail=f"La hora de inicio debe ser anterior al fin: {inicio}-{fin}")
+    return rango
+
+
+def expandir(franjas, reglas, nombres):
+    """Conjunto {(dia_semana, inicio, fin)} en minutos; rechaza solapamientos en un mismo día."""
+    deseadas = set()
+    for dia, inicio, fin in franjas:
+        deseadas.add((_dia(dia, nombres), *_rango(inicio, fin)))
+    for dias, inicio, fin in reglas:
+        rango = _rango(inicio, fin)
+        for dia in dias:
+            deseadas.add((_dia(dia, nombres), *rango))
+
+    por_dia = {}
+    for dia, inicio, fin in sorted(deseadas):
+        anterior = por_dia.get(dia)
+        if anterior is not None and inicio < anterior[1]:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Franjas solapadas el {dia}: {a_hora(anterior[0])}-{a_hora(anterior[1])} "
+                       f"y {a_hora(inicio)}-{a_hora(fin)}",
+            )
+        por_dia[dia] = (inicio, fin)
+    return deseadas
+
+
+def normalizar_excepciones(excepciones):
+    """Conjunto {(fecha, inicio | None, fin | None, motivo)}; sin horas = día completo."""
+    deseadas = set()
+    for fecha, inicio, fin, motivo in excepciones:
+        try:
+            fecha = date.fromisoformat(str(fecha)[:10])
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Fecha inválida: {fecha} (YYYY-MM-DD)")
+        if (inicio is None) != (fin is None):
+            raise HTTPException(status_code=400, detail=f"Excepción del {fecha}: indica ambas horas o ninguna")
+        rango = _rango(inicio, fin) if inicio is not None else (None, None)
+        deseadas.add((fecha, *rango, motivo))
+    return deseadas
+
+
+def diferencias(actuales, deseadas):
+    """(a_borrar, a_insertar, sin_cambios) entre dos conjuntos de filas normalizadas."""
+    return actuales - deseadas, deseadas - actuales, len(actuales & deseadas)
@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from almacen import almacen
+from database import run_db
+
+# ---------------------------------------------------
+# CONFIGURACIÓN
+# ---------------------------------------------------
+# Formatos guardados en Usuarios.contrasena (el prefijo indica el algoritmo):
+#   pbkdf2_sha256$<iteraciones>$<sal>$<hash>
+#   scrypt$<n>$<r>$<p>$<sal>$<hash>
+#   <64 hex>  -> SHA-256 sin sal (legado, se rehace en el siguiente login)
+HASH_ALGORITMO = os.getenv("HASH_ALGORITMO", "pbkdf2_sha256")
+PBKDF2_ITERACIONES = int(os.getenv("PBKDF2_ITERACIONES", 600_000))
+SCRYPT_N = int(os.getenv("SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.getenv("SCRYPT_R", 8))
+SCRYPT_P = int(os.getenv("SCRYPT_P", 1))
+
+# pbkdf2_hmac y scrypt liberan el GIL: un pool de hilos basta para paralelizar
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 2))
+HASH_MAX_PENDIENTES = int(os.getenv("HASH_MAX_PENDIENTES", 64))
+
+# Ruta rápida para logins repetidos: recuerda (por hash guardado) un HMAC de la
+# contraseña con una clave aleatoria del proceso, nunca la contraseña en claro.
+HASH_CACHE_MAX = int(os.getenv("HASH_CACHE_MAX", 10_000))
+HASH_CACHE_TTL = float(os.getenv("HASH_CACHE_TTL", 900))
+
+
+def _b64(datos):
+    return base64.b64encode(datos).decode().rstrip("=")
+
+
+def _unb64(texto):
+    return base64.b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def algoritmo_de(almacenado):
+    if "$" in almacenado:
+        return almacenado.split("$", 1)[0]
+    return "sha256"
+
+
+# ---------------------------------------------------
+# FUNCIONES SÍNCRONAS (corren en el pool)
+# ---------------------------------------------------
+def hash_password(password, algoritmo=None, **params):
+    algoritmo = algoritmo or HASH_ALGORITMO
+    sal = secrets.token_bytes(16)
+
+    if algoritmo == "pbkdf2_sha256":
+        iteraciones = params.get("iteraciones", PBKDF2_ITERACIONES)
+        derivado = hashlib.pbkdf2_hmac("sha256", password.encode(), sal, iteraciones)
+        return f"pbkdf2_sha256${iteraciones}${_b64(sal)}${_b64(derivado)}"
+
+    if algoritmo == "scrypt":
+        n = params.get("n", SCRYPT_N)
+        r = params.get("r", SCRYPT_R)
+        p = params.get("p", SCRYPT_P)
+        derivado = hashlib.scrypt(password.encode(), salt=sal, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=32)
+        return f"scrypt${n}${r}${p}${_b64(sal)}${_b64(derivado)}"
+
+    if algoritmo == "sha256":
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    raise ValueError(f"Algoritmo de hash desconocido: {algoritmo}")
+
+
+def verificar_password(password, almacenado):
+    algoritmo = algoritmo_de(almacenado)
+
+    if algoritmo == "pbkdf2_sha256":
+        _, iteraciones, sal, esperado = almacenado.split("$")
+        derivado = hashlib.pbkdf2_hmac("sha256", password.encode(), _unb64(sal), int(iteraciones))
+        return hmac.compare_digest(derivado, _unb64(esperado))
+
+    if algoritmo == "scrypt":
+        _, n, r, p, sal, esperado = almacenado.split("$")
+        n, r, p = int(n), int(r), int(p)
+        derivado = hashlib.scrypt(password.encode(), salt=_unb64(sal), n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=32)
+        return hmac.compare_digest(derivado, _unb64(esperado))
+
+    if algoritmo == "sha256":
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), almacenado)
+
+    return False
+
+
+def necesita_rehash(almacenado):
+    """True si el hash no usa el algoritmo y el costo configurados."""
+    algoritmo = algoritmo_de(almacenado)
+    if algoritmo != HASH_ALGORITMO:
+        return True
+    partes = almacenado.split("$")
+    if algoritmo == "pbkdf2_sha256":
+        return int(partes[1]) < PBKDF2_ITERACIONES
+    if algoritmo == "scrypt":
+        return (int(partes[1]), int(partes[2]), int(partes[3])) < (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return False
+
+
+# ---------------------------------------------------
+# SERVICIO ASÍNCRONO
+# ---------------------------------------------------
+class HashService:
+    def __init__(self, workers=HASH_WORKERS, max_pendientes=HASH_MAX_PENDIENTES,
+                 cache_max=HASH_CACHE_MAX, cache_ttl=HASH_CACHE_TTL):
+        self.workers = workers
+        self.max_pendientes = max_pendientes
+        self.cache_max = cache_max
+        self.cache_ttl = cache_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hash")
+        self._lock = threading.Lock()
+        self._pendientes = 0
+        self._clave = secrets.token_bytes(32)
+        self._recientes = OrderedDict()   # hash guardado -> (expira, hmac de la contraseña)
+        self._stats = {"hashes": 0, "verificaciones": 0, "rapidas": 0, "rechazadas": 0}
+
+    async def _en_pool(self, fn, *args):
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                self._stats["rechazadas"] += 1
+                raise HTTPException(status_code=503, detail="Servidor ocupado, intenta de nuevo")
+            self._pendientes += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pendientes -= 1
+
+    async def hash(self, password):
+        with self._lock:
+            self._stats["hashes"] += 1
+        return await self._en_pool(hash_password, password)
+
+    async def verificar(self, password, almacenado):
+        """(válida, necesita_rehash). Los logins repetidos se resuelven sin KDF."""
+        if not almacenado:
+            return False, False
+
+        firma = hmac.new(self._clave, password.encode(), hashlib.sha256).digest()
+        with self._lock:
+            self._stats["verificaciones"] += 1
+            entrada = self._recientes.get(almacenado)
+            if entrada and entrada[0] > time.monotonic() and hmac.compare_digest(entrada[1], firma):
+                self._recientes.move_to_end(almacenado)
+                self._stats["rapidas"] += 1
+                return True, necesita_rehash(almacenado)
+
+        valida = await self._en_pool(verificar_password, password, almacenado)
+        if valida:
+            self._recordar(almacenado, firma)
+        return valida, valida and necesita_rehash(almacenado)
+
+    def _recordar(self, almacenado, firma):
+        with self._lock:
+            self._recientes[almacenado] = (time.monotonic() + self.cache_ttl, firma)
+            self._recientes.move_to_end(almacenado)
+            while len(self._recientes) > self.cache_max:
+                self._recientes.popitem(last=False)
+
+    def olvidar(self, almacenado):
+        with self._lock:
+            self._recientes.pop(almacenado, None)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "algoritmo": HASH_ALGORITMO,
+                "workers": self.workers,
+                "pendientes": self._pendientes,
+                "cache": len(self._recientes),
+                **self._stats,
+            }
+
+
+servicio = HashService()
+
+
+# ---------------------------------------------------
+# LOGIN CON REHASH TRANSPARENTE
+# ---------------------------------------------------
+def _buscar_credenciales(conn, correo, rol):
+    return almacen.credenciales(conn.cursor(), correo, rol)
+
+
+def _guardar_rehash(conn, id_usuario, anterior, nuevo):
+    almacen.guardar_rehash(conn.cursor(), id_usuario, anterior, nuevo)
+    conn.commit()
+
+
+async def autenticar(correo, password, rol=None):
+    """(id_usuario, nombre, correo, rol) si las credenciales son válidas, si no None."""
+    fila = await run_db(_buscar_credenciales, correo, rol)
+    if not fila:
+        return None
+
+    id_usuario, nombre, correo, rol, almacenado = fila
+    valida, rehash = await servicio.verificar(password, almacenado)
+    if not valida:
+        return None
+
+    if rehash:
+        try:
+            nuevo = await servicio.hash(password)
+            await run_db(_guardar_rehash, id_usuario, almacenado, nuevo)
+            servicio.olvidar(almacenado)
+        except Exception as e:
+            # el login no falla por esto: se reintenta en el siguiente
+            print("❌ No se pudo actualizar el hash de la contraseña:", e)
+
+    return id_usuario, nombre, correo, rol
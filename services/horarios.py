@@ -0,0 +1,92 @@
+import os
+from datetime import datetime, time
+
+# Duración de cada turno que se ofrece al paciente
+SLOT_MINUTOS = int(os.getenv("SLOT_MINUTOS", 60))
+
+
+def a_minutos(hora):
+    """Minutos desde medianoche para un time de pyodbc o un texto HH:MM[:SS]."""
+    if isinstance(hora, datetime):
+        hora = hora.time()
+    if isinstance(hora, time):
+        return hora.hour * 60 + hora.minute
+    partes = str(hora).split(":")
+    return int(partes[0]) * 60 + int(partes[1])
+
+
+def a_hora(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+# ---------------------------------------------------
+# AGENDA (las consultas están en services/indice_disponibilidad.py)
+# ---------------------------------------------------
+def bits_ocupados(filas):
+    """{id_medico: bitset} donde el bit m marca una cita que empieza en el minuto m del día."""
+    ocupadas = {}
+    for id_medico, hora in filas:
+        ocupadas[id_medico] = ocupadas.get(id_medico, 0) | (1 << a_minutos(hora))
+    return ocupadas
+
+
+def bloqueos_por_medico(filas):
+    """{id_medico: [(inicio, fin)]} en minutos a partir de (id_medico, hora_inicio, hora_fin) de
+    DisponibilidadExcepciones; sin horas significa el día completo."""
+    bloqueos = {}
+    for id_medico, inicio, fin in filas:
+        rango = (a_minutos(inicio) if inicio is not None else 0,
+                 a_minutos(fin) if fin is not None else 24 * 60)
+        bloqueos.setdefault(id_medico, []).append(rango)
+    return bloqueos
+
+
+def restar_bloqueos(disponibilidad, bloqueos):
+    """Quita de cada franja (id_medico, nombre, inicio, fin) los rangos bloqueados de su médico."""
+    if not bloqueos:
+        return disponibilidad
+    resultado = []
+    for id_medico, nombre, inicio, fin in disponibilidad:
+        tramos = [(a_minutos(inicio), a_minutos(fin))]
+        for b_inicio, b_fin in bloqueos.get(id_medico, ()):
+            tramos = [
+                t for i, f in tramos
+                for t in ((i, min(f, b_inicio)), (max(i, b_fin), f))
+                if t[0] < t[1]
+            ]
+        resultado.extend((id_medico, nombre, a_hora(i), a_hora(f)) for i, f in tramos)
+    return resultado
+
+
+# ---------------------------------------------------
+# GENERACIÓN DE TURNOS (EN PYTHON)
+# ---------------------------------------------------
+def choca(tomadas, inicio, minutos):
+    """True si el turno [inicio, inicio+minutos) se cruza con alguna cita del bitset.
+
+    Cada bit marca el inicio de una cita de SLOT_MINUTOS: chocan las que empiezan
+    dentro del turno y las que empezaron antes y siguen en curso.
+    """
+    desde = max(0, inicio - SLOT_MINUTOS + 1)
+    mascara = ((1 << (inicio + minutos - desde)) - 1) << desde
+    return bool(tomadas & mascara)
+
+
+def generar_slots(disponibilidad, ocupadas, fecha, minutos=SLOT_MINUTOS):
+    resultados = []
+
+    for id_medico, nombre, inicio, fin in disponibilidad:
+        tomadas = ocupadas.get(id_medico, 0)
+        actual, limite = a_minutos(inicio), a_minutos(fin)
+
+        while actual < limite:
+            if not choca(tomadas, actual, minutos):
+                resultados.append({
+                    "id_medico": id_medico,
+                    "medico": nombre,
+                    "hora": str(a_hora(actual)),
+                    "fecha": fecha
+                })
+            actual += minutos
+
+    return resultados
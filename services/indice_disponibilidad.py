@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from almacen import almacen
+from services.horarios import a_minutos, bits_ocupados, bloqueos_por_medico, restar_bloqueos
+
+INDICE_TTL = float(os.getenv("INDICE_TTL", 60))
+INDICE_MAX = int(os.getenv("INDICE_MAX", 10000))
+
+
+def _fecha(valor):
+    return str(valor)[:10]
+
+
+class IndiceDisponibilidad:
+    """Índice en memoria del proceso para responder "¿está libre el médico X en fecha/hora Y?".
+
+    - horarios por especialidad: todas las franjas semanales de sus médicos
+    - ocupación por (médico, fecha): bitset con un bit por minuto del día
+    - bloqueos por (médico, fecha): feriados / excepciones de DisponibilidadExcepciones
+
+    Se llena bajo demanda, los routers lo actualizan al escribir y cada entrada
+    expira por TTL o por LRU cuando se supera el máximo.
+    """
+
+    def __init__(self, ttl=INDICE_TTL, max_entradas=INDICE_MAX):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._dias = {}                        # isoweekday -> DATENAME del servidor
+        self._especialidades = OrderedDict()   # id_especialidad -> (expira, franjas)
+        self._ocupadas = OrderedDict()         # (id_medico, fecha) -> (expira, bitset)
+        self._bloqueos = OrderedDict()         # (id_medico, fecha) -> (expira, [(inicio, fin)])
+        self._medico_especialidad = {}
+        self._seq = 0                          # escrituras; evita guardar lecturas ya obsoletas
+        self._stats = {"hits": 0, "misses": 0, "desalojos": 0}
+
+    # ---------------------------------------------------
+    # LECTURAS
+    # ---------------------------------------------------
+    def agenda_en_memoria(self, id_especialidad, fecha):
+        """(disponibilidad, ocupadas) sin tocar la BD, o None si falta algo."""
+        fecha = _fecha(fecha)
+        with self._lock:
+            dia = self._dia_semana(fecha)
+            franjas = self._leer(self._especialidades, id_especialidad)
+            if dia is None or franjas is None:
+                return None
+            disponibilidad = [(m, n, i, f) for m, n, d, i, f in franjas if d == dia]
+            ocupadas = {}
+            bloqueos = {}
+            for id_medico in {f[0] for f in disponibilidad}:
+                bits = self._leer(self._ocupadas, (id_medico, fecha))
+                rangos = self._leer(self._bloqueos, (id_medico, fecha))
+                if bits is None or rangos is None:
+                    return None
+                ocupadas[id_medico] = bits
+                if rangos:
+                    bloqueos[id_medico] = rangos
+            return restar_bloqueos(disponibilidad, bloqueos), ocupadas
+
+    def agenda(self, cursor, id_especialidad, fecha):
+        fecha = _fecha(fecha)
+        agenda = self.agenda_en_memoria(id_especialidad, fecha)
+        if agenda is not None:
+            return agenda
+
+        self._cargar_dias(cursor)
+        with self._lock:
+            seq = self._seq
+            franjas = self._leer(self._especialidades, id_especialidad)
+
+        if franjas is None:
+            franjas = [tuple(r) for r in almacen.franjas_especialidad(cursor, id_especialidad)]
+
+        # citas y excepciones del día en el mismo round trip
+        filas = almacen.ocupacion_especialidad(cursor, id_especialidad, fecha)
+        bits = bits_ocupados((r[1], r[2]) for r in filas if r[0] == 0)
+        bloqueos = bloqueos_por_medico((r[1], r[2], r[3]) for r in filas if r[0] == 1)
+
+        with self._lock:
+            if seq == self._seq:
+                self._guardar(self._especialidades, id_especialidad, franjas)
+                for id_medico, *_ in franjas:
+                    self._medico_especialidad[id_medico] = id_especialidad
+                    self._guardar(self._ocupadas, (id_medico, fecha), bits.get(id_medico, 0))
+                    self._guardar(self._bloqueos, (id_medico, fecha), bloqueos.get(id_medico, []))
+            dia = self._dia_semana(fecha)
+
+        disponibilidad = [(m, n, i, f) for m, n, d, i, f in franjas if d == dia]
+        return restar_bloqueos(disponibilidad, bloqueos), bits
+
+    def nombres_dias(self, cursor):
+        """{isoweekday: nombre} tal como DATENAME los escribe en DisponibilidadMedica."""
+        self._cargar_dias(cursor)
+        return dict(self._dias)
+
+    def ocupado_en_memoria(self, id_medico, fecha, hora):
+        """True / False según el índice, o None si ese (médico, fecha) no está cargado."""
+        with self._lock:
+            bits = self._leer(self._ocupadas, (id_medico, _fecha(fecha)))
+        if bits is None:
+            return None
+        return bool((bits >> a_minutos(hora)) & 1)
+
+    def esta_ocupado(self, cursor, id_medico, fecha, hora):
+        fecha = _fecha(fecha)
+        with self._lock:
+            bits = self._leer(self._ocupadas, (id_medico, fecha))
+            seq = self._seq
+
+        if bits is None:
+            horas = almacen.horas_ocupadas(cursor, id_medico, fecha)
+            bits = bits_ocupados((id_medico, h) for h in horas).get(id_medico, 0)
+            with self._lock:
+                if seq == self._seq:
+                    self._guardar(self._ocupadas, (id_medico, fecha), bits)
+
+        return bool((bits >> a_minutos(hora)) & 1)
+
+    # ---------------------------------------------------
+    # ESCRITURAS (las llaman los routers tras el commit)
+    # ---------------------------------------------------
+    def reservar(self, id_medico, fecha, hora):
+        self._marcar(id_medico, fecha, hora, True)
+
+    def liberar(self, id_medico, fecha, hora):
+        self._marcar(id_medico, fecha, hora, False)
+
+    def invalidar_medico(self, id_medico):
+        with self._lock:
+            self._seq += 1
+            id_especialidad = self._medico_especialidad.pop(id_medico, None)
+            if id_especialidad is not None:
+                self._especialidades.pop(id_especialidad, None)
+            for tabla in (self._ocupadas, self._bloqueos):
+                for clave in [k for k in tabla if k[0] == id_medico]:
+                    del tabla[clave]
+
+    def invalidar_especialidad(self, id_especialidad):
+        with self._lock:
+            self._seq += 1
+            self._especialidades.pop(id_especialidad, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._seq += 1
+            self._especialidades.clear()
+            self._ocupadas.clear()
+            self._bloqueos.clear()
+            self._medico_especialidad.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "especialidades": len(self._especialidades),
+                "medico_dias": len(self._ocupadas),
+                **self._stats,
+            }
+
+    # ---------------------------------------------------
+    # INTERNOS (con el lock tomado)
+    # ---------------------------------------------------
+    def _marcar(self, id_medico, fecha, hora, ocupado):
+        clave = (id_medico, _fecha(fecha))
+        bit = 1 << a_minutos(hora)
+        with self._lock:
+            self._seq += 1
+            entrada = self._ocupadas.get(clave)
+            if entrada is None:
+                return
+            expira, bits = entrada
+            self._ocupadas[clave] = (expira, bits | bit if ocupado else bits & ~bit)
+
+    def _leer(self, tabla, clave):
+        entrada = tabla.get(clave)
+        if entrada is None or entrada[0] < time.monotonic():
+            if entrada is not None:
+                del tabla[clave]
+            self._stats["misses"] += 1
+            return None
+        tabla.move_to_end(clave)
+        self._stats["hits"] += 1
+        return entrada[1]
+
+    def _guardar(self, tabla, clave, valor):
+        tabla[clave] = (time.monotonic() + self.ttl, valor)
+        tabla.move_to_end(clave)
+        while len(tabla) > self.max_entradas:
+            tabla.popitem(last=False)
+            self._stats["desalojos"] += 1
+
+    def _dia_semana(self, fecha):
+        if not self._dias:
+            return None
+        return self._dias[date.fromisoformat(fecha).isoweekday()]
+
+    def _cargar_dias(self, cursor):
+        # los nombres de DisponibilidadMedica.dia_semana dependen del backend: se piden una sola vez
+        if self._dias:
+            return
+        dias = almacen.nombres_dias(cursor)
+        with self._lock:
+            self._dias = dias
+
+
+indice = IndiceDisponibilidad()
@@ -0,0 +1,290 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from services import perfilador
+
+# Instrumentación en proceso: latencia por ruta, trabajo de BD atribuido a la
+# petición que lo hizo, apertura de conexiones y envío SMTP. Todo se acumula
+# en memoria y se expone en formato de texto de Prometheus (GET /metrics).
+# Este módulo no importa database ni routers para que ambos puedan usarlo.
+
+METRICAS = os.getenv("METRICAS", "1") not in ("0", "false", "False", "")
+PREFIJO = "medicicol"
+
+BUCKETS_PETICION = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_IO = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+SIN_RUTA = "(sin ruta)"   # 404 y rutas no registradas: una sola serie
+FONDO = "(fondo)"         # BD usada fuera de una petición (relay, tareas diarias)
+
+
+class Histograma:
+    """Buckets acumulativos al estilo Prometheus; no es thread-safe por sí solo."""
+
+    __slots__ = ("limites", "conteos", "suma", "total")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.conteos = [0] * (len(limites) + 1)   # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.conteos[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, conteo in zip((*self.limites, "+Inf"), self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{{{etiquetas}le="{limite}"}} {acumulado}'
+        base = etiquetas.rstrip(",")
+        base = f"{{{base}}}" if base else ""
+        yield f"{nombre}_sum{base} {self.suma}"
+        yield f"{nombre}_count{base} {self.total}"
+
+
+class Medicion:
+    """Trabajo de BD de una petición; lo comparten los hilos de run_db vía contextvars."""
+
+    __slots__ = ("sentencias", "segundos_bd", "filas", "_lock")
+
+    def __init__(self):
+        self.sentencias = 0
+        self.segundos_bd = 0.0
+        self.filas = 0
+        self._lock = threading.Lock()   # una petición puede lanzar varios run_db a la vez
+
+    def sumar(self, sentencias, segundos, filas):
+        with self._lock:
+            self.sentencias += sentencias
+            self.segundos_bd += segundos
+            self.filas += filas
+
+
+_actual: ContextVar[Medicion | None] = ContextVar("medicion", default=None)
+
+
+class _Ruta:
+    __slots__ = ("latencia", "por_estado", "sentencias", "segundos_bd", "segundos_python", "filas")
+
+    def __init__(self):
+        self.latencia = Histograma(BUCKETS_PETICION)
+        self.por_estado = {}
+        self.sentencias = 0
+        self.segundos_bd = 0.0
+        self.segundos_python = 0.0
+        self.filas = 0
+
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rutas = {}   # (método, ruta) -> _Ruta
+        self._fondo = Medicion()
+        self._conexion = Histograma(BUCKETS_IO)
+        self._espera_pool = Histograma(BUCKETS_IO)
+        self._smtp = Histograma(BUCKETS_IO)
+        self._smtp_errores = 0
+
+    # ---- peticiones ----
+    def registrar_peticion(self, metodo, ruta, estado, segundos, medicion):
+        with self._lock:
+            datos = self._rutas.get((metodo, ruta))
+            if datos is None:
+                datos = self._rutas[(metodo, ruta)] = _Ruta()
+            datos.latencia.observar(segundos)
+            datos.por_estado[estado] = datos.por_estado.get(estado, 0) + 1
+            datos.sentencias += medicion.sentencias
+            datos.segundos_bd += medicion.segundos_bd
+            # run_db en paralelo puede sumar más tiempo de BD que el de reloj
+            datos.segundos_python += max(segundos - medicion.segundos_bd, 0.0)
+            datos.filas += medicion.filas
+
+    def sumar_bd(self, sentencias, segundos, filas):
+        (_actual.get() or self._fondo).sumar(sentencias, segundos, filas)
+
+    # ---- E/S fuera de las peticiones ----
+    def observar_conexion(self, segundos):
+        with self._lock:
+            self._conexion.observar(segundos)
+
+    def observar_espera_pool(self, segundos):
+        with self._lock:
+            self._espera_pool.observar(segundos)
+
+    def observar_smtp(self, segundos, ok=True):
+        with self._lock:
+            self._smtp.observar(segundos)
+            if not ok:
+                self._smtp_errores += 1
+
+    # ---- exposición ----
+    def prometheus(self, gauges=()):
+        """Texto de exposición; `gauges` = [(nombre, ayuda, {etiqueta: valor} | valor)]."""
+        p = PREFIJO
+        lineas = []
+
+        def cabecera(nombre, tipo, ayuda):
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+
+        with self._lock:
+            rutas = sorted(self._rutas.items())
+
+            cabecera(f"{p}_http_request_duration_seconds", "histogram", "Latencia de las peticiones por ruta.")
+            for (metodo, ruta), datos in rutas:
+                lineas.extend(datos.latencia.lineas(
+                    f"{p}_http_request_duration_seconds", f"{_etiquetas(method=metodo, route=ruta)},"
+                ))
+
+            cabecera(f"{p}_http_requests_total", "counter", "Peticiones por ruta y código de estado.")
+            for (metodo, ruta), datos in rutas:
+                for estado, n in sorted(datos.por_estado.items()):
+                    lineas.append(f"{p}_http_requests_total{{{_etiquetas(method=metodo, route=ruta, status=estado)}}} {n}")
+
+            series = [
+                ("db_statements_total", "counter", "Sentencias SQL ejecutadas.", "sentencias"),
+                ("db_seconds_total", "counter", "Tiempo en el driver de BD (execute + fetch).", "segundos_bd"),
+                ("python_seconds_total", "counter", "Tiempo de la petición fuera de la BD.", "segundos_python"),
+                ("db_rows_total", "counter", "Filas leídas de la BD.", "filas"),
+            ]
+            for sufijo, tipo, ayuda, campo in series:
+                cabecera(f"{p}_{sufijo}", tipo, ayuda)
+                for (metodo, ruta), datos in rutas:
+                    lineas.append(f"{p}_{sufijo}{{{_etiquetas(method=metodo, route=ruta)}}} {getattr(datos, campo)}")
+                if campo != "segundos_python":
+                    lineas.append(f"{p}_{sufijo}{{{_etiquetas(method='', route=FONDO)}}} {getattr(self._fondo, campo)}")
+
+            for nombre, histograma, ayuda in (
+                ("db_connect_seconds", self._conexion, "Apertura de conexiones nuevas del pool."),
+                ("db_pool_wait_seconds", self._espera_pool, "Espera por una conexión libre del pool."),
+                ("smtp_send_seconds", self._smtp, "Envío de un correo por la sesión SMTP."),
+            ):
+                cabecera(f"{p}_{nombre}", "histogram", ayuda)
+                lineas.extend(histograma.lineas(f"{p}_{nombre}", ""))
+            cabecera(f"{p}_smtp_errors_total", "counter", "Envíos SMTP fallidos.")
+            lineas.append(f"{p}_smtp_errors_total {self._smtp_errores}")
+
+        for nombre, ayuda, valor in gauges:
+            cabecera(f"{p}_{nombre}", "gauge", ayuda)
+            if isinstance(valor, dict):
+                for etiqueta, v in valor.items():
+                    if isinstance(v, (bool, int, float)):   # se omiten textos (p. ej. el algoritmo)
+                        lineas.append(f"{p}_{nombre}{{{_etiquetas(tipo=etiqueta)}}} {float(v)}")
+            else:
+                lineas.append(f"{p}_{nombre} {float(valor)}")
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(**valores):
+    return ",".join(f'{k}="{_escapar(v)}"' for k, v in valores.items())
+
+
+registro = Registro()
+
+
+# ---------------------------------------------------
+# CURSOR MEDIDO
+# ---------------------------------------------------
+class CursorMedido:
+    """Envuelve un cursor DB-API y cuenta sentencias, tiempo y filas."""
+
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def execute(self, *args):
+        inicio = time.perf_counter()
+        try:
+            resultado = self._cursor.execute(*args)
+        finally:
+            segundos = time.perf_counter() - inicio
+            registro.sumar_bd(1, segundos, 0)
+            if perfilador.ACTIVO:
+                perfilador.registrar(args[0], args[1:], segundos)
+        # pyodbc y sqlite3 devuelven el propio cursor para encadenar fetch*
+        return self if resultado is self._cursor else resultado
+
+    def executemany(self, *args):
+        inicio = time.perf_counter()
+        try:
+            return self._cursor.executemany(*args)
+        finally:
+            segundos = time.perf_counter() - inicio
+            registro.sumar_bd(1, segundos, 0)
+            if perfilador.ACTIVO:
+                perfilador.registrar(args[0], args[1:], segundos, muchos=True)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = self._cursor.fetchone()
+        registro.sumar_bd(0, time.perf_counter() - inicio, fila is not None)
+        return fila
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchall()
+        registro.sumar_bd(0, time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def fetchmany(self, *args):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchmany(*args)
+        registro.sumar_bd(0, time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        # p. ej. cursor.fast_executemany = True
+        setattr(self._cursor, nombre, valor)
+
+
+# ---------------------------------------------------
+# MIDDLEWARE ASGI
+# ---------------------------------------------------
+class MiddlewareMetricas:
+    """ASGI puro (sin BaseHTTPMiddleware): mide hasta el último byte, incluido el streaming."""
+
+    def __init__(self, app, excluir=("/metrics",)):
+        self.app = app
+        self.excluir = set(excluir)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluir:
+            await self.app(scope, receive, send)
+            return
+
+        medicion = Medicion()
+        token = _actual.set(medicion)
+        estado = 500
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            segundos = time.perf_counter() - inicio
+            _actual.reset(token)
+            # el router deja la ruta que atendió en el scope: se usa la plantilla
+            ruta = getattr(scope.get("route"), "path", None) or SIN_RUTA
+            registro.registrar_peticion(scope["method"], ruta, estado, segundos, medicion)
@@ -0,0 +1,164 @@
+import asyncio
+import os
+
+from almacen import almacen
+from database import run_db
+from services import correo
+from services.plantillas import plantillas
+
+# Outbox transaccional de notificaciones de citas.
+# Los routers llaman a registrar() con el mismo cursor con el que cambian la
+# cita, así el evento existe si y solo si la transacción hizo commit. El relay
+# reclama eventos por lotes, arma los correos y los entrega al despachador.
+
+OUTBOX_LOTE = int(os.getenv("OUTBOX_LOTE", 100))
+OUTBOX_INTERVALO = float(os.getenv("OUTBOX_INTERVALO", 5))
+# un lote reclamado y no confirmado vuelve a estar disponible tras este tiempo
+OUTBOX_BLOQUEO = int(os.getenv("OUTBOX_BLOQUEO", 300))
+OUTBOX_INTENTOS = int(os.getenv("OUTBOX_INTENTOS", 5))
+
+# tipo de evento -> plantilla de services.plantillas
+CONFIRMADA = "cita_confirmada"
+REPROGRAMADA = "cambio_reprogramada"
+CANCELADA = "cita_cancelada"
+
+
+def registrar(cursor, tipo, id_cita, id_usuario, id_medico, fecha, hora):
+    """Agrega el evento dentro de la transacción del llamador (no hace commit)."""
+    if id_usuario is None:
+        return   # cita sin paciente (creada por un admin): no hay a quién avisar
+    almacen.registrar_eventos(cursor, [(tipo, id_cita, id_usuario, id_medico, fecha, hora)])
+
+
+def registrar_lote(cursor, tipo, eventos):
+    """Como registrar() para muchas citas: eventos = [(id_cita, id_usuario, id_medico, fecha, hora)]."""
+    filas = [(tipo, *e) for e in eventos if e[1] is not None]
+    if not filas:
+        return
+    almacen.registrar_eventos(cursor, filas)
+
+
+def reclamar(conn, limite, bloqueo=OUTBOX_BLOQUEO, intentos=OUTBOX_INTENTOS):
+    """Bloquea hasta `limite` eventos pendientes y los devuelve con los datos del correo."""
+    cursor = conn.cursor()
+    try:
+        # varias instancias del relay se reparten los eventos sin esperarse
+        ids = almacen.reclamar_eventos(cursor, limite, intentos, bloqueo)
+        if not ids:
+            conn.commit()
+            return []
+
+        filas = almacen.eventos(cursor, ids)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # usuario o médico ya borrados: no hay correo que armar, se cierran igual
+    encontrados = {f[0] for f in filas}
+    huerfanos = [i for i in ids if i not in encontrados]
+    if huerfanos:
+        confirmar(conn, huerfanos)
+    return filas
+
+
+def confirmar(conn, ids_evento):
+    cursor = conn.cursor()
+    try:
+        almacen.confirmar_eventos(cursor, ids_evento)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def mensaje(tipo, destinatario, nombre_usuario, medico, fecha, hora):
+    fecha, hora = str(fecha)[:10], str(hora)[:5]
+    datos = {"nombre_usuario": nombre_usuario, "medico": medico, "fecha": fecha, "hora": hora}
+    if tipo == REPROGRAMADA:
+        datos.update(motivo="reprogramada", nueva_fecha=fecha, nueva_hora=hora)
+    return plantillas.mensaje(tipo, [destinatario], **datos)
+
+
+class OutboxRelay:
+    """Drena NotificacionesOutbox hacia la cola de correo.
+
+    Se despierta cada `intervalo` segundos o en cuanto un router avisa que
+    registró eventos (avisar() es seguro desde los hilos de run_db).
+    """
+
+    def __init__(self, lote=OUTBOX_LOTE, intervalo=OUTBOX_INTERVALO, despachador=None):
+        self.lote = lote
+        self.intervalo = intervalo
+        self.despachador = despachador
+        self._loop = None
+        self._evento = None
+        self._tarea = None
+        self._stats = {"lotes": 0, "eventos": 0, "enviados": 0, "fallidos": 0, "errores": 0}
+
+    def iniciar(self):
+        if self._tarea is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._evento = asyncio.Event()
+        self._tarea = asyncio.create_task(self._ciclo(), name="outbox")
+
+    async def detener(self):
+        if self._tarea is None:
+            return
+        self._tarea.cancel()
+        await asyncio.gather(self._tarea, return_exceptions=True)
+        self._tarea = None
+
+    def avisar(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._evento.set)
+
+    async def _ciclo(self):
+        while True:
+            try:
+                # seguir mientras haya lotes llenos; luego esperar aviso o intervalo
+                while await self.drenar() >= self.lote:
+                    pass
+            except Exception as e:
+                self._stats["errores"] += 1
+                print("❌ Error drenando el outbox de notificaciones:", e)
+            try:
+                await asyncio.wait_for(self._evento.wait(), self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            self._evento.clear()
+
+    async def drenar(self):
+        """Procesa un lote; devuelve cuántos eventos reclamó."""
+        filas = await run_db(reclamar, self.lote)
+        if not filas:
+            return 0
+        despachador = self.despachador or correo.despachador
+
+        async def uno(fila):
+            id_evento, tipo, destinatario, nombre_usuario, medico, fecha, hora = fila
+            if not destinatario:
+                return id_evento
+            entregado = await despachador.entregar(
+                mensaje(tipo, destinatario, nombre_usuario, medico, fecha, hora)
+            )
+            return id_evento if entregado else None
+
+        resultados = await asyncio.gather(*(uno(f) for f in filas))
+        enviados = [r for r in resultados if r is not None]
+        if enviados:
+            await run_db(confirmar, enviados)
+
+        self._stats["lotes"] += 1
+        self._stats["eventos"] += len(filas)
+        self._stats["enviados"] += len(enviados)
+        # los no entregados se reintentan cuando vence su bloqueo, hasta OUTBOX_INTENTOS
+        self._stats["fallidos"] += len(filas) - len(enviados)
+        return len(filas)
+
+    def metrics(self):
+        return {"activo": self._tarea is not None, **self._stats}
+
+
+relay = OutboxRelay()
@@ -0,0 +1,49 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+LIMITE_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+
+def codificar_cursor(*valores):
+    # fechas y horas viajan como texto; los ids conservan su tipo
+    valores = [v if isinstance(v, (int, float)) else str(v) for v in valores]
+    crudo = json.dumps(valores, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(token, n):
+    try:
+        relleno = "=" * (-len(token) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(token + relleno))
+    except Exception:
+        valores = None
+    if not isinstance(valores, list) or len(valores) != n:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    return valores
+
+
+def keyset(columnas, token, descendente=True):
+    """Condición SQL para continuar después del cursor ordenando por `columnas`."""
+    if not token:
+        return None, []
+
+    valores = decodificar_cursor(token, len(columnas))
+    op = "<" if descendente else ">"
+
+    sql = f"{columnas[-1]} {op} ?"
+    params = [valores[-1]]
+    for col, valor in reversed(list(zip(columnas[:-1], valores[:-1]))):
+        sql = f"{col} {op} ? OR ({col} = ? AND ({sql}))"
+        params = [valor, valor] + params
+    return f"({sql})", params
+
+
+def recortar(filas, limit, clave):
+    """Separa la fila extra (se piden limit + 1) y arma el cursor de la siguiente página."""
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    return filas, codificar_cursor(*clave(filas[-1]))
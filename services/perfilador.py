@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+# Perfilador de consultas para desarrollo y staging (PERFILADOR=1).
+# Agrupa por petición las sentencias SQL normalizadas con cuántas veces se
+# ejecutaron, cuánto tardaron y con qué forma de parámetros, y marca las
+# peticiones con patrones N+1 (la misma sentencia más de
+# PERFILADOR_REPETICIONES veces) o que pasan del presupuesto de tiempo.
+# Apagado no agrega trabajo: el cursor medido solo mira ACTIVO.
+
+ACTIVO = os.getenv("PERFILADOR", "0") not in ("0", "false", "False", "")
+PERFILADOR_REPETICIONES = int(os.getenv("PERFILADOR_REPETICIONES", 10))
+PERFILADOR_PRESUPUESTO_MS = float(os.getenv("PERFILADOR_PRESUPUESTO_MS", 250))
+# además de las marcadas, registrar todas las peticiones en el log
+PERFILADOR_TODO = os.getenv("PERFILADOR_TODO", "0") not in ("0", "false", "False", "")
+CABECERA = "X-Perfil-SQL"
+
+_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalizar(sql):
+    """Texto de la sentencia sin literales: IN (?, ?, ?) y TOP 51 cuentan como la misma."""
+    sql = _TEXTO.sub("?", sql)
+    sql = _NUMERO.sub("?", sql)
+    sql = _LISTA.sub("(?…)", sql)
+    return _ESPACIOS.sub(" ", sql).strip()
+
+
+def _tipos(params):
+    return "(" + ",".join(type(p).__name__ for p in params) + ")"
+
+
+def forma(args, muchos=False):
+    """Forma de los parámetros tal como llegaron a execute/executemany (sin valores)."""
+    if muchos:
+        filas = args[0] if args else []
+        try:
+            n = len(filas)
+            primera = filas[0] if n else ()
+        except TypeError:   # generador: no se consume
+            return "lote(?)"
+        return f"{n}×{_tipos(primera if isinstance(primera, (tuple, list)) else (primera,))}"
+    if len(args) == 1 and isinstance(args[0], (tuple, list)):
+        args = args[0]
+    return _tipos(args)
+
+
+class _Consulta:
+    __slots__ = ("veces", "segundos", "formas")
+
+    def __init__(self):
+        self.veces = 0
+        self.segundos = 0.0
+        self.formas = set()
+
+
+class Perfil:
+    """Sentencias de una petición, agrupadas por texto normalizado."""
+
+    def __init__(self):
+        self.consultas = {}
+
+    def registrar(self, sql, params, segundos, muchos=False):
+        # se llama desde los hilos de run_db; dict/set bajo el GIL bastan para un informe
+        clave = normalizar(sql)
+        consulta = self.consultas.get(clave)
+        if consulta is None:
+            consulta = self.consultas.setdefault(clave, _Consulta())
+        consulta.veces += 1
+        consulta.segundos += segundos
+        if len(consulta.formas) < 5:
+            consulta.formas.add(forma(params, muchos))
+
+    def resumen(self):
+        sentencias = sum(c.veces for c in self.consultas.values())
+        bd_ms = sum(c.segundos for c in self.consultas.values()) * 1000
+        repetidas = sum(1 for c in self.consultas.values() if c.veces > PERFILADOR_REPETICIONES)
+        return sentencias, len(self.consultas), bd_ms, repetidas
+
+    def informe(self, metodo, ruta, segundos):
+        """None si la petición no tiene nada que reportar (y PERFILADOR_TODO está apagado)."""
+        sentencias, distintas, bd_ms, _ = self.resumen()
+        ms = segundos * 1000
+        alertas = []
+        for sql, c in self.consultas.items():
+            if c.veces > PERFILADOR_REPETICIONES:
+                alertas.append({"tipo": "n+1", "sql": sql, "veces": c.veces})
+        if ms > PERFILADOR_PRESUPUESTO_MS:
+            alertas.append({"tipo": "lenta", "ms": round(ms, 1), "presupuesto_ms": PERFILADOR_PRESUPUESTO_MS})
+        if not alertas and not PERFILADOR_TODO:
+            return None
+
+        consultas = sorted(self.consultas.items(), key=lambda kv: kv[1].segundos, reverse=True)
+        return {
+            "metodo": metodo,
+            "ruta": ruta,
+            "ms": round(ms, 1),
+            "bd_ms": round(bd_ms, 1),
+            "sentencias": sentencias,
+            "distintas": distintas,
+            "alertas": alertas,
+            "consultas": [
+                {"sql": sql, "veces": c.veces, "ms": round(c.segundos * 1000, 2), "formas": sorted(c.formas)}
+                for sql, c in consultas
+            ],
+        }
+
+
+_actual: ContextVar[Perfil | None] = ContextVar("perfil", default=None)
+
+
+def registrar(sql, params, segundos, muchos=False):
+    perfil = _actual.get()
+    if perfil is not None:
+        perfil.registrar(sql, params, segundos, muchos)
+
+
+class MiddlewarePerfilador:
+    """Abre un Perfil por petición, agrega la cabecera de resumen y loguea las marcadas."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        perfil = Perfil()
+        token = _actual.set(perfil)
+        inicio = time.perf_counter()
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                # lo ejecutado hasta aquí; en streaming faltan las lecturas siguientes
+                sentencias, distintas, bd_ms, repetidas = perfil.resumen()
+                valor = f"sentencias={sentencias}; distintas={distintas}; bd_ms={bd_ms:.1f}; repetidas={repetidas}"
+                mensaje["headers"] = [*mensaje.get("headers", []), (CABECERA.lower().encode(), valor.encode())]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _actual.reset(token)
+            ruta = getattr(scope.get("route"), "path", None) or scope["path"]
+            informe = perfil.informe(scope["method"], ruta, time.perf_counter() - inicio)
+            if informe is not None:
+                icono = "🐢" if informe["alertas"] else "🔎"
+                print(f"{icono} PERFIL SQL:", json.dumps(informe, ensure_ascii=False, default=str))
@@ -0,0 +1,70 @@
+import os
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+from services import correo
+
+# Plantillas de correo en templates/correos: <nombre>.txt (obligatoria) y
+# <nombre>.html (opcional). Se compilan una sola vez al arrancar; render()
+# solo ejecuta el código ya compilado.
+DIRECTORIO = os.getenv(
+    "PLANTILLAS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "correos"),
+)
+
+ASUNTOS = {
+    "cita_confirmada": "✅ Confirmación de cita médica - MediciCol",
+    "recordatorio": "⏰ Recordatorio de cita médica - MediciCol",
+    "cambio_cancelada": "🔄 Cita {{ motivo }} - MediciCol",
+    "cambio_reprogramada": "🔄 Cita {{ motivo }} - MediciCol",
+    "cita_cancelada": "❌ Tu cita ha sido cancelada - MediciCol",
+}
+
+
+class Plantillas:
+    def __init__(self, directorio=DIRECTORIO, asuntos=ASUNTOS):
+        self.asuntos = asuntos
+        # auto_reload=False: render() no vuelve a mirar el disco
+        self.env = Environment(
+            loader=FileSystemLoader(directorio),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            auto_reload=False,
+            keep_trailing_newline=True,
+        )
+        # los asuntos van a una cabecera de texto plano: sin escape HTML
+        # (select_autoescape también escapa las plantillas de from_string)
+        self.env_asuntos = Environment(autoescape=False, undefined=StrictUndefined)
+        self._compiladas = {}   # nombre -> (asunto, texto, html | None)
+
+    def cargar(self):
+        """Compila todas las plantillas; un error de sintaxis aparece al arrancar, no al enviar."""
+        disponibles = set(self.env.list_templates())
+        compiladas = {}
+        for nombre, asunto in self.asuntos.items():
+            html = f"{nombre}.html"
+            compiladas[nombre] = (
+                self.env_asuntos.from_string(asunto),
+                self.env.get_template(f"{nombre}.txt"),
+                self.env.get_template(html) if html in disponibles else None,
+            )
+        self._compiladas = compiladas
+        return self
+
+    def render(self, nombre, **datos):
+        """(asunto, texto, html | None) de la plantilla con los datos dados."""
+        if not self._compiladas:
+            self.cargar()
+        asunto, texto, html = self._compiladas[nombre]
+        return (
+            asunto.render(datos),
+            texto.render(datos),
+            html.render(datos) if html is not None else None,
+        )
+
+    def mensaje(self, nombre, destinatarios, **datos):
+        asunto, texto, html = self.render(nombre, **datos)
+        return correo.crear_mensaje(asunto, destinatarios, texto, html)
+
+
+plantillas = Plantillas()
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+
+from almacen import almacen
+from database import run_db
+from services import correo
+from services.plantillas import plantillas
+
+# Lote de recordatorios: todas las citas de una fecha en una sola consulta,
+# enviadas por las sesiones SMTP de services.correo con concurrencia acotada.
+# Cada envío aceptado se anota en RecordatoriosEnviados para no repetirlo.
+
+RECORDATORIOS_HORA = os.getenv("RECORDATORIOS_HORA", "18:00")
+RECORDATORIOS_CONCURRENCIA = int(os.getenv("RECORDATORIOS_CONCURRENCIA", 20))
+RECORDATORIOS_LOTE_REGISTRO = int(os.getenv("RECORDATORIOS_LOTE_REGISTRO", 100))
+
+
+def pendientes(conn, fecha):
+    """(id_cita, correo, nombre_usuario, medico, fecha, hora) de las citas sin recordatorio."""
+    return almacen.recordatorios_pendientes(conn.cursor(), fecha)
+
+
+def registrar(conn, fecha, ids_cita):
+    cursor = conn.cursor()
+    try:
+        almacen.registrar_recordatorios(cursor, fecha, ids_cita)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+_en_curso = set()
+
+
+async def enviar_lote(fecha=None, concurrencia=RECORDATORIOS_CONCURRENCIA, despachador=None):
+    """Envía los recordatorios pendientes de `fecha` (por defecto mañana) y devuelve un informe."""
+    fecha = fecha or date.today() + timedelta(days=1)
+    despachador = despachador or correo.despachador
+    if fecha in _en_curso:
+        return None
+    _en_curso.add(fecha)
+
+    try:
+        inicio = time.perf_counter()
+        filas = await run_db(pendientes, fecha)
+
+        sem = asyncio.Semaphore(concurrencia)
+        enviados = []
+        fallidos = []
+        por_registrar = []
+
+        async def uno(fila):
+            id_cita, destinatario, nombre_usuario, medico, dia, hora = fila
+            mensaje = plantillas.mensaje(
+                "recordatorio", [destinatario],
+                nombre_usuario=nombre_usuario, medico=medico, fecha=str(dia)[:10], hora=str(hora)[:5],
+            )
+            async with sem:
+                entregado = await despachador.entregar(mensaje)
+            if not entregado:
+                fallidos.append(id_cita)
+                return
+            enviados.append(id_cita)
+            por_registrar.append(id_cita)
+            # anotar por tandas: si el proceso cae, un relanzamiento repite como mucho una tanda
+            if len(por_registrar) >= RECORDATORIOS_LOTE_REGISTRO:
+                tanda = por_registrar[:]
+                por_registrar.clear()
+                await run_db(registrar, fecha, tanda)
+
+        await asyncio.gather(*(uno(fila) for fila in filas))
+        if por_registrar:
+            await run_db(registrar, fecha, por_registrar)
+
+        segundos = time.perf_counter() - inicio
+        return {
+            "fecha": fecha.isoformat(),
+            "seleccionadas": len(filas),
+            "enviados": len(enviados),
+            "fallidos": len(fallidos),
+            "ids_fallidos": fallidos,
+            "segundos": round(segundos, 3),
+            "correos_por_segundo": round(len(enviados) / segundos, 1) if segundos else None,
+        }
+    finally:
+        _en_curso.discard(fecha)
@@ -0,0 +1,126 @@
+from datetime import date
+
+from fastapi import HTTPException
+
+from almacen import almacen
+from services import horarios, outbox, resumenes
+from services.indice_disponibilidad import indice
+
+# Reserva de turnos en una sola sentencia: el INSERT solo ocurre si el turno
+# está libre (y, si se pide, si el médico es de la especialidad). Cada almacén
+# serializa las reservas concurrentes del mismo turno a su manera y el índice
+# único UX_Citas_medico_fecha_hora (schema.py) es el respaldo final.
+
+OCUPADO = "❌ El médico ya tiene una cita en ese horario."
+OTRA_ESPECIALIDAD = "❌ El médico no pertenece a esa especialidad."
+
+
+def reservar(cursor, id_usuario, id_medico, id_especialidad, fecha, hora,
+             estado=resumenes.ESTADO_INICIAL, validar_especialidad=True):
+    """Inserta la cita si el turno está libre y devuelve su id_cita (sin commit).
+
+    Registra también el resumen diario y el evento del outbox en la misma
+    transacción. Lanza HTTPException 400 si el turno está tomado o el médico
+    no es de la especialidad.
+    """
+    # el índice en memoria puede rechazar sin ir a la BD; "libre" se confirma abajo
+    if indice.ocupado_en_memoria(id_medico, fecha, hora):
+        raise HTTPException(status_code=400, detail=OCUPADO)
+
+    try:
+        id_cita = almacen.reservar(
+            cursor, id_usuario, id_medico, id_especialidad, fecha, hora, estado, validar_especialidad
+        )
+    except Exception as e:
+        if almacen.es_duplicado(e):
+            raise HTTPException(status_code=400, detail=OCUPADO)
+        raise
+
+    if id_cita is None:
+        # no se insertó: solo en este camino se averigua el motivo
+        if validar_especialidad and not almacen.medico_en_especialidad(cursor, id_medico, id_especialidad):
+            raise HTTPException(status_code=400, detail=OTRA_ESPECIALIDAD)
+        raise HTTPException(status_code=400, detail=OCUPADO)
+
+    resumenes.ajustar(cursor, fecha, id_medico, estado, 1)
+    outbox.registrar(cursor, outbox.CONFIRMADA, id_cita, id_usuario, id_medico, fecha, hora)
+    return id_cita
+
+
+def confirmar(id_medico, fecha, hora):
+    """Tras el commit: marca el turno en el índice y despierta el relay del outbox."""
+    indice.reservar(id_medico, fecha, hora)
+    outbox.relay.avisar()
+
+
+# ---------------------------------------------------
+# RESERVA EN LOTE
+# ---------------------------------------------------
+OCUPADO_EN_LOTE = "❌ El turno está repetido dentro del lote."
+FORMATO_INVALIDO = "❌ Fecha u hora inválida (YYYY-MM-DD, HH:MM)."
+
+
+def _clave(id_medico, fecha, hora):
+    return id_medico, str(fecha)[:10], horarios.a_minutos(hora)
+
+
+def reservar_lote(cursor, citas, estado=resumenes.ESTADO_INICIAL):
+    """Reserva muchas citas con operaciones de conjunto; no hace commit.
+
+    `citas` es una lista de (id_usuario, id_medico, id_especialidad, fecha, hora).
+    Devuelve una lista paralela: id_cita si se reservó, o el mensaje de error.
+    Las filas viajan una sola vez a una tabla temporal; la validación de
+    especialidad, el choque con Citas, la inserción y el resumen diario son
+    operaciones de conjunto sobre ella (ver almacen.reservar_lote).
+    """
+    resultados = [None] * len(citas)
+
+    # turnos repetidos dentro del propio lote: gana el primero
+    vistos = {}
+    filas = []
+    for i, (id_usuario, id_medico, id_especialidad, fecha, hora) in enumerate(citas):
+        # tipos nativos: SQL Server enlaza DATE / TIME sin conversiones de texto
+        try:
+            fecha = date.fromisoformat(str(fecha)[:10])
+            hora = horarios.a_hora(horarios.a_minutos(hora))
+        except (ValueError, IndexError):
+            resultados[i] = FORMATO_INVALIDO
+            continue
+        clave = _clave(id_medico, fecha, hora)
+        if clave in vistos:
+            resultados[i] = OCUPADO_EN_LOTE
+            continue
+        vistos[clave] = i
+        filas.append((i, id_usuario, id_medico, id_especialidad, fecha, hora))
+
+    if not filas:
+        return resultados
+
+    try:
+        insertadas, otra_especialidad = almacen.reservar_lote(
+            cursor, filas, estado, estado or resumenes.ESTADO_INICIAL
+        )
+    except Exception as e:
+        if almacen.es_duplicado(e):
+            raise HTTPException(status_code=409, detail="Otra reserva tomó uno de los turnos; reintenta el lote")
+        raise
+
+    eventos = []
+    for id_cita, id_medico, fecha, hora in insertadas:
+        i = vistos[_clave(id_medico, fecha, hora)]
+        resultados[i] = id_cita
+        eventos.append((id_cita, citas[i][0], id_medico, fecha, hora))
+
+    for i, *_ in filas:
+        if resultados[i] is None:
+            resultados[i] = OTRA_ESPECIALIDAD if i in otra_especialidad else OCUPADO
+
+    outbox.registrar_lote(cursor, outbox.CONFIRMADA, eventos)
+    return resultados
+
+
+def confirmar_lote(citas, resultados):
+    for (_, id_medico, _, fecha, hora), resultado in zip(citas, resultados):
+        if isinstance(resultado, int):
+            indice.reservar(id_medico, fecha, hora)
+    outbox.relay.avisar()
@@ -0,0 +1,110 @@
+from datetime import date, timedelta
+
+from almacen import almacen
+from services.horarios import a_minutos
+
+# Resumen diario de citas: (fecha, id_medico, estado) -> total.
+# Se actualiza en la misma transacción que cada escritura sobre Citas y se
+# reconstruye completo por la noche (junto con UsuariosPorRol) para corregir
+# cualquier deriva.
+
+ESTADO_INICIAL = "Pendiente"
+
+
+def _estado(estado):
+    return estado or ESTADO_INICIAL
+
+
+def ajustar(cursor, fecha, id_medico, estado, delta):
+    almacen.ajustar_resumen(cursor, fecha, id_medico, _estado(estado), delta)
+
+
+def mover(cursor, antes, despues):
+    """Pasa una cita de (fecha, id_medico, estado) `antes` a `despues`; None = no existía / ya no existe."""
+    if antes is not None:
+        antes = (str(antes[0])[:10], antes[1], _estado(antes[2]))
+    if despues is not None:
+        despues = (str(despues[0])[:10], despues[1], _estado(despues[2]))
+    if antes == despues:
+        return
+    if antes is not None:
+        ajustar(cursor, *antes, -1)
+    if despues is not None:
+        ajustar(cursor, *despues, 1)
+
+
+def reconstruir(conn):
+    cursor = conn.cursor()
+    try:
+        almacen.reconstruir_resumen(cursor, ESTADO_INICIAL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# ---------------------------------------------------
+# SERIES DE TIEMPO
+# ---------------------------------------------------
+def periodo(fecha, granularidad):
+    if granularidad == "semana":
+        return fecha - timedelta(days=fecha.weekday())
+    if granularidad == "mes":
+        return fecha.replace(day=1)
+    return fecha
+
+
+def dias_del_rango(desde, hasta):
+    dia = desde
+    while dia <= hasta:
+        yield dia
+        dia += timedelta(days=1)
+
+
+def series(filas, granularidad):
+    """Agrupa filas (fecha, id_medico, estado, total) del resumen por periodo."""
+    grupos = {}
+    for fecha, _, estado, total in filas:
+        clave = periodo(date.fromisoformat(str(fecha)[:10]), granularidad)
+        grupo = grupos.setdefault(clave, {"periodo": clave.isoformat(), "reservas": 0, "estados": {}})
+        grupo["reservas"] += total
+        grupo["estados"][estado] = grupo["estados"].get(estado, 0) + total
+
+    resultado = []
+    for clave in sorted(grupos):
+        grupo = grupos[clave]
+        grupo["canceladas"] = grupo["estados"].get("Cancelada", 0)
+        grupo["atendidas"] = grupo["estados"].get("Atendida", 0)
+        resultado.append(grupo)
+    return resultado
+
+
+def utilizacion(filas, franjas, nombres_dias, desde, hasta, minutos_por_cita):
+    """Minutos reservados (sin canceladas) frente a minutos de DisponibilidadMedica en el rango."""
+    # minutos disponibles por médico y día de la semana
+    semanal = {}
+    for id_medico, dia_semana, inicio, fin in franjas:
+        por_dia = semanal.setdefault(id_medico, {})
+        por_dia[dia_semana] = por_dia.get(dia_semana, 0) + a_minutos(fin) - a_minutos(inicio)
+
+    cuantos_dias = {}
+    for dia in dias_del_rango(desde, hasta):
+        nombre = nombres_dias[dia.isoweekday()]
+        cuantos_dias[nombre] = cuantos_dias.get(nombre, 0) + 1
+
+    reservadas = {}
+    for _, id_medico, estado, total in filas:
+        if estado != "Cancelada":
+            reservadas[id_medico] = reservadas.get(id_medico, 0) + total
+
+    resultado = []
+    for id_medico in sorted(set(semanal) | set(reservadas)):
+        disponibles = sum(m * cuantos_dias.get(d, 0) for d, m in semanal.get(id_medico, {}).items())
+        ocupados = reservadas.get(id_medico, 0) * minutos_por_cita
+        resultado.append({
+            "id_medico": id_medico,
+            "minutos_disponibles": disponibles,
+            "minutos_reservados": ocupados,
+            "utilizacion": round(ocupados / disponibles, 4) if disponibles else None,
+        })
+    return resultado
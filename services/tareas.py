@@ -0,0 +1,22 @@
+import asyncio
+from datetime import datetime, timedelta
+
+
+def segundos_hasta(hora):
+    """Segundos que faltan para la próxima vez que el reloj marque hora ("HH:MM")."""
+    hh, mm = (int(x) for x in hora.split(":"))
+    ahora = datetime.now()
+    siguiente = ahora.replace(hour=hh, minute=mm, second=0, microsecond=0)
+    if siguiente <= ahora:
+        siguiente += timedelta(days=1)
+    return (siguiente - ahora).total_seconds()
+
+
+async def diaria(hora, tarea, nombre):
+    """Ejecuta `await tarea()` todos los días a la hora indicada hasta que se cancele."""
+    while True:
+        await asyncio.sleep(segundos_hasta(hora))
+        try:
+            await tarea()
+        except Exception as e:
+            print(f"❌ Error en la tarea {nombre}:", e)
@@ -0,0 +1,158 @@
+import os
+import uuid
+
+import pytest
+
+import schema
+from almacen import almacen, crear
+from almacen.sqlite import ESQUEMA, conectar
+from services.indice_disponibilidad import indice
+
+# Las pruebas de contrato corren contra los dos almacenes. SQLite usa una base
+# en tmp_path; SQL Server una base desechable que se crea y se borra en cada
+# prueba, y solo si MEDICICOL_TEST_SQLSERVER trae una cadena ODBC (sin
+# DATABASE) con permiso para crear bases. Nunca se toca la base del .env.
+SQLSERVER = os.getenv("MEDICICOL_TEST_SQLSERVER")
+
+# Tablas originales de la app (en producción ya existen; schema.py agrega el resto)
+TABLAS_SQLSERVER = [
+    """
+    CREATE TABLE dbo.Especialidades (
+        id_especialidad INT IDENTITY(1,1) PRIMARY KEY,
+        nombre NVARCHAR(100) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE dbo.Usuarios (
+        id_usuario INT IDENTITY(1,1) PRIMARY KEY,
+        nombre NVARCHAR(100), cedula NVARCHAR(20), correo NVARCHAR(100),
+        contrasena NVARCHAR(255), genero NVARCHAR(10), rol NVARCHAR(20),
+        contrasena2 NVARCHAR(255), fecha_registro DATETIME DEFAULT GETDATE()
+    )
+    """,
+    """
+    CREATE TABLE dbo.Medicos (
+        id_medico INT IDENTITY(1,1) PRIMARY KEY,
+        nombre NVARCHAR(100), cedula NVARCHAR(20), correo NVARCHAR(100),
+        telefono NVARCHAR(20), id_especialidad INT
+    )
+    """,
+    """
+    CREATE TABLE dbo.DisponibilidadMedica (
+        id_disponibilidad INT IDENTITY(1,1) PRIMARY KEY,
+        id_medico INT, dia_semana NVARCHAR(20), hora_inicio TIME, hora_fin TIME
+    )
+    """,
+    """
+    CREATE TABLE dbo.Citas (
+        id_cita INT IDENTITY(1,1) PRIMARY KEY,
+        id_usuario INT NULL, id_medico INT, id_especialidad INT,
+        fecha DATE, hora TIME, estado NVARCHAR(50), nota_medica NVARCHAR(MAX),
+        fecha_actualizacion DATETIME
+    )
+    """,
+    """
+    CREATE TABLE dbo.DudasYQuejas (
+        id_observacion INT IDENTITY(1,1) PRIMARY KEY,
+        correo NVARCHAR(100), nombre NVARCHAR(100), observaciones NVARCHAR(MAX),
+        fecha DATETIME DEFAULT GETDATE()
+    )
+    """,
+]
+
+
+def _base_sqlite(tmp_path, migrar=True):
+    ruta = str(tmp_path / "contrato.db")
+    conn = conectar(ruta)
+    if migrar:
+        schema.asegurar_esquema(conn)
+    else:
+        conn.executescript(ESQUEMA)   # tablas sin migraciones registradas ni datos derivados
+    return (lambda: conectar(ruta)), conn, lambda: None
+
+
+def _base_sqlserver(migrar=True):
+    if not SQLSERVER:
+        pytest.skip("MEDICICOL_TEST_SQLSERVER no está definida")
+    pyodbc = pytest.importorskip("pyodbc")
+
+    nombre = f"medicicol_test_{uuid.uuid4().hex[:12]}"
+    maestra = pyodbc.connect(SQLSERVER, autocommit=True)
+    maestra.cursor().execute(f"CREATE DATABASE [{nombre}]")
+
+    def abrir():
+        return pyodbc.connect(f"{SQLSERVER};DATABASE={nombre}")
+
+    conn = abrir()
+    cursor = conn.cursor()
+    for ddl in TABLAS_SQLSERVER:
+        cursor.execute(ddl)
+    conn.commit()
+    if migrar:
+        schema.asegurar_esquema(conn)
+
+    def borrar():
+        maestra.cursor().execute(
+            f"ALTER DATABASE [{nombre}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE; DROP DATABASE [{nombre}]"
+        )
+        maestra.close()
+
+    return abrir, conn, borrar
+
+
+class BaseDePrueba:
+    """Almacén del backend, una conexión abierta y `abrir()` para conexiones extra."""
+
+    def __init__(self, backend, abrir, conn):
+        self.backend = backend
+        self.almacen = crear(backend)
+        self.abrir = abrir
+        self.conn = conn
+
+    def sembrar(self):
+        """2 especialidades, un médico en cada una (ids 1 y 2) y 2 pacientes (ids 1 y 2)."""
+        a, cursor = self.almacen, self.conn.cursor()
+        for nombre in ("Medicina general", "Pediatría"):
+            a.crear_especialidad(cursor, nombre)
+        for n in (1, 2):
+            a.crear_medico(cursor, f"Médico {n}", f"M{n}", f"medico{n}@prueba.test", "300", n)
+            a.crear_usuario(cursor, f"Paciente {n}", f"P{n}", f"paciente{n}@prueba.test",
+                            "hash", "M", "paciente", "hash")
+        self.conn.commit()
+        return self
+
+
+@pytest.fixture(params=["sqlite", "sqlserver"])
+def base(request, tmp_path):
+    if request.param == "sqlite":
+        abrir, conn, borrar = _base_sqlite(tmp_path)
+    else:
+        abrir, conn, borrar = _base_sqlserver()
+    try:
+        yield BaseDePrueba(request.param, abrir, conn).sembrar()
+    finally:
+        conn.close()
+        borrar()
+
+
+@pytest.fixture(params=["sqlite", "sqlserver"])
+def base_sin_migrar(request, tmp_path):
+    """Como `base` pero con las tablas originales, sin datos y sin correr schema.py."""
+    if request.param == "sqlite":
+        abrir, conn, borrar = _base_sqlite(tmp_path, migrar=False)
+    else:
+        abrir, conn, borrar = _base_sqlserver(migrar=False)
+    try:
+        yield BaseDePrueba(request.param, abrir, conn)
+    finally:
+        conn.close()
+        borrar()
+
+
+@pytest.fixture
+def base_app(base, monkeypatch):
+    """`base` con el almacén de routers y servicios apuntando a ella y el índice en memoria vacío."""
+    monkeypatch.setattr(almacen, "_impl", base.almacen)
+    indice.limpiar()
+    yield base
+    indice.limpiar()
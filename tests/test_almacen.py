@@ -0,0 +1,278 @@
+import pytest
+
+from services import paginacion
+from services.resumenes import ESTADO_INICIAL
+
+# Contrato del almacén: las mismas pruebas contra SQLite y SQL Server (ver conftest.py).
+# Fechas y horas vuelven como texto en SQLite y como date / time en SQL Server,
+# así que se comparan por su forma ISO.
+
+FECHA = "2026-03-02"
+
+
+def _dia(valor):
+    return str(valor)[:10]
+
+
+def _hora(valor):
+    return str(valor)[:5]
+
+
+def _reservar(base, cursor, hora, id_medico=1, id_especialidad=1, id_usuario=1, fecha=FECHA):
+    return base.almacen.reservar(cursor, id_usuario, id_medico, id_especialidad, fecha, hora,
+                                 None, validar_especialidad=True)
+
+
+# ---------------------------------------------------
+# CHOQUES DE RESERVA
+# ---------------------------------------------------
+def test_un_turno_se_reserva_una_sola_vez(base):
+    cursor = base.conn.cursor()
+    id_cita = _reservar(base, cursor, "08:00")
+    base.conn.commit()
+    assert id_cita is not None
+
+    # la misma hora escrita distinto es el mismo turno
+    assert _reservar(base, cursor, "8:00:00", id_usuario=2) is None
+    base.conn.commit()
+    assert [_hora(h) for h in base.almacen.horas_ocupadas(cursor, 1, FECHA)] == ["08:00"]
+
+
+def test_la_reserva_valida_la_especialidad(base):
+    cursor = base.conn.cursor()
+    assert _reservar(base, cursor, "08:00", id_especialidad=2) is None
+    base.conn.commit()
+    assert not base.almacen.medico_en_especialidad(cursor, 1, 2)
+    assert base.almacen.medico_en_especialidad(cursor, 1, 1)
+
+
+def test_el_lote_inserta_solo_turnos_libres_y_de_la_especialidad(base):
+    cursor = base.conn.cursor()
+    _reservar(base, cursor, "08:00")
+    base.conn.commit()
+
+    insertadas, otra_especialidad = base.almacen.reservar_lote(cursor, [
+        (0, 1, 1, 1, FECHA, "08:00"),    # ocupado
+        (1, 1, 1, 1, FECHA, "08:30"),
+        (2, 2, 1, 2, FECHA, "09:00"),    # el médico 1 no es de la especialidad 2
+        (3, 2, 2, 2, FECHA, "09:00"),
+    ], None, ESTADO_INICIAL)
+    base.conn.commit()
+
+    assert sorted((m, _hora(h)) for _, m, _, h in insertadas) == [(1, "08:30"), (2, "09:00")]
+    assert otra_especialidad == {2}
+    # el resumen cuenta solo las insertadas por el lote
+    assert _resumen(base, cursor) == [(FECHA, 1, ESTADO_INICIAL, 1), (FECHA, 2, ESTADO_INICIAL, 1)]
+
+
+def test_mover_a_un_turno_ocupado_viola_el_indice_unico(base):
+    cursor = base.conn.cursor()
+    _reservar(base, cursor, "08:00")
+    otra = _reservar(base, cursor, "09:00", id_usuario=2)
+    base.conn.commit()
+
+    with pytest.raises(Exception) as error:
+        base.almacen.mover_cita(cursor, otra, 1, FECHA, "08:00")
+    base.conn.rollback()
+    assert base.almacen.es_duplicado(error.value)
+    assert _hora(base.almacen.cita(cursor, otra)[3]) == "09:00"
+
+
+def test_borrar_devuelve_el_turno_liberado(base):
+    cursor = base.conn.cursor()
+    id_cita = _reservar(base, cursor, "08:00")
+    borrada = base.almacen.borrar_cita(cursor, id_cita)
+    base.conn.commit()
+    assert (borrada[0], _dia(borrada[1]), _hora(borrada[2]), borrada[4]) == (1, FECHA, "08:00", 1)
+    assert base.almacen.borrar_cita(cursor, id_cita) is None
+
+
+# ---------------------------------------------------
+# PAGINACIÓN POR KEYSET
+# ---------------------------------------------------
+def _paginas(pedir, limit):
+    ids, token = [], None
+    while True:
+        filas, token = paginacion.recortar(pedir(limit + 1, token), limit, pedir.clave)
+        ids.extend(f[0] for f in filas)
+        if token is None:
+            return ids
+
+
+def _sembrar_citas(base):
+    cursor = base.conn.cursor()
+    filas = [
+        (i, 1 + i % 2, 1 + i % 2, 1 + i % 2, f"2026-03-0{1 + i % 3}", f"{8 + i // 6:02d}:{i % 6 * 10:02d}")
+        for i in range(12)
+    ]
+    insertadas, _ = base.almacen.reservar_lote(cursor, filas, None, ESTADO_INICIAL)
+    base.conn.commit()
+    return sorted((_dia(f), _hora(h), i, m) for i, m, f, h in insertadas)
+
+
+def test_paginas_de_citas_sin_huecos_ni_repetidas(base):
+    orden = _sembrar_citas(base)
+    cursor = base.conn.cursor()
+
+    def pedir(n, token):
+        return base.almacen.pagina_citas(cursor, n, token, None, None, None, None, None)
+    pedir.clave = lambda f: (f[8], f[9], f[0])
+
+    assert _paginas(pedir, 5) == [i for _, _, i, _ in reversed(orden)]
+
+
+def test_paginas_de_admin_con_filtros(base):
+    orden = _sembrar_citas(base)
+    cursor = base.conn.cursor()
+
+    def pedir(n, token):
+        return base.almacen.pagina_citas_admin(cursor, n, token, None, None, 2, None, None,
+                                               "2026-03-02", "2026-03-03")
+    pedir.clave = lambda f: (f[4], f[5], f[0])
+
+    esperadas = [i for f, _, i, m in reversed(orden) if m == 2 and f >= "2026-03-02"]
+    assert esperadas and _paginas(pedir, 2) == esperadas
+
+
+def test_paginas_de_la_agenda_del_medico(base):
+    orden = _sembrar_citas(base)
+    cursor = base.conn.cursor()
+
+    def pedir(n, token):
+        return base.almacen.pagina_citas_medico(cursor, n, token, 1, "2026-03-01", "2026-03-03", None)
+    pedir.clave = lambda f: (f[2], f[3], f[0])
+
+    assert _paginas(pedir, 4) == [i for _, _, i, m in orden if m == 1]
+
+
+# ---------------------------------------------------
+# RESUMEN DIARIO
+# ---------------------------------------------------
+def _resumen(base, cursor):
+    filas = base.almacen.resumen(cursor, "2026-03-01", "2026-03-31")
+    return sorted((_dia(f), m, e, t) for f, m, e, t in filas if t)
+
+
+def test_el_resumen_del_lote_coincide_con_la_reconstruccion(base):
+    _sembrar_citas(base)
+    cursor = base.conn.cursor()
+    incremental = _resumen(base, cursor)
+    assert sum(t for *_, t in incremental) == 12
+
+    base.almacen.reconstruir_resumen(cursor, ESTADO_INICIAL)
+    base.conn.commit()
+    assert _resumen(base, cursor) == incremental
+
+
+def test_ajustes_y_reconstruccion_coinciden(base):
+    cursor = base.conn.cursor()
+    a = _reservar(base, cursor, "08:00")
+    b = _reservar(base, cursor, "09:00", id_usuario=2)
+    for _ in (a, b):
+        base.almacen.ajustar_resumen(cursor, FECHA, 1, ESTADO_INICIAL, 1)
+
+    (fecha, id_medico, antes, despues, id_usuario, hora), = base.almacen.cambiar_estado(cursor, a, "Cancelada")
+    assert (_dia(fecha), id_medico, antes, despues, id_usuario, _hora(hora)) == (FECHA, 1, None, "Cancelada", 1, "08:00")
+    base.almacen.ajustar_resumen(cursor, fecha, id_medico, ESTADO_INICIAL, -1)
+    base.almacen.ajustar_resumen(cursor, fecha, id_medico, despues, 1)
+
+    (fecha, id_medico, antes, despues), = base.almacen.agregar_nota(cursor, b, "Control")
+    assert (antes, despues) == (None, "Atendida")
+    base.almacen.ajustar_resumen(cursor, fecha, id_medico, ESTADO_INICIAL, -1)
+    base.almacen.ajustar_resumen(cursor, fecha, id_medico, despues, 1)
+    base.conn.commit()
+
+    incremental = _resumen(base, cursor)
+    assert incremental == [(FECHA, 1, "Atendida", 1), (FECHA, 1, "Cancelada", 1)]
+
+    base.almacen.reconstruir_resumen(cursor, ESTADO_INICIAL)
+    base.conn.commit()
+    assert _resumen(base, cursor) == incremental
+
+
+def test_cambiar_estado_de_una_cita_inexistente(base):
+    cursor = base.conn.cursor()
+    assert base.almacen.cambiar_estado(cursor, 999, "Cancelada") == []
+    assert base.almacen.agregar_nota(cursor, 999, "nada") == []
+    base.conn.rollback()
+
+
+def test_estadisticas_del_resumen_y_los_contadores(base):
+    orden = _sembrar_citas(base)
+    primera = next(i for f, h, i, m in orden if (f, h, m) == ("2026-03-01", "08:00", 1))
+    cursor = base.conn.cursor()
+    (_, _, antes, despues, *_), = base.almacen.cambiar_estado(cursor, primera, "Cancelada")
+    base.almacen.ajustar_resumen(cursor, "2026-03-01", 1, ESTADO_INICIAL, -1)
+    base.almacen.ajustar_resumen(cursor, "2026-03-01", 1, despues, 1)
+
+    base.almacen.crear_usuario(cursor, "Médico 3", "M3", "medico3@prueba.test", "hash", "H", "medico", "hash")
+    base.almacen.actualizar_usuario(cursor, 2, {"rol": "medico"})
+    base.almacen.eliminar_usuario(cursor, 1)
+    base.conn.commit()
+
+    # pacientes, médicos, citas, atendidas, canceladas
+    esperados = (0, 2, 12, 0, 1)
+    assert tuple(base.almacen.totales(cursor)) == esperados
+    por_medico = sorted(tuple(f) for f in base.almacen.citas_por_medico(cursor))
+    assert por_medico == [(1, "Médico 1", "Cancelada", 1), (1, "Médico 1", ESTADO_INICIAL, 5),
+                          (2, "Médico 2", ESTADO_INICIAL, 6)]
+    por_especialidad = sorted((i, e, t) for i, _, e, t in base.almacen.citas_por_especialidad(cursor))
+    assert por_especialidad == [(1, "Cancelada", 1), (1, ESTADO_INICIAL, 5), (2, ESTADO_INICIAL, 6)]
+    por_dia = sorted((_dia(f), e, t) for f, e, t in base.almacen.citas_por_dia(cursor, "2026-03-03"))
+    assert por_dia == [("2026-03-03", ESTADO_INICIAL, 4)]
+
+    # la reconstrucción nocturna llega a lo mismo
+    base.almacen.reconstruir_resumen(cursor, ESTADO_INICIAL)
+    base.conn.commit()
+    assert tuple(base.almacen.totales(cursor)) == esperados
+
+
+# ---------------------------------------------------
+# OUTBOX
+# ---------------------------------------------------
+def _eventos(base, n):
+    cursor = base.conn.cursor()
+    base.almacen.registrar_eventos(cursor, [
+        ("cita_creada", 100 + i, 1, 1, FECHA, "08:00") for i in range(n)
+    ])
+    base.conn.commit()
+    return cursor
+
+
+def test_reclamar_en_orden_y_con_limite(base):
+    cursor = _eventos(base, 5)
+    primeros = base.almacen.reclamar_eventos(cursor, 3, 5, 60)
+    base.conn.commit()
+    resto = base.almacen.reclamar_eventos(cursor, 3, 5, 60)
+    base.conn.commit()
+
+    assert len(primeros) == 3 and primeros == sorted(primeros)
+    assert len(resto) == 2 and min(resto) > max(primeros)
+    # todos bloqueados: nadie más los toma hasta que venza el bloqueo
+    assert base.almacen.reclamar_eventos(cursor, 10, 5, 60) == []
+    base.conn.commit()
+
+
+def test_reintentos_hasta_el_tope_y_confirmacion(base):
+    cursor = _eventos(base, 2)
+    # bloqueo vencido de inmediato: el siguiente reclamo vuelve a tomarlos
+    ids = base.almacen.reclamar_eventos(cursor, 10, 2, -1)
+    base.conn.commit()
+    base.almacen.confirmar_eventos(cursor, ids[:1])
+    base.conn.commit()
+
+    assert base.almacen.reclamar_eventos(cursor, 10, 2, -1) == ids[1:]
+    base.conn.commit()
+    # segundo intento consumido: llegó al tope
+    assert base.almacen.reclamar_eventos(cursor, 10, 2, -1) == []
+    base.conn.commit()
+
+
+def test_eventos_con_destinatario_y_medico(base):
+    cursor = _eventos(base, 1)
+    ids = base.almacen.reclamar_eventos(cursor, 10, 5, 60)
+    (id_evento, tipo, correo, nombre, medico, fecha, hora), = base.almacen.eventos(cursor, ids)
+    base.conn.commit()
+    assert (id_evento, tipo, correo, nombre, medico) == (ids[0], "cita_creada", "paciente1@prueba.test",
+                                                          "Paciente 1", "Médico 1")
+    assert (_dia(fecha), _hora(hora)) == (FECHA, "08:00")
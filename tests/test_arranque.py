@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+
+import database
+import main
+import schema
+
+
+def test_la_api_no_arranca_si_falla_la_migracion(monkeypatch):
+    def fallar(conn):
+        raise RuntimeError("turnos duplicados")
+
+    async def run_db(fn, *args):
+        return fn(None, *args)
+
+    monkeypatch.setattr(schema, "asegurar_esquema", fallar)
+    monkeypatch.setattr(database, "run_db", run_db)
+
+    async def arrancar():
+        async with main.lifespan(main.app):
+            pass
+
+    with pytest.raises(RuntimeError, match="turnos duplicados"):
+        asyncio.run(arrancar())
@@ -0,0 +1,35 @@
+import asyncio
+
+from services.cache import TTLCache
+
+
+def test_una_sola_carga_en_vuelo_por_clave():
+    cache = TTLCache(ttl=30)
+    cargas = []
+
+    async def cargar():
+        cargas.append(1)
+        await asyncio.sleep(0.01)
+        return {"total": len(cargas)}
+
+    async def muchos():
+        return await asyncio.gather(*(cache.obtener("k", cargar) for _ in range(20)))
+
+    resultados = asyncio.run(muchos())
+    assert len(cargas) == 1
+    assert all(r == {"total": 1} for r in resultados)
+    assert cache.metrics()["cargas"] == 1
+
+
+def test_al_vencer_se_vuelve_a_cargar():
+    cache = TTLCache(ttl=-1)   # vence al guardarse
+    cargas = []
+
+    async def cargar():
+        cargas.append(1)
+        return len(cargas)
+
+    async def dos_veces():
+        return [await cache.obtener("k", cargar), await cache.obtener("k", cargar)]
+
+    assert asyncio.run(dos_veces()) == [1, 2]
@@ -0,0 +1,131 @@
+import asyncio
+import socket
+import time
+
+import pytest
+
+from services import correo
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class Buzon:
+    """Handler de aiosmtpd que guarda los mensajes y rechaza los primeros `rechazar`."""
+
+    def __init__(self, rechazar=0):
+        self.recibidos = []
+        self.rechazar = rechazar
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.rechazar > 0:
+            self.rechazar -= 1
+            return "451 Intenta más tarde"
+        self.recibidos.append(envelope.rcpt_tos)
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp():
+    """(buzón, puerto) de un servidor SMTP local que corre en su propio hilo."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+    buzon = Buzon()
+    servidor = controller.Controller(buzon, hostname="127.0.0.1", port=puerto)
+    servidor.start()
+    yield buzon, puerto
+    servidor.stop()
+
+
+def _despachador(puerto, guardados, **opciones):
+    async def guardar(envios):
+        guardados.extend(envios)
+
+    return correo.MailDispatcher(
+        hostname="127.0.0.1", port=puerto, username="", password="", start_tls=False,
+        use_tls=False, trabajadores=1, guardar=guardar, **opciones,
+    )
+
+
+def _mensaje(n=1):
+    return correo.crear_mensaje(f"Prueba {n}", [f"paciente{n}@prueba.test"], "Hola")
+
+
+def test_entrega_por_una_sesion_persistente(smtp):
+    buzon, puerto = smtp
+    guardados = []
+
+    async def correr():
+        despachador = _despachador(puerto, guardados)
+        despachador.iniciar()
+        entregados = await asyncio.gather(*(despachador.entregar(_mensaje(n)) for n in range(5)))
+        await despachador.detener()
+        return entregados, despachador.metrics()
+
+    entregados, m = asyncio.run(correr())
+    assert entregados == [True] * 5
+    assert sorted(r[0] for r in buzon.recibidos) == [f"paciente{n}@prueba.test" for n in range(5)]
+    assert (m["enviados"], m["sesiones"], m["fallidos"]) == (5, 1, 0)
+    assert guardados == []
+
+
+def test_reintenta_con_backoff_hasta_entregar(smtp):
+    buzon, puerto = smtp
+    buzon.rechazar = 2
+    guardados = []
+
+    async def correr():
+        despachador = _despachador(puerto, guardados, backoff=0.05, intentos=5)
+        inicio = time.perf_counter()
+        entregado = await despachador.entregar(_mensaje())
+        segundos = time.perf_counter() - inicio
+        await despachador.detener()
+        return entregado, segundos, despachador.metrics()
+
+    entregado, segundos, m = asyncio.run(correr())
+    assert entregado is True
+    assert segundos >= 0.05 + 0.1   # backoff exponencial: 0.05 y 0.1 s
+    assert (m["reintentos"], m["enviados"], m["fallidos"]) == (2, 1, 0)
+    assert len(buzon.recibidos) == 1
+
+
+def test_agotados_los_intentos_pasa_a_correos_fallidos(smtp, base):
+    buzon, puerto = smtp
+    buzon.rechazar = 100
+
+    async def guardar(envios):
+        correo._guardar_fallidos(base.conn, [e.fila() for e in envios])
+
+    async def correr():
+        despachador = correo.MailDispatcher(
+            hostname="127.0.0.1", port=puerto, username="", password="", start_tls=False,
+            use_tls=False, trabajadores=1, backoff=0.01, intentos=3, guardar=guardar,
+        )
+        entregado = await despachador.entregar(_mensaje(7))
+        await despachador.detener()
+        return entregado, despachador.metrics()
+
+    entregado, m = asyncio.run(correr())
+    assert entregado is False
+    assert (m["reintentos"], m["fallidos"], m["sin_guardar"]) == (2, 1, 0)
+    (_, para, asunto, intentos, error, _, _), = base.almacen.correos_fallidos(base.conn.cursor(), 10)
+    base.conn.commit()
+    assert (para, asunto, intentos) == ("paciente7@prueba.test", "Prueba 7", 3)
+    assert "451" in error
+
+
+def test_detener_resuelve_los_envios_que_esperaban_su_backoff(smtp):
+    buzon, puerto = smtp
+    buzon.rechazar = 1
+    guardados = []
+
+    async def correr():
+        despachador = _despachador(puerto, guardados, backoff=60)
+        pendiente = asyncio.create_task(despachador.entregar(_mensaje()))
+        while despachador.metrics()["reintentando"] == 0:
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(despachador.detener(timeout=0.1), 5)
+        return await asyncio.wait_for(pendiente, 1)
+
+    assert asyncio.run(correr()) is False
+    assert [e.ultimo_error for e in guardados] == ["Servicio detenido durante el backoff"]
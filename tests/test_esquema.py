@@ -0,0 +1,92 @@
+import pytest
+
+import schema
+from services.resumenes import ESTADO_INICIAL
+
+# Una base de producción que ya tenía citas antes de las migraciones: las
+# estadísticas deben salir bien desde la primera petición, sin esperar la
+# reconstrucción nocturna.
+
+
+def _sembrar_historial(base):
+    cursor = base.conn.cursor()
+    cursor.execute("INSERT INTO Especialidades (nombre) VALUES ('Medicina general')")
+    cursor.execute("INSERT INTO Medicos (nombre, correo, id_especialidad) VALUES ('Médico 1', 'm1@prueba.test', 1)")
+    for n, rol in ((1, "paciente"), (2, "paciente"), (3, "medico")):
+        cursor.execute(
+            "INSERT INTO Usuarios (nombre, correo, rol) VALUES (?, ?, ?)",
+            (f"Usuario {n}", f"u{n}@prueba.test", rol),
+        )
+    for hora, estado in (("08:00:00", None), ("09:00:00", "Atendida"), ("10:00:00", "Cancelada"),
+                         ("11:00:00", None)):
+        cursor.execute(
+            "INSERT INTO Citas (id_usuario, id_medico, id_especialidad, fecha, hora, estado) VALUES (?, ?, ?, ?, ?, ?)",
+            (1, 1, 1, "2026-02-02", hora, estado),
+        )
+    base.conn.commit()
+
+
+def test_las_migraciones_calculan_los_resumenes_desde_las_tablas_existentes(base_sin_migrar):
+    base = base_sin_migrar
+    _sembrar_historial(base)
+    schema.asegurar_esquema(base.conn)
+    assert schema.version_actual(base.conn) == schema.VERSION_ACTUAL
+
+    cursor = base.conn.cursor()
+    # pacientes, médicos, citas, atendidas, canceladas
+    assert tuple(base.almacen.totales(cursor)) == (2, 1, 4, 1, 1)
+    resumen = sorted((e, t) for _, _, e, t in base.almacen.resumen(cursor, "2026-02-01", "2026-02-28"))
+    assert resumen == [("Atendida", 1), ("Cancelada", 1), (ESTADO_INICIAL, 2)]
+
+    # cancelar una cita anterior a la migración no deja el resumen en negativo
+    id_cita = next(i for i, *_ in base.almacen.pagina_citas_medico(
+        cursor, 10, None, 1, "2026-02-02", "2026-02-02", None) if i)
+    (fecha, id_medico, antes, despues, *_), = base.almacen.cambiar_estado(cursor, id_cita, "Cancelada")
+    base.almacen.ajustar_resumen(cursor, fecha, id_medico, antes or ESTADO_INICIAL, -1)
+    base.almacen.ajustar_resumen(cursor, fecha, id_medico, despues, 1)
+    base.conn.commit()
+    totales = tuple(base.almacen.totales(cursor))
+    assert totales[2] == 4 and all(t >= 0 for t in totales)
+    assert all(t >= 0 for *_, t in base.almacen.resumen(cursor, "2026-02-01", "2026-02-28"))
+
+
+def test_las_series_por_medico_salen_del_resumen_migrado(base_sin_migrar):
+    base = base_sin_migrar
+    _sembrar_historial(base)
+    schema.asegurar_esquema(base.conn)
+
+    cursor = base.conn.cursor()
+    por_medico = sorted((m, e, t) for m, _, e, t in base.almacen.citas_por_medico(cursor))
+    assert por_medico == [(1, "Atendida", 1), (1, "Cancelada", 1), (1, ESTADO_INICIAL, 2)]
+    por_dia = sorted((e, t) for _, e, t in base.almacen.citas_por_dia(cursor, "2026-01-01"))
+    assert por_dia == [("Atendida", 1), ("Cancelada", 1), (ESTADO_INICIAL, 2)]
+
+
+def test_correos_duplicados_detienen_la_migracion_y_el_login(base_sin_migrar):
+    base = base_sin_migrar
+    cursor = base.conn.cursor()
+    for n in (1, 2):
+        cursor.execute(
+            "INSERT INTO Usuarios (nombre, correo, rol, contrasena) VALUES (?, ?, 'paciente', 'hash')",
+            (f"Usuario {n}", "repetido@prueba.test"),
+        )
+    base.conn.commit()
+
+    with pytest.raises(Exception):
+        schema.asegurar_esquema(base.conn)
+    base.conn.rollback()
+    assert schema.version_actual(base.conn) < 7
+    # sin el índice único, un correo ambiguo no inicia sesión en ninguna de las cuentas
+    assert base.almacen.credenciales(base.conn.cursor(), "repetido@prueba.test") is None
+    base.conn.commit()
+
+
+def test_el_correo_es_unico_tras_migrar(base):
+    cursor = base.conn.cursor()
+    with pytest.raises(Exception) as error:
+        base.almacen.crear_usuario(cursor, "Otro", "P9", "paciente1@prueba.test",
+                                   "hash", "M", "paciente", "hash")
+    base.conn.rollback()
+    assert base.almacen.es_duplicado(error.value)
+    assert base.almacen.credenciales(cursor, "paciente1@prueba.test")[0] == 1
+    base.conn.commit()
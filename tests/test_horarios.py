@@ -0,0 +1,35 @@
+import asyncio
+from datetime import time
+
+import httpx
+
+from main import app
+from services import horarios
+
+FRANJA = [(1, "Médico 1", time(8, 0), time(11, 0))]
+
+
+def _horas(ocupadas, minutos):
+    return [s["hora"][:5] for s in horarios.generar_slots(FRANJA, ocupadas, "2099-01-05", minutos)]
+
+
+def test_un_turno_corto_no_se_ofrece_dentro_de_una_cita_en_curso():
+    ocupadas = horarios.bits_ocupados([(1, "09:00")])   # cita de SLOT_MINUTOS (60) a las 09:00
+    assert _horas(ocupadas, 30) == ["08:00", "08:30", "10:00", "10:30"]
+    assert _horas(ocupadas, 60) == ["08:00", "10:00"]
+
+
+def test_un_turno_largo_no_se_ofrece_si_una_cita_empieza_dentro():
+    ocupadas = horarios.bits_ocupados([(1, "09:30")])
+    assert _horas(ocupadas, 90) == ["08:00"]     # 08:00-09:30 termina justo cuando empieza
+    assert _horas(ocupadas, 120) == []
+    assert _horas(ocupadas, 30) == ["08:00", "08:30", "09:00", "10:30"]
+
+
+def test_fecha_invalida_en_disponibles_es_422():
+    async def pedir():
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as cliente:
+            return await cliente.get("/citas/disponibles/1", params={"fecha": "bad"})
+
+    assert asyncio.run(pedir()).status_code == 422
@@ -0,0 +1,211 @@
+"""Planes de ejecución de las consultas que corren los routers.
+
+Siembra una base SQLite pequeña con benchmarks/standin.py y las migraciones de
+schema.py, recorre los endpoints y las tareas de fondo con la app en proceso y
+captura cada sentencia tal como llega a la base (traza de sqlite3, con los
+parámetros ya enlazados). Después pide EXPLAIN QUERY PLAN de cada una: ningún
+escenario puede recorrer completas Citas, Usuarios, Medicos ni
+DisponibilidadMedica salvo las que el endpoint lee completas a propósito (los
+listados completos o los agregados de /admin/estadisticas).
+
+Los planes son los de SQLite; en SQL Server los mismos índices salen de las
+mismas migraciones y esa variante se omite como en el resto de las pruebas.
+"""
+import asyncio
+import re
+import sqlite3
+from datetime import date, timedelta
+
+import httpx
+import pytest
+
+import database
+import schema
+from almacen import almacen, crear
+from benchmarks import standin
+from routers import admin
+from services import correo, outbox, perfilador
+from services.auth import crear_token
+from services.catalogo import catalogo
+from services.indice_disponibilidad import indice
+
+HOY = date(2026, 1, 1)   # mismo "hoy" que la siembra
+VIGILADAS = {"citas", "usuarios", "medicos", "disponibilidadmedica"}
+_DML = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.I)
+_TABLAS = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|SET\b|JOIN\b|LEFT\b|GROUP\b|ORDER\b|CROSS\b|VALUES\b|SELECT\b)(\w+))?", re.I)
+_RECORRIDO = re.compile(r"^SCAN (\w+)(?: USING)?")
+
+
+def escenarios(hoy):
+    """(nombre, método, url, cuerpo, tablas que el endpoint recorre completas a propósito)."""
+    futuro = (hoy + timedelta(days=400)).isoformat()
+    desde, hasta = hoy.isoformat(), (hoy + timedelta(days=6)).isoformat()
+    cita = {"id_usuario": 1, "id_medico": 1, "id_especialidad": 1, "fecha": futuro, "hora": "08:00"}
+    todo = set(VIGILADAS)
+    return [
+        ("login", "POST", "/usuarios/login", {"correo": "paciente1@bench.test", "contrasena": standin.CONTRASENA}, set()),
+        ("registro", "POST", "/usuarios/registro", {
+            "nombre": "Nuevo", "cedula": "1", "correo": "nuevo@bench.test",
+            "contrasena": "clave-nueva-1", "contrasena2": "clave-nueva-1", "genero": "H",
+        }, set()),
+        ("perfil usuario", "GET", "/usuarios/1", None, set()),
+        ("especialidades", "GET", "/citas/especialidades", None, {"medicos"}),   # carga el catálogo completo
+        ("disponibles", "GET", f"/citas/disponibles/1?fecha={futuro}", None, set()),
+        ("crear cita", "POST", "/citas/citas", cita, set()),
+        ("lote de citas", "POST", "/citas/lote", [
+            {**cita, "hora": "08:15"}, {**cita, "id_especialidad": 2, "hora": "08:30"}, cita,
+        ], set()),
+        ("citas del paciente", "GET", "/citas?id_usuario=1&limit=20", None, set()),
+        ("citas por rango", "GET", f"/citas?desde={desde}&hasta={hasta}&limit=20", None, set()),
+        ("reprogramar", "PUT", "/citas/citas/1/reprogramar", {"fecha": futuro, "hora": "09:00"}, set()),
+        ("eliminar cita", "DELETE", "/citas/citas/2", None, set()),
+        ("perfil médico", "GET", "/medicos/1", None, {"medicos"}),
+        ("médicos por especialidad", "GET", "/medicos/especialidad/1", None, {"medicos"}),
+        ("disponibilidad", "GET", "/medicos/1/disponibilidad", None, set()),
+        ("excepciones", "GET", f"/medicos/1/disponibilidad/excepciones?desde={desde}", None, set()),
+        ("plantilla semanal", "PUT", "/medicos/1/disponibilidad/semana", {
+            "franjas": [{"dia_semana": 1, "hora_inicio": "08:00", "hora_fin": "12:00"}],
+        }, set()),
+        ("agenda del médico", "GET", f"/medicos/1/citas?desde={desde}&hasta={hasta}", None, set()),
+        ("calendario", "GET", f"/medicos/calendario?id_especialidad=1&desde={desde}&hasta={hasta}", None, set()),
+        ("estado de cita", "PUT", "/medicos/citas/3/estado", {"estado": "Cancelada"}, set()),
+        ("nota médica", "PUT", "/medicos/citas/4/nota", {"nota_medica": "Control"}, set()),
+        ("admin citas", "GET", "/admin/citas?limit=50", None, set()),
+        ("admin citas por médico", "GET", "/admin/citas?id_medico=1&limit=50", None, set()),
+        ("admin citas por rango", "GET", f"/admin/citas?desde={desde}&hasta={hasta}&limit=50", None, set()),
+        ("admin usuarios", "GET", "/admin/usuarios", None, {"usuarios"}),
+        ("admin médicos", "GET", "/admin/medicos", None, {"medicos"}),
+        ("admin editar médico", "PUT", "/admin/medicos/1", {"telefono": "3000000000"}, set()),
+        ("admin editar usuario", "PUT", "/admin/usuarios/1", {"nombre": "Paciente Uno"}, set()),
+        # del resumen diario y UsuariosPorRol: solo el directorio de médicos se lee completo
+        ("estadísticas", "GET", "/admin/estadisticas?detalle=true", None, {"medicos"}),
+        # utilización de toda la clínica: lee todas las franjas
+        ("series", "GET", f"/admin/estadisticas/series?desde={desde}&hasta={hasta}", None, {"disponibilidadmedica"}),
+        ("series por médico", "GET", f"/admin/estadisticas/series?desde={desde}&hasta={hasta}&id_medico=1", None, set()),
+        ("reconstruir resumen", "POST", "/admin/estadisticas/series/reconstruir", None, todo),
+        ("exportar citas", "GET", f"/admin/citas/export?desde={desde}&hasta={hasta}", None, set()),
+        ("recordatorios", "POST", f"/notificaciones/recordatorios?fecha={futuro}", None, set()),
+        ("dudas", "GET", "/dudas/", None, set()),
+    ]
+
+
+ESCENARIOS = escenarios(HOY)
+
+
+def _alias(sql):
+    """{alias o tabla en minúsculas: tabla en minúsculas} según FROM / JOIN / UPDATE / INTO."""
+    alias = {}
+    for tabla, nombre in _TABLAS.findall(sql):
+        alias[tabla.lower()] = tabla.lower()
+        if nombre:
+            alias[nombre.lower()] = tabla.lower()
+    return alias
+
+
+def recorridos(conn, sql):
+    """[(tabla, detalle del plan)] de los SCAN completos del plan de `sql`."""
+    alias = _alias(sql)
+    encontrados = []
+    for *_, detalle in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall():
+        m = _RECORRIDO.match(detalle)
+        # SCAN ... USING INDEX recorre un índice en orden (TOP / keyset) y se acepta
+        if m and not m.group(0).endswith("USING"):
+            encontrados.append((alias.get(m.group(1).lower(), m.group(1).lower()), detalle))
+    return encontrados
+
+
+async def _entregar(mensaje):
+    return True
+
+
+async def _recorrer(capturadas):
+    from main import app
+
+    capturas, estados = {}, {}
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://planes") as cliente:
+        for nombre, metodo, url, cuerpo, _ in ESCENARIOS:
+            # sesión de admin (pasa también las rutas de médico); el login de un escenario la pisa
+            cliente.cookies.clear()
+            cliente.cookies.set("access_token", crear_token(0, "Admin", "admin@bench.test", "admin"))
+            capturadas.clear()
+            respuesta = await cliente.request(metodo, url, json=cuerpo)
+            estados[nombre] = respuesta.status_code
+            capturas[nombre] = list(capturadas)
+
+    # tareas de fondo que no pasan por un endpoint
+    capturadas.clear()
+    await database.run_db(outbox.reclamar, 50)
+    capturas["outbox"] = list(capturadas)
+    return capturas, estados
+
+
+@pytest.fixture(scope="module", params=["sqlite", "sqlserver"])
+def planes(request, tmp_path_factory):
+    """(ruta de la base, {escenario: sentencias}, {escenario: status}) tras recorrer la app."""
+    if request.param == "sqlserver":
+        pytest.skip("los planes se revisan con EXPLAIN QUERY PLAN de SQLite")
+
+    ruta = str(tmp_path_factory.mktemp("planes") / "planes.db")
+    standin.sembrar(ruta, pacientes=2_000, medicos=40, citas=40_000, hoy=HOY)
+    capturadas = []
+
+    def capturar(sql):
+        if _DML.match(sql) and "EsquemaVersion" not in sql:
+            capturadas.append(sql)
+
+    def conectar():
+        conn = standin.conectar(ruta)
+        conn.set_trace_callback(capturar)
+        return conn
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(database, "pool", database.ConnectionPool(conectar, max_size=4))
+        mp.setattr(almacen, "_impl", crear("sqlite"))
+        mp.setattr(correo.despachador, "entregar", _entregar)   # aquí solo interesan las consultas
+        indice.limpiar()
+        catalogo.invalidar()
+        admin.cache_estadisticas.clear()
+        try:
+            conn = database.pool.acquire()
+            try:
+                schema.asegurar_esquema(conn)
+                assert schema.version_actual(conn) == schema.VERSION_ACTUAL
+            finally:
+                conn.close()
+            capturas, estados = asyncio.run(_recorrer(capturadas))
+        finally:
+            database.pool.dispose()
+            indice.limpiar()
+            catalogo.invalidar()
+            admin.cache_estadisticas.clear()
+    return ruta, capturas, estados
+
+
+@pytest.mark.parametrize("escenario, permitidas", [
+    pytest.param(nombre, permitidas, id=nombre)
+    for nombre, _, _, _, permitidas in ESCENARIOS + [("outbox", None, None, None, set())]
+])
+def test_las_consultas_usan_indices(planes, escenario, permitidas):
+    ruta, capturas, estados = planes
+    assert estados.get(escenario, 200) not in (401, 403) and estados.get(escenario, 200) < 500
+    sentencias = capturas[escenario]   # vacía si lo respondió una caché
+
+    conn = sqlite3.connect(ruta)
+    hallazgos, revisadas = [], 0
+    try:
+        # una vez por forma de sentencia (los parámetros enlazados no cambian el plan aquí)
+        for sql in {perfilador.normalizar(sql): sql for sql in sentencias}.values():
+            try:
+                encontrados = recorridos(conn, sql)
+            except sqlite3.Error:
+                continue   # tablas temporales que ya no existen
+            revisadas += 1
+            hallazgos += [f"{detalle}: {perfilador.normalizar(sql)[:200]}"
+                          for tabla, detalle in encontrados
+                          if tabla in VIGILADAS and tabla not in permitidas]
+    finally:
+        conn.close()
+
+    assert revisadas or not sentencias
+    assert hallazgos == []
@@ -0,0 +1,19 @@
+from services.plantillas import Plantillas
+
+DATOS = {
+    "nombre_usuario": "O'Neil & Ana", "medico": "Luis <Pérez>",
+    "fecha": "2026-01-05", "hora": "08:00", "nueva_fecha": None, "nueva_hora": None,
+}
+
+
+def test_el_asunto_no_se_escapa():
+    asunto, texto, html = Plantillas().render("cambio_cancelada", motivo="O'Neil & cía", **DATOS)
+    assert asunto == "🔄 Cita O'Neil & cía - MediciCol"
+    assert "&#39;" not in asunto and "&amp;" not in asunto
+
+
+def test_el_html_se_escapa_y_el_texto_no():
+    _, texto, html = Plantillas().render("cita_cancelada", **DATOS)
+    assert "O'Neil & Ana" in texto
+    assert "O&#39;Neil &amp; Ana" in html
+    assert "Luis &lt;Pérez&gt;" in html
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import database
+from database import ConnectionPool, PoolTimeout
+
+
+class ConexionFalsa:
+    """Driver falso: cuenta rollbacks y puede fallar el ping o el rollback."""
+
+    def __init__(self, n):
+        self.n = n
+        self.viva = True
+        self.rollbacks = 0
+        self.falla_rollback = False
+        self.cerrada = False
+
+    def cursor(self):
+        conexion = self
+
+        class Cursor:
+            def execute(self, *_):
+                if not conexion.viva:
+                    raise RuntimeError("conexión caída")
+
+            def fetchall(self):
+                return [(1,)]
+
+            def fetchmany(self, n):
+                # tres lotes de `n` filas y luego vacío
+                conexion.leidos = getattr(conexion, "leidos", 0) + 1
+                return [(i,) for i in range(n)] if conexion.leidos <= 3 else []
+
+            def close(self):
+                pass
+
+        return Cursor()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.falla_rollback:
+            raise RuntimeError("rollback falló")
+
+    def close(self):
+        self.cerrada = True
+
+
+@pytest.fixture
+def creadas():
+    return []
+
+
+@pytest.fixture
+def crear(creadas):
+    def creator():
+        conexion = ConexionFalsa(len(creadas))
+        creadas.append(conexion)
+        return conexion
+    return creator
+
+
+def test_reutiliza_la_conexion_devuelta(crear, creadas):
+    pool = ConnectionPool(crear, max_size=2)
+    pool.acquire().close()
+    pool.acquire().close()
+    assert len(creadas) == 1
+    assert pool.metrics()["prestamos"] == 2
+
+
+def test_no_pasa_del_maximo_y_agota_el_tiempo(crear, creadas):
+    pool = ConnectionPool(crear, max_size=2, timeout=0.05)
+    a, b = pool.acquire(), pool.acquire()
+    inicio = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.monotonic() - inicio >= 0.05
+    assert len(creadas) == 2
+    assert pool.metrics()["timeouts"] == 1
+    a.close()
+    b.close()
+
+
+def test_espera_hasta_que_se_libera_una(crear, creadas):
+    pool = ConnectionPool(crear, max_size=1, timeout=2)
+    prestada = pool.acquire()
+    threading.Timer(0.05, prestada.close).start()
+    segunda = pool.acquire()
+    assert segunda._raw is creadas[0]
+    assert len(creadas) == 1
+    segunda.close()
+
+
+def test_recicla_las_conexiones_viejas(crear, creadas):
+    pool = ConnectionPool(crear, max_size=1, recycle=0.01)
+    pool.acquire().close()
+    time.sleep(0.02)
+    pool.acquire().close()
+    assert len(creadas) == 2
+    assert creadas[0].cerrada
+    assert pool.metrics()["recicladas"] == 1
+
+
+def test_descarta_la_conexion_si_falla_el_ping(crear, creadas):
+    pool = ConnectionPool(crear, max_size=1, ping_interval=0.01)
+    pool.acquire().close()
+    creadas[0].viva = False
+    time.sleep(0.02)
+    conexion = pool.acquire()
+    assert conexion._raw is creadas[1]
+    assert creadas[0].cerrada
+    assert pool.metrics()["descartadas"] == 1
+    conexion.close()
+
+
+def test_hace_rollback_al_devolver(crear, creadas):
+    pool = ConnectionPool(crear, max_size=1)
+    pool.acquire().close()
+    assert creadas[0].rollbacks == 1
+    assert pool.metrics()["libres"] == 1
+
+
+def test_descarta_la_conexion_si_falla_el_rollback(crear, creadas):
+    pool = ConnectionPool(crear, max_size=1)
+    conexion = pool.acquire()
+    creadas[0].falla_rollback = True
+    conexion.close()
+    metricas = pool.metrics()
+    assert metricas["abiertas"] == 0 and metricas["descartadas"] == 1
+    assert creadas[0].cerrada
+
+
+def test_error_del_driver_libera_el_cupo():
+    def falla():
+        raise RuntimeError("sin servidor")
+
+    pool = ConnectionPool(falla, max_size=1)
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    assert pool.metrics()["abiertas"] == 0
+
+
+def test_configure_pool_cambia_el_driver(crear, creadas):
+    anterior = database.pool
+    try:
+        database.configure_pool(crear, max_size=3)
+        conexion = database.get_connection()
+        assert conexion._raw is creadas[0]
+        assert database.pool.max_size == 3
+        conexion.close()
+    finally:
+        database.pool = anterior
+
+
+# ---------------------------------------------------
+# stream_db: el generador es dueño de la conexión
+# ---------------------------------------------------
+@pytest.fixture
+def pool_falso(crear, monkeypatch):
+    pool = ConnectionPool(crear, max_size=2)
+    monkeypatch.setattr(database, "pool", pool)
+    return pool
+
+
+def test_stream_sin_iterar_no_toma_conexion(pool_falso):
+    async def correr():
+        lotes = database.stream_db("SELECT 1")
+        del lotes   # el cliente se fue antes de empezar a responder
+        return pool_falso.metrics()
+
+    assert asyncio.run(correr())["prestamos"] == 0
+
+
+def test_stream_devuelve_la_conexion_al_terminar(pool_falso):
+    async def correr():
+        return [filas async for filas in database.stream_db("SELECT 1", batch_size=2)]
+
+    assert len(asyncio.run(correr())) == 3
+    assert pool_falso.metrics()["en_uso"] == 0
+
+
+def test_stream_devuelve_la_conexion_al_cerrarlo_a_medias(pool_falso):
+    async def correr():
+        lotes = database.stream_db("SELECT 1")
+        await anext(lotes)
+        en_uso = pool_falso.metrics()["en_uso"]
+        await lotes.aclose()
+        return en_uso
+
+    assert asyncio.run(correr()) == 1
+    assert pool_falso.metrics()["en_uso"] == 0
+
+
+def test_stream_devuelve_la_conexion_si_cancelan_al_consumidor(pool_falso):
+    async def correr():
+        prestada = asyncio.Event()
+
+        async def consumir():
+            async for _ in database.stream_db("SELECT 1"):
+                prestada.set()
+                await asyncio.sleep(10)
+
+        tarea = asyncio.create_task(consumir())
+        await prestada.wait()
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
+        await asyncio.sleep(0.05)   # la devolución corre en el ejecutor, protegida
+
+    asyncio.run(correr())
+    assert pool_falso.metrics()["en_uso"] == 0
@@ -0,0 +1,133 @@
+import statistics
+import threading
+import time
+from collections import Counter
+
+import pytest
+from fastapi import HTTPException
+
+from routers import citas as rutas
+from services import reservas
+from services.indice_disponibilidad import indice
+
+FECHA = "2099-01-05"
+
+
+def _reservar(conn, hora):
+    cursor = conn.cursor()
+    try:
+        id_cita = reservas.reservar(cursor, None, 1, 1, FECHA, hora)
+        conn.commit()
+        return id_cita
+    except HTTPException as e:
+        conn.rollback()
+        assert e.status_code == 400
+        return None
+
+
+# Pruebas de estrés de la reserva con muchos hilos sobre pocos turnos. Cada
+# ronda suelta a todos los hilos a la vez (barrera) contra el mismo turno, así
+# que siempre hay `hilos` reservas compitiendo por una fila.
+#
+# La variante [sqlserver] es la que prueba el bloqueo: ahí las conexiones
+# corren de verdad en paralelo y solo el WITH (UPDLOCK, HOLDLOCK) de
+# almacen/sqlserver.py (más UX_Citas_medico_fecha_hora) evita la doble reserva.
+# En [sqlite] los escritores se serializan con BEGIN IMMEDIATE, de modo que
+# esa variante comprueba el camino de rechazo y mide, pero no el bloqueo.
+
+
+def _turnos(n):
+    return [f"{8 + t // 4:02d}:{15 * (t % 4):02d}" for t in range(n)]
+
+
+def _estres(base, hilos, rondas):
+    """Corre `rondas` turnos con `hilos` intentos simultáneos en cada uno.
+
+    Devuelve (ganadores por turno, latencias en segundos, segundos totales).
+    """
+    horas = _turnos(rondas)
+    barrera = threading.Barrier(hilos)
+    ganadores, latencias, errores = Counter(), [], []
+    candado = threading.Lock()
+
+    def competir():
+        conn = base.abrir()
+        propias = []
+        try:
+            for hora in horas:
+                barrera.wait()
+                inicio = time.perf_counter()
+                gano = _reservar(conn, hora) is not None
+                propias.append(time.perf_counter() - inicio)
+                if gano:
+                    with candado:
+                        ganadores[hora] += 1
+        except Exception as e:   # un error inesperado en un hilo debe fallar la prueba
+            errores.append(e)
+            barrera.abort()
+        finally:
+            conn.close()
+            with candado:
+                latencias.extend(propias)
+
+    trabajadores = [threading.Thread(target=competir) for _ in range(hilos)]
+    inicio = time.perf_counter()
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    segundos = time.perf_counter() - inicio
+
+    assert errores == []
+    return ganadores, latencias, segundos
+
+
+def test_reservas_concurrentes_dejan_un_ganador_por_turno(base_app):
+    hilos, rondas = 16, 24
+    ganadores, latencias, _ = _estres(base_app, hilos, rondas)
+
+    assert len(latencias) == hilos * rondas
+    assert ganadores == Counter({hora: 1 for hora in _turnos(rondas)})
+    ocupadas = base_app.almacen.horas_ocupadas(base_app.conn.cursor(), 1, FECHA)
+    base_app.conn.commit()
+    assert sorted(str(h)[:5] for h in ocupadas) == _turnos(rondas)
+
+
+def test_rendimiento_de_reservas_sobre_turnos_calientes(base_app, record_property):
+    """Reservas/s e intentos/s con p95 de latencia; se reportan como propiedades de la prueba."""
+    hilos, rondas = 32, 40
+    ganadores, latencias, segundos = _estres(base_app, hilos, rondas)
+
+    intentos = len(latencias)
+    p95 = statistics.quantiles(latencias, n=20)[-1]
+    record_property("reservas_por_segundo", round(sum(ganadores.values()) / segundos, 1))
+    record_property("intentos_por_segundo", round(intentos / segundos, 1))
+    record_property("p95_ms", round(p95 * 1000, 2))
+    print(f"\n[{base_app.backend}] {intentos} intentos en {segundos:.2f} s: "
+          f"{intentos / segundos:,.1f} intentos/s, {sum(ganadores.values()) / segundos:,.1f} reservas/s, "
+          f"p95 {p95 * 1000:.1f} ms")
+
+    assert intentos == hilos * rondas
+    assert sum(ganadores.values()) == rondas
+    assert max(ganadores.values()) == 1
+
+
+def test_reprogramar_a_un_turno_tomado_por_otra_reserva(base_app):
+    conn = base_app.conn
+    cursor = conn.cursor()
+    id_cita = reservas.reservar(cursor, 1, 1, 1, FECHA, "08:00")
+    conn.commit()
+
+    # el índice carga el día con 09:00 libre y otra conexión lo toma sin pasar por él
+    assert not indice.esta_ocupado(cursor, 1, FECHA, "09:00")
+    conn.commit()
+    otra = base_app.abrir()
+    assert base_app.almacen.reservar(otra.cursor(), 2, 1, 1, FECHA, "09:00", None, True) is not None
+    otra.commit()
+    otra.close()
+
+    with pytest.raises(HTTPException) as error:
+        rutas._reprogramar_cita(conn, id_cita, rutas.ReprogramarCita(hora="09:00"))
+    assert (error.value.status_code, error.value.detail) == (400, reservas.OCUPADO)
+    assert str(base_app.almacen.cita(cursor, id_cita)[3])[:5] == "08:00"
+    conn.commit()